@@ -0,0 +1,21 @@
+"""The Message and RemoteTransmissionRequest classes of the CAN interface
+in use.
+
+For the modules next to the hardware (io_breakout.py, can_udp_bridge.py)
+that build frames outside of a CANHandler: canio's on boards with a CAN
+peripheral, adafruit_mcp2515's on boards with an MCP2515, and
+backends.virtual_can's everywhere else (CPython, backends.socketcan). The
+protocol core never imports it, it builds frames with the carrier board's
+Message class (CANHandler.Message).
+"""
+
+try:
+    from canio import Message, RemoteTransmissionRequest
+except ImportError:
+    try:
+        from adafruit_mcp2515.canio import Message, RemoteTransmissionRequest
+    except ImportError:
+        from backends.virtual_can import Message, RemoteTransmissionRequest
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
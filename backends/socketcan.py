@@ -0,0 +1,353 @@
+"""A Linux SocketCAN backend that mimics the canio API.
+
+CAN and Listener behave like their canio counterparts on a SocketCAN
+interface (can0, vcan0, ...), so CANHandler and the devices built on it run
+on a Linux coprocessor. Each Listener has its own raw socket with a kernel
+CAN_RAW_FILTER built from its Match list, so frames nobody listens for
+never reach Python. Frames are read in batches: when the queue is empty a
+receive() waits for the socket once, then takes everything already queued
+in the kernel (up to batch frames) without further system call waits.
+Python has no recvmmsg(), so the batch is non-blocking recvmsg() calls.
+
+Received messages carry timestamp_ns, the hardware RX timestamp when the
+interface provides one, otherwise the kernel software timestamp taken
+when the frame arrived (CLOCK_REALTIME). SO_TIMESTAMPING is accepted on
+interfaces without hardware stamping too, so a Listener reports
+"software" timestamps until a frame arrives with a hardware one.
+
+Messages are the backends.virtual_can Message/RemoteTransmissionRequest
+classes, the ones CANHandler uses when canio is not available.
+
+SocketPairHub is an in-process stand-in for a SocketCAN interface (AF_UNIX
+datagram sockets) for testing without vcan; it has no kernel filters or
+timestamps, so those fall back to user space.
+"""
+
+import itertools
+import select
+import socket
+import struct
+import time
+from collections import deque
+
+from backends.virtual_can import Match, Message, RemoteTransmissionRequest
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+# linux/can.h
+CAN_EFF_FLAG = 0x80000000
+CAN_RTR_FLAG = 0x40000000
+CAN_ERR_FLAG = 0x20000000
+CAN_EFF_MASK = 0x1fffffff
+CAN_SFF_MASK = 0x000007ff
+CAN_FRAME_FORMAT = "=IB3x8s"
+CAN_FRAME_SIZE = 16
+CAN_FILTER_FORMAT = "=II"
+
+# linux/can/raw.h, socket.py only has them on Linux builds
+SOL_CAN_RAW = getattr(socket, "SOL_CAN_RAW", 101)
+CAN_RAW_FILTER = getattr(socket, "CAN_RAW_FILTER", 1)
+CAN_RAW_LOOPBACK = getattr(socket, "CAN_RAW_LOOPBACK", 3)
+
+# asm-generic/socket.h and linux/net_tstamp.h
+SO_TIMESTAMPNS = 35
+SO_TIMESTAMPING = 37
+SOF_TIMESTAMPING_RX_HARDWARE = 1 << 2
+SOF_TIMESTAMPING_RX_SOFTWARE = 1 << 3
+SOF_TIMESTAMPING_SOFTWARE = 1 << 4
+SOF_TIMESTAMPING_RAW_HARDWARE = 1 << 6
+TIMESPEC_FORMAT = "=qq"
+TIMESPEC_SIZE = 16
+# Room for the three timespecs of SCM_TIMESTAMPING
+ANCILLARY_SIZE = socket.CMSG_SPACE(3 * TIMESPEC_SIZE)
+
+TIMESTAMP_HARDWARE = "hardware"
+TIMESTAMP_SOFTWARE = "software"
+TIMESTAMP_HOST = "host"
+
+
+def open_can_socket(channel: str):
+    """A raw CAN socket bound to the channel interface."""
+    _socket = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+    _socket.bind((channel,))
+    return _socket
+
+
+def pack_frame(message) -> bytes:
+    _id = message.id & (CAN_EFF_MASK if message.extended else CAN_SFF_MASK)
+    if message.extended:
+        _id |= CAN_EFF_FLAG
+    if isinstance(message, RemoteTransmissionRequest):
+        return struct.pack(CAN_FRAME_FORMAT, _id | CAN_RTR_FLAG,
+                           message.length, b"")
+    _data = bytes(message.data)
+    return struct.pack(CAN_FRAME_FORMAT, _id, len(_data), _data)
+
+
+def unpack_frame(frame: bytes):
+    """Message or RemoteTransmissionRequest for a can_frame, None for an
+    error frame."""
+    _id, _dlc, _data = struct.unpack(CAN_FRAME_FORMAT, frame)
+    if _id & CAN_ERR_FLAG:
+        return None
+    _extended = bool(_id & CAN_EFF_FLAG)
+    _rtr = bool(_id & CAN_RTR_FLAG)
+    _id &= CAN_EFF_MASK if _extended else CAN_SFF_MASK
+    if _rtr:
+        return RemoteTransmissionRequest(_id, _dlc, extended=_extended)
+    return Message(_id, _data[:_dlc], extended=_extended)
+
+
+def kernel_filters(matches) -> bytes:
+    """CAN_RAW_FILTER option value for a canio Match list. The EFF flag is
+    part of every mask, so extended and standard IDs never match each
+    other; RTRs match like data frames, as in canio."""
+    if not matches:
+        return struct.pack(CAN_FILTER_FORMAT, 0, 0)
+    _filters = b""
+    for _match in matches:
+        _full = CAN_EFF_MASK if _match.extended else CAN_SFF_MASK
+        _mask = _full if _match.mask is None else _match.mask & _full
+        _id = _match.id & _mask
+        if _match.extended:
+            _id |= CAN_EFF_FLAG
+        _filters += struct.pack(CAN_FILTER_FORMAT, _id,
+                                _mask | CAN_EFF_FLAG)
+    return _filters
+
+
+class Listener:
+    def __init__(self, can, matches, timeout: float) -> None:
+        """Receives the frames accepted by matches, see canio.Listener."""
+        self._can = can
+        self._matches = matches
+        self.timeout = timeout
+        self._queue = deque()
+        self._socket = can._socket_factory(can.channel)
+        self._socket.setblocking(False)
+
+        try:
+            self._socket.setsockopt(SOL_CAN_RAW, CAN_RAW_FILTER,
+                                    kernel_filters(matches))
+            self.kernel_filter = True
+        except OSError:
+            self.kernel_filter = False
+
+        try:
+            self._socket.setsockopt(
+                socket.SOL_SOCKET, SO_TIMESTAMPING,
+                SOF_TIMESTAMPING_RX_HARDWARE |
+                SOF_TIMESTAMPING_RAW_HARDWARE |
+                SOF_TIMESTAMPING_RX_SOFTWARE | SOF_TIMESTAMPING_SOFTWARE)
+            # Hardware only once a frame carries a hardware stamp
+            self.timestamps = TIMESTAMP_SOFTWARE
+        except OSError:
+            try:
+                self._socket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS,
+                                        1)
+                self.timestamps = TIMESTAMP_SOFTWARE
+            except OSError:
+                self.timestamps = TIMESTAMP_HOST
+
+        self.frames = 0
+        self.batches = 0
+        self.max_batch = 0
+
+    def _accept(self, message) -> bool:
+        if self.kernel_filter or not self._matches:
+            return True
+        for _match in self._matches:
+            if _match.matches(message):
+                return True
+        return False
+
+    def _timestamp(self, ancillary) -> int:
+        for _level, _type, _data in ancillary:
+            if _level != socket.SOL_SOCKET:
+                continue
+            if _type == SO_TIMESTAMPING and \
+                    len(_data) >= 3 * TIMESPEC_SIZE:
+                # software, (deprecated), raw hardware
+                _sw = struct.unpack_from(TIMESPEC_FORMAT, _data, 0)
+                _hw = struct.unpack_from(TIMESPEC_FORMAT, _data,
+                                         2 * TIMESPEC_SIZE)
+                if _hw == (0, 0):
+                    return _sw[0] * 1000000000 + _sw[1]
+                self.timestamps = TIMESTAMP_HARDWARE
+                return _hw[0] * 1000000000 + _hw[1]
+            if _type == SO_TIMESTAMPNS and len(_data) >= TIMESPEC_SIZE:
+                _ts = struct.unpack_from(TIMESPEC_FORMAT, _data, 0)
+                return _ts[0] * 1000000000 + _ts[1]
+        return time.time_ns()
+
+    def _fill(self, timeout: float) -> None:
+        """Waits up to timeout for the socket, then queues every frame the
+        kernel already holds, up to the CAN batch size."""
+        if timeout and not select.select([self._socket], [], [],
+                                         timeout)[0]:
+            return
+        _batch = 0
+        for _ in range(self._can.batch):
+            try:
+                _frame, _ancillary, _, _ = self._socket.recvmsg(
+                    CAN_FRAME_SIZE, ANCILLARY_SIZE)
+            except (BlockingIOError, InterruptedError):
+                break
+            if len(_frame) < CAN_FRAME_SIZE:
+                continue
+            _message = unpack_frame(_frame)
+            if _message is None or not self._accept(_message):
+                continue
+            _message.timestamp_ns = self._timestamp(_ancillary)
+            self._queue.append(_message)
+            _batch += 1
+        if _batch:
+            self.frames += _batch
+            self.batches += 1
+            if _batch > self.max_batch:
+                self.max_batch = _batch
+
+    def receive(self):
+        """The next frame, waiting up to timeout for one. None if none
+        arrived."""
+        if not self._queue:
+            self._fill(self.timeout)
+        if self._queue:
+            return self._queue.popleft()
+        return None
+
+    def in_waiting(self) -> int:
+        if not self._queue:
+            self._fill(0)
+        return len(self._queue)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        _message = self.receive()
+        if _message is None:
+            raise StopIteration
+        return _message
+
+    def deinit(self) -> None:
+        if self in self._can._listeners:
+            self._can._listeners.remove(self)
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.deinit()
+
+
+class CAN:
+    def __init__(self, channel: str = "can0", *, baudrate: int = 1000000,
+                 loopback: bool = False, silent: bool = False,
+                 auto_restart: bool = False, batch: int = 64,
+                 socket_factory=None) -> None:
+        """A SocketCAN interface, see canio.CAN.
+
+        The bit rate, listen-only (silent) and restart settings belong to
+        the interface (ip link set can0 type can bitrate 1000000 ...); they
+        are kept for API compatibility only. loopback maps to
+        CAN_RAW_LOOPBACK: with it off, this host's other sockets
+        (including this CAN's listeners) don't see the frames sent.
+
+        Args:
+            channel (str): interface name.
+            batch (int): most frames moved from the kernel per wait.
+            socket_factory (function): opens a socket for the channel,
+                defaults to a raw CAN socket.
+        """
+        self.channel = channel
+        self.baudrate = baudrate
+        self.loopback = loopback
+        self.silent = silent
+        self.auto_restart = auto_restart
+        self.batch = batch
+        self._socket_factory = socket_factory if socket_factory \
+            else open_can_socket
+        self._socket = self._socket_factory(channel)
+        try:
+            self._socket.setsockopt(SOL_CAN_RAW, CAN_RAW_LOOPBACK,
+                                    1 if loopback else 0)
+        except OSError:
+            pass
+        self._listeners = []
+        self.sent = 0
+
+    def send(self, message) -> None:
+        self._socket.send(pack_frame(message))
+        self.sent += 1
+
+    def listen(self, matches=None, *, timeout: float = 10) -> Listener:
+        _listener = Listener(self, matches, timeout)
+        self._listeners.append(_listener)
+        return _listener
+
+    def deinit(self) -> None:
+        for _listener in list(self._listeners):
+            _listener.deinit()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.deinit()
+
+
+class _HubSocket:
+    def __init__(self, hub, address: bytes) -> None:
+        self._hub = hub
+        self.address = address
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(address)
+
+    def send(self, data: bytes) -> int:
+        for _address in self._hub.addresses():
+            if _address != self.address:
+                self._socket.sendto(data, _address)
+        return len(data)
+
+    def setsockopt(self, level, option, value) -> None:
+        if level == socket.SOL_SOCKET and \
+                option in (SO_TIMESTAMPING, SO_TIMESTAMPNS):
+            # AF_UNIX sockets have no RX timestamps, let the listener use
+            # its own clock
+            raise OSError("no timestamps on the socketpair stand-in")
+        if level == SOL_CAN_RAW:
+            raise OSError("no kernel CAN filters on the stand-in")
+        self._socket.setsockopt(level, option, value)
+
+    def __getattr__(self, name):
+        return getattr(self._socket, name)
+
+    def close(self) -> None:
+        self._hub._sockets.pop(self.address, None)
+        self._socket.close()
+
+
+class SocketPairHub:
+    _hubs = itertools.count()
+
+    def __init__(self) -> None:
+        """An in-process stand-in for a SocketCAN interface: every socket
+        it opens receives the frames sent by the others (a CAN's own
+        listeners included, loopback is not modelled). Pass
+        hub.socket_factory as CAN(socket_factory=...)."""
+        self._prefix = f"\0frc_can_hub_{id(self)}_{next(self._hubs)}_"
+        self._count = itertools.count()
+        self._sockets = {}
+
+    def addresses(self) -> list:
+        return list(self._sockets)
+
+    def socket_factory(self, channel: str) -> _HubSocket:
+        _address = f"{self._prefix}{channel}_{next(self._count)}".encode()
+        _socket = _HubSocket(self, _address)
+        self._sockets[_address] = _socket
+        return _socket
@@ -0,0 +1,173 @@
+"""An in-process virtual CAN bus that mimics the canio API.
+
+Message, RemoteTransmissionRequest, Match, CAN and Listener behave like
+their canio counterparts, so CANHandler and the devices built on it can run
+on a host (CPython) against a VirtualBus shared by several CAN nodes.
+"""
+
+from collections import deque
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+
+class Message:
+    def __init__(self, id: int, data: bytes, *,
+                 extended: bool = False) -> None:
+        """A CAN data frame, see canio.Message."""
+        self.id = id
+        self.data = data
+        self.extended = extended
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, Message) and self.id == other.id and
+                self.extended == other.extended and
+                bytes(self.data) == bytes(other.data))
+
+    def __repr__(self) -> str:
+        return (f"Message(id=0x{self.id:x}, data={bytes(self.data)!r},"
+                f" extended={self.extended})")
+
+
+class RemoteTransmissionRequest:
+    def __init__(self, id: int, length: int, *,
+                 extended: bool = False) -> None:
+        """A CAN remote frame, see canio.RemoteTransmissionRequest."""
+        self.id = id
+        self.length = length
+        self.extended = extended
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, RemoteTransmissionRequest) and
+                self.id == other.id and self.extended == other.extended and
+                self.length == other.length)
+
+    def __repr__(self) -> str:
+        return (f"RemoteTransmissionRequest(id=0x{self.id:x},"
+                f" length={self.length}, extended={self.extended})")
+
+
+class Match:
+    def __init__(self, id: int, *, mask: int = None,
+                 extended: bool = False) -> None:
+        """A receive filter, see canio.Match. With no mask, all ID bits
+        must match."""
+        self.id = id
+        self.mask = mask
+        self.extended = extended
+
+    def matches(self, message) -> bool:
+        if message.extended != self.extended:
+            return False
+        _mask = self.mask
+        if _mask is None:
+            _mask = 0x1fffffff if self.extended else 0x7ff
+        return (message.id & _mask) == (self.id & _mask)
+
+
+class VirtualBus:
+    def __init__(self) -> None:
+        """The shared medium. Every frame sent by a node is delivered to
+        the listeners of all the other nodes (and to its own if the node
+        is in loopback mode)."""
+        self.nodes = []
+        self.frames_sent = 0
+
+    def attach(self, node) -> None:
+        self.nodes.append(node)
+
+    def detach(self, node) -> None:
+        if node in self.nodes:
+            self.nodes.remove(node)
+
+    def transmit(self, sender, message) -> None:
+        self.frames_sent += 1
+        for _node in self.nodes:
+            if _node is not sender or _node.loopback:
+                _node._deliver(message)
+
+
+class Listener:
+    def __init__(self, can, matches, timeout: float) -> None:
+        """Receives the frames accepted by matches, see canio.Listener.
+        receive() never blocks; an empty queue returns None right away."""
+        self._can = can
+        self._matches = matches
+        self.timeout = timeout
+        self._queue = deque()
+
+    def _accept(self, message) -> bool:
+        if not self._matches:
+            return True
+        for _match in self._matches:
+            if _match.matches(message):
+                return True
+        return False
+
+    def receive(self):
+        if self._queue:
+            return self._queue.popleft()
+        return None
+
+    def in_waiting(self) -> int:
+        return len(self._queue)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        _message = self.receive()
+        if _message is None:
+            raise StopIteration
+        return _message
+
+    def deinit(self) -> None:
+        if self in self._can._listeners:
+            self._can._listeners.remove(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.deinit()
+
+
+class CAN:
+    def __init__(self, bus: VirtualBus = None, *, baudrate: int = 1000000,
+                 loopback: bool = False, silent: bool = False,
+                 auto_restart: bool = False) -> None:
+        """A CAN node on a VirtualBus, see canio.CAN."""
+        self.bus = bus if bus is not None else VirtualBus()
+        self.baudrate = baudrate
+        self.loopback = loopback
+        self.silent = silent
+        self.auto_restart = auto_restart
+        self.sent = 0
+        self._listeners = []
+        self.bus.attach(self)
+
+    def _deliver(self, message) -> None:
+        for _listener in self._listeners:
+            if _listener._accept(message):
+                _listener._queue.append(message)
+
+    def send(self, message) -> None:
+        self.sent += 1
+        if self.silent:
+            self._deliver(message)
+        else:
+            self.bus.transmit(self, message)
+
+    def listen(self, matches=None, *, timeout: float = 10) -> Listener:
+        _listener = Listener(self, matches, timeout)
+        self._listeners.append(_listener)
+        return _listener
+
+    def deinit(self) -> None:
+        self.bus.detach(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.deinit()
@@ -0,0 +1,101 @@
+"""Boot to first CAN frame, the start of a typical code.py.
+
+Imports the protocol core, answers a roboRIO heartbeat through a
+CANHandler and prints one line:
+
+    BOOT import_us=<n> first_frame_us=<n> mem_free=<n>
+
+import_us is the time the imports took, first_frame_us the time from the
+first line of this script to the reply handed to can.send, and mem_free
+the free heap after the imports (-1 where gc.mem_free() does not exist,
+e.g. CPython). The carrier board is a stub, so only the library is
+measured. tools/boot_time.py runs it against source and .mpy builds on
+the micropython unix port; on a board, copy it next to the library and
+import it.
+"""
+
+import gc
+import time
+
+try:
+    from time import ticks_diff, ticks_us
+except ImportError:
+    # CircuitPython and CPython
+    def ticks_us() -> int:
+        return time.monotonic_ns() // 1000
+
+    def ticks_diff(end: int, start: int) -> int:
+        return end - start
+
+# The imports below are what is measured
+_start = ticks_us()
+
+from ids.msg_format import FRCCANDevice
+from ids.heartbeat import HeartBeatMsg
+from can_handler import CANHandler
+
+_imported = ticks_us()
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+
+class _Listener:
+    def __init__(self, messages) -> None:
+        self._messages = list(messages)
+
+    def receive(self):
+        return self._messages.pop(0) if self._messages else None
+
+    def in_waiting(self) -> int:
+        return len(self._messages)
+
+    def add(self, message) -> None:
+        self._messages.append(message)
+
+
+class _CAN:
+    def __init__(self) -> None:
+        self.sent_us = None
+
+    def send(self, message) -> None:
+        if self.sent_us is None:
+            self.sent_us = ticks_us()
+
+
+class _Board:
+    def __init__(self, messages) -> None:
+        self.can = _CAN()
+        self.listener = _Listener(messages)
+
+
+def main() -> dict:
+    gc.collect()
+    _mem_free = gc.mem_free() if hasattr(gc, "mem_free") else -1
+    _reply_id = FRCCANDevice(
+        device_type=FRCCANDevice.DEVICE_TYPE_MISCELLANEOUS,
+        manufacturer=FRCCANDevice.MANUF_TEAM_USE, api=0,
+        device_number=1).message_id
+    # The stub board has no Message class, the handler falls back to
+    # backends.virtual_can's as it would on the host
+    _board = _Board([])
+    _handler = CANHandler(_board)
+    _message = _handler.Message
+    _board.listener.add(_message(HeartBeatMsg.HEARTBEAT_ID, bytes(8),
+                                 extended=True))
+    _handler.register_msg_handler(
+        HeartBeatMsg.HEARTBEAT_ID,
+        lambda message: _message(_reply_id, bytes(8), extended=True))
+    _handler.step()
+    _result = {
+        "import_us": ticks_diff(_imported, _start),
+        "first_frame_us": ticks_diff(_board.can.sent_us, _start),
+        "mem_free": _mem_free,
+    }
+    print("BOOT " + " ".join(f"{_key}={_result[_key]}"
+                             for _key in ("import_us", "first_frame_us",
+                                          "mem_free")))
+    return _result
+
+
+main()
@@ -1,11 +1,24 @@
+import time
+from ids.msg_format import FRCCANDevice
 
-import board
-import digitalio
-import busio
-from canio import Message
+
+def _clock_us() -> int:
+    return time.monotonic_ns() // 1000
 
 
 class CANHandler:
+    # FRC broadcast messages (device type, manufacturer and device number
+    # 0, FRCCANDevice.API_CLASS_BROADCAST_* in the API field) that can be
+    # given safety handlers, see register_safety_handler()
+    BROADCAST_DISABLE_ID = FRCCANDevice(
+        api=FRCCANDevice.API_CLASS_BROADCAST_DISABLE).message_id
+    BROADCAST_SYSTEM_HALT_ID = FRCCANDevice(
+        api=FRCCANDevice.API_CLASS_BROADCAST_SYSTEM_HALT).message_id
+    BROADCAST_SYSTEM_RESET_ID = FRCCANDevice(
+        api=FRCCANDevice.API_CLASS_BROADCAST_SYSTEM_RESET).message_id
+    BROADCAST_SYSTEM_RESUME_ID = FRCCANDevice(
+        api=FRCCANDevice.API_CLASS_BROADCAST_SYSTEM_RESUME).message_id
+
     def __init__(self, carrier_board, drain_queue=False) -> None:
         """CANHandler provides a convenient framework for building robotics
         applications using Adafruit and Raspberry Pi boards.  They're even
@@ -20,6 +33,14 @@ class CANHandler:
         # The carrier board passed to the handler for sending messages
         self.cb = carrier_board
 
+        # The Message class of the carrier board's CAN interface, the
+        # modules registered with the handler build their frames with it.
+        # Boards without one (host stand-ins) get backends.virtual_can's
+        self.Message = getattr(carrier_board, "Message", None)
+        if self.Message is None:
+            from backends.virtual_can import Message
+            self.Message = Message
+
         # Process all received messages during timeout slot
         self.drain_queue = drain_queue
 
@@ -43,6 +64,129 @@ class CANHandler:
         # set and a message is not received in timeout period
         self.timeout_handler = None
 
+        # An optional CANLogger that records every received and sent frame
+        self.logger = None
+
+        # An optional CANTrace recording handler latencies
+        self.tracer = None
+
+        # An optional HeapMonitor accounting allocations and scheduling
+        # garbage collections
+        self.heap = None
+
+        # Broadcast message ID to the list of safety handlers run before
+        # anything else is done with the frame
+        self.safety_table = {}
+        # Time spent in the safety handlers of the last and of the slowest
+        # broadcast, in us, and the number over safety_budget_us
+        self.clock_us = _clock_us
+        self.safety_budget_us = 1000
+        self.safety_count = 0
+        self.safety_last_us = 0
+        self.safety_max_us = 0
+        self.safety_late = 0
+
+    def send(self, message) -> None:
+        """Sends a Message (or RemoteTransmissionRequest) on the carrier
+        board CAN interface, logging it if a logger is registered."""
+        self.cb.can.send(message)
+        if self.logger:
+            self.logger.log(message, tx=True)
+
+    def register_logger(self, logger) -> None:
+        """Adds a CANLogger that records every received and sent frame.
+        Its flush_step() is called at the end of each step()."""
+        self.logger = logger
+
+    def register_tracer(self, tracer) -> None:
+        """Adds a CANTrace that records, for every frame dispatched to a
+        handler, when it was received, when the handler ran and when its
+        reply was sent."""
+        self.tracer = tracer
+
+    def register_heap_monitor(self, monitor) -> None:
+        """Adds a HeapMonitor that accounts the heap allocated by each step
+        and handler, and collects garbage at the end of the steps that
+        handled one of its idle_ids."""
+        self.heap = monitor
+
+    def _dispatch(self, function, message, received: int) -> None:
+        """Calls a registered handler and sends its reply, tracing both if
+        a tracer is registered."""
+        _tracer = self.tracer
+        _heap = self.heap
+        if _tracer is None and _heap is None:
+            return_message = function(message)
+            if return_message:
+                self.send(return_message)
+            return
+        _free = _heap.mem_free() if _heap else 0
+        _start = _tracer.clock_us() if _tracer else 0
+        return_message = function(message)
+        if _heap:
+            _heap.handler_done(message.id, _free)
+        if _tracer is None:
+            if return_message:
+                self.send(return_message)
+            return
+        _end = _tracer.clock_us()
+        _sent = None
+        if return_message:
+            _sent = _tracer.clock_us()
+            self.send(return_message)
+        _tracer.record(message.id, not hasattr(message, "data"),
+                       received, _start, _end, _sent)
+
+    def register_safety_handler(self, message_id, function) -> None:
+        """Adds a function called with the frame as soon as a broadcast
+        (BROADCAST_*_ID) is pulled from the listener, before it is logged,
+        traced or looked up in the handler tables. Several functions can be
+        added per broadcast, they run in the order added and should only
+        flip outputs (no I2C scans, no printing).
+
+        A broadcast is only seen when step() pulls it, after the frames
+        queued before it. With drain_queue=False one frame is pulled per
+        step, so a DISABLE behind n queued frames runs its functions n
+        steps late; use drain_queue=True to reach it within one step."""
+        if message_id in self.safety_table:
+            self.safety_table[message_id].append(function)
+        else:
+            self.safety_table[message_id] = [function]
+
+    def register_output_disable(self) -> None:
+        """Turns the carrier board PWM and motor outputs off on a broadcast
+        DISABLE or SYSTEM_HALT. Turning them back on is left to the
+        application. Boards without PWM or motor outputs are skipped."""
+        for _name in ("disable_pwm", "disable_motor"):
+            _disable = getattr(self.cb, _name, None)
+            if _disable is None:
+                continue
+            for _message_id in (self.BROADCAST_DISABLE_ID,
+                                self.BROADCAST_SYSTEM_HALT_ID):
+                self.register_safety_handler(
+                    _message_id, lambda _message, _f=_disable: _f())
+
+    def _safety(self, message) -> None:
+        _start = self.clock_us()
+        for _function in self.safety_table[message.id]:
+            _function(message)
+        _elapsed = self.clock_us() - _start
+        self.safety_count += 1
+        self.safety_last_us = _elapsed
+        if _elapsed > self.safety_max_us:
+            self.safety_max_us = _elapsed
+        if _elapsed > self.safety_budget_us:
+            self.safety_late += 1
+
+    def safety_stats(self) -> dict:
+        return {
+            "count": self.safety_count,
+            "last_us": self.safety_last_us,
+            "max_us": self.safety_max_us,
+            "late": self.safety_late,
+            "budget_us": self.safety_budget_us,
+        }
+
     def register_msg_handler(self, message_id, function) -> None:
         """Adds a function (handler) to process a specific CAN message.
         These are added to a dict with message_id as key, function
@@ -80,29 +224,48 @@ class CANHandler:
         arrive. Examples include sampling and processing I/Os for
         indexing, reading sensors over I2C, SPI, etc."""
         if isinstance(iteration_function, list):
-            self.iteration_function = iteration_function
+            self.iteration_handler = iteration_function
         else:
             # store as a list, even a single entry list
-            self.iteration_function = [iteration_function]
+            self.iteration_handler = [iteration_function]
+
+    def add_iteration_handler(self, iteration_function) -> None:
+        """Appends a function to the iteration handlers, keeping the ones
+        already registered."""
+        self.iteration_handler = (self.iteration_handler or []) + \
+            [iteration_function]
 
     def step(self) -> None:
         """Wait for the arrival of a message or a timeout. The message
         can be a Message or a RemoteTransmissionRequest. If one arrives,
         process it. Whether a message/RTR arrives or not, call the
         "iteration" function make progress on processing things needed."""
+        _heap = self.heap
+        _idle = False
+        if _heap:
+            _heap.step_start()
         message = self.cb.listener.receive()
         if message:
-            while self.cb.listener.in_waiting():
+            while message:
+                # Messages carry data, RemoteTransmissionRequests a length
+                # (no class check, so no CAN module needs importing here)
+                _is_message = hasattr(message, "data")
+                # The broadcast safety messages go first
+                if message.id in self.safety_table and \
+                        message.extended and _is_message:
+                    self._safety(message)
+                _received = self.tracer.clock_us() if self.tracer else 0
+                if _heap and message.id in _heap.idle_ids:
+                    _idle = True
+                if self.logger:
+                    self.logger.log(message)
                 # A CAN message was received...
-                if isinstance(message, Message):
+                if _is_message:
                     # it is a Message..
                     if message.id in self.handler_table:
                         # And we are setup to process it...
-                        return_message = (
-                            self.handler_table[message.id](message)
-                        )
-                        if return_message:
-                            self.cb.can.send(return_message)
+                        self._dispatch(self.handler_table[message.id],
+                                       message, _received)
                     # if there is a handler registered for non-matching
                     # msg, call it
                     elif self.unmatched_handler:
@@ -111,10 +274,8 @@ class CANHandler:
                     # it is a RemoteTransmissionRequest
                     if message.id in self.rtr_handler_table:
                         # And we are setup to process it...
-                        return_message = \
-                            self.rtr_handler_table[message.id](message)
-                        if return_message:
-                            self.cb.can.send(return_message)
+                        self._dispatch(self.rtr_handler_table[message.id],
+                                       message, _received)
                     # if there is a handler registered for non-matching msg,
                     # call it
                     elif self.unmatched_handler:
@@ -122,7 +283,8 @@ class CANHandler:
                 # Leave loop after one iteration if drain_queue is false OR
                 # there is no more messages in the queue.  Otherwise,
                 # continue draining..
-                if self.drain_queue is False and self.cb.listener.in_waiting():
+                if (self.drain_queue is False or
+                        not self.cb.listener.in_waiting()):
                     break
                 # get next message
                 message = self.cb.listener.receive()
@@ -134,7 +296,22 @@ class CANHandler:
         # run all of the registered iteration functions, one at a time
         # if any generate a message, send it
         if self.iteration_handler:
+            # Iteration handlers are accounted as -1, -2, ...
+            _key = -1
             for func in self.iteration_handler:
+                if _heap:
+                    _free = _heap.mem_free()
                 _message = func()
+                if _heap:
+                    _heap.handler_done(_key, _free)
+                    _key -= 1
                 if _message:
-                    self.cb.can.send(_message)
+                    self.send(_message)
+
+        # Give the logger its (bounded) slot to write to the card
+        if self.logger:
+            self.logger.flush_step()
+
+        # Account the step, collecting garbage if this is an idle window
+        if _heap:
+            _heap.step_done(_idle)
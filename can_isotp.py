@@ -0,0 +1,391 @@
+"""Segmentation and reassembly of payloads larger than 8 bytes, after ISO
+15765-2 (ISO-TP).
+
+The first data byte of every frame is its protocol control information:
+    single      [0x0L] up to 7 bytes, L is the length
+    first       [0x1H, L] 6 bytes, 12-bit length (up to 4095 bytes)
+    consecutive [0x2N] 7 bytes, N is the sequence number (1, 2 ... 15, 0)
+    flow        [0x3S, block size, STmin] from the receiver; S is 0 to
+                continue, 1 to wait, 2 for overflow (transfer refused)
+The receiver answers a first frame, and then every block size consecutive
+frames (0: no more flow control), with a flow control frame allowing the
+next block; the sender keeps STmin ms between consecutive frames.
+
+Data frames go on the sender's FRCCANDevice ID, flow control frames on the
+same ID with FLOW_CONTROL_API_BIT set in the API, so the sessions of several
+senders (and several data IDs of one sender) run concurrently, each keyed by
+its ID. Data IDs are therefore limited to APIs 0 to 511: an ID with
+FLOW_CONTROL_API_BIT (bit 9 of the API) already set would be its own flow
+control ID, so ISOTPSender.send() and ISOTPReceiver.register() refuse it.
+The receiver reassembles into preallocated buffers. The sender sends at
+most frames_per_step consecutive frames per CANHandler step, so large
+transfers share the bus with the single frame traffic.
+"""
+
+import time
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+
+def _clock_ms() -> int:
+    return time.monotonic_ns() // 1000000
+
+
+PCI_SINGLE = 0x00
+PCI_FIRST = 0x10
+PCI_CONSECUTIVE = 0x20
+PCI_FLOW_CONTROL = 0x30
+
+FLOW_CONTINUE = 0
+FLOW_WAIT = 1
+FLOW_OVERFLOW = 2
+
+MAX_LENGTH = 4095
+
+# The flow control frames of a data ID set this bit of its API field
+FLOW_CONTROL_API_BIT = 0x200 << 6
+
+
+def flow_control_id(message_id: int) -> int:
+    return message_id | FLOW_CONTROL_API_BIT
+
+
+def is_data_id(message_id: int) -> bool:
+    """True if message_id can carry segmented data, i.e. its flow control
+    ID is a different ID."""
+    return not message_id & FLOW_CONTROL_API_BIT
+
+
+class ISOTPReceiver:
+    def __init__(self, on_message, max_sessions: int = 4,
+                 max_length: int = 256, block_size: int = 8,
+                 st_min_ms: int = 0, timeout_ms: int = 1000,
+                 clock_ms=None) -> None:
+        """Reassembles segmented payloads.
+
+        Args:
+            on_message (function): called as on_message(message_id, data)
+                with every whole payload; data is a memoryview only valid
+                during the call. It may return a Message to send.
+            max_sessions (int): transfers reassembled at once.
+            max_length (int): longest payload, longer ones are refused.
+            block_size (int): consecutive frames per flow control, 0 for
+                a single flow control per transfer.
+            st_min_ms (int): time the sender keeps between consecutive
+                frames, 0 to 127.
+            timeout_ms (int): a session without a frame this long is
+                dropped.
+            clock_ms (function): time source, defaults to
+                time.monotonic_ns() in ms.
+        """
+        self.on_message = on_message
+        self.max_length = max_length
+        self.block_size = block_size
+        self.st_min_ms = st_min_ms
+        self.timeout_ms = timeout_ms
+        self._clock_ms = clock_ms if clock_ms else _clock_ms
+
+        # Preallocated session slots, self._ids[slot] is None when free
+        self._buffers = [bytearray(max_length) for _ in range(max_sessions)]
+        self._ids = [None] * max_sessions
+        self._lengths = [0] * max_sessions
+        self._fill = [0] * max_sessions
+        self._sequence = [0] * max_sessions
+        self._block = [0] * max_sessions
+        self._last_ms = [0] * max_sessions
+
+        self.completed = 0
+        self.refused = 0
+        self.aborted = 0
+        # The CANHandler's Message class, set by register()
+        self.Message = None
+
+    def register(self, can_handler, message_ids: list) -> None:
+        """Registers the data IDs to reassemble with a CANHandler, plus an
+        iteration handler dropping stale sessions.
+
+        Raises:
+            ValueError: if a data ID has FLOW_CONTROL_API_BIT set.
+        """
+        for _id in message_ids:
+            if not is_data_id(_id):
+                raise ValueError(f"ISO-TP data ID 0x{_id:08x} has the flow"
+                                 f" control API bit set")
+        self.Message = can_handler.Message
+        for _id in message_ids:
+            can_handler.register_msg_handler(_id, self.receive)
+        can_handler.add_iteration_handler(self.step)
+
+    def _slot(self, message_id: int):
+        _ids = self._ids
+        for _slot in range(len(_ids)):
+            if _ids[_slot] == message_id:
+                return _slot
+        return None
+
+    def _flow(self, message_id: int, status: int):
+        return self.Message(flow_control_id(message_id),
+                            bytes([PCI_FLOW_CONTROL | status,
+                                   self.block_size, self.st_min_ms]),
+                            extended=True)
+
+    def receive(self, message):
+        """Message handler for the data IDs."""
+        _data = message.data
+        if not _data:
+            return None
+        _pci = _data[0] & 0xf0
+        _id = message.id
+        if _pci == PCI_SINGLE:
+            _length = _data[0] & 0x0f
+            if not 0 < _length < len(_data):
+                return None
+            self.completed += 1
+            return self.on_message(_id, memoryview(_data)[1:1 + _length])
+        if _pci == PCI_FIRST:
+            return self._first(_id, _data)
+        if _pci == PCI_CONSECUTIVE:
+            return self._consecutive(_id, _data)
+        return None
+
+    def _first(self, message_id: int, data):
+        # A first frame is always a full 8 bytes
+        if len(data) < 8:
+            return None
+        _length = (data[0] & 0x0f) << 8 | data[1]
+        _slot = self._slot(message_id)
+        if _slot is not None:
+            # A new transfer replaces an unfinished one
+            self.aborted += 1
+        else:
+            _slot = self._slot(None)
+        if _slot is None or _length > self.max_length or _length < 8:
+            self.refused += 1
+            if _slot is not None:
+                self._ids[_slot] = None
+            return self._flow(message_id, FLOW_OVERFLOW)
+        _chunk = len(data) - 2
+        self._buffers[_slot][0:_chunk] = data[2:]
+        self._ids[_slot] = message_id
+        self._lengths[_slot] = _length
+        self._fill[_slot] = _chunk
+        self._sequence[_slot] = 1
+        self._block[_slot] = 0
+        self._last_ms[_slot] = self._clock_ms()
+        return self._flow(message_id, FLOW_CONTINUE)
+
+    def _consecutive(self, message_id: int, data):
+        _slot = self._slot(message_id)
+        if _slot is None:
+            return None
+        if data[0] & 0x0f != self._sequence[_slot]:
+            # Lost a frame, the transfer can't be completed
+            self._ids[_slot] = None
+            self.aborted += 1
+            return None
+        _fill = self._fill[_slot]
+        _chunk = min(len(data) - 1, self._lengths[_slot] - _fill)
+        self._buffers[_slot][_fill:_fill + _chunk] = data[1:1 + _chunk]
+        _fill += _chunk
+        self._fill[_slot] = _fill
+        self._sequence[_slot] = (self._sequence[_slot] + 1) & 0x0f
+        self._last_ms[_slot] = self._clock_ms()
+        if _fill >= self._lengths[_slot]:
+            self._ids[_slot] = None
+            self.completed += 1
+            return self.on_message(
+                message_id, memoryview(self._buffers[_slot])[:_fill])
+        self._block[_slot] += 1
+        if self.block_size and self._block[_slot] == self.block_size:
+            self._block[_slot] = 0
+            return self._flow(message_id, FLOW_CONTINUE)
+        return None
+
+    def step(self) -> None:
+        """Iteration handler, drops sessions that timed out."""
+        _now = self._clock_ms()
+        for _slot in range(len(self._ids)):
+            if self._ids[_slot] is not None and \
+                    _now - self._last_ms[_slot] > self.timeout_ms:
+                self._ids[_slot] = None
+                self.aborted += 1
+        return None
+
+
+class ISOTPSender:
+    # Session states
+    WAIT_FLOW = 0
+    SENDING = 1
+
+    def __init__(self, max_sessions: int = 4, max_length: int = 256,
+                 frames_per_step: int = 4, timeout_ms: int = 1000,
+                 on_done=None, clock_ms=None) -> None:
+        """Segments payloads longer than 7 bytes.
+
+        Args:
+            max_sessions (int): transfers in progress at once.
+            max_length (int): longest payload.
+            frames_per_step (int): consecutive frames sent per step(), over
+                all sessions.
+            timeout_ms (int): a session waiting this long for flow control
+                fails.
+            on_done (function): called as on_done(message_id, ok) when a
+                segmented transfer ends.
+            clock_ms (function): time source, defaults to
+                time.monotonic_ns() in ms.
+        """
+        self.max_length = max_length
+        self.frames_per_step = frames_per_step
+        self.timeout_ms = timeout_ms
+        self.on_done = on_done
+        self._clock_ms = clock_ms if clock_ms else _clock_ms
+        self._can_handler = None
+        self._registered = set()
+        # The CANHandler's Message class, set by register()
+        self.Message = None
+
+        self._buffers = [bytearray(max_length) for _ in range(max_sessions)]
+        self._ids = [None] * max_sessions
+        self._lengths = [0] * max_sessions
+        self._sent = [0] * max_sessions
+        self._sequence = [0] * max_sessions
+        self._state = [0] * max_sessions
+        self._block_left = [0] * max_sessions
+        self._st_min = [0] * max_sessions
+        self._last_ms = [0] * max_sessions
+        # Session served first on the next step, for round robin
+        self._next_slot = 0
+
+        self.completed = 0
+        self.failed = 0
+        self.frames = 0
+
+    def register(self, can_handler) -> None:
+        """Sends through a CANHandler and adds the step() iteration
+        handler; flow control handlers are registered as IDs are used."""
+        self._can_handler = can_handler
+        self.Message = can_handler.Message
+        can_handler.add_iteration_handler(self.step)
+
+    def busy(self, message_id: int) -> bool:
+        return message_id in self._ids
+
+    def send(self, message_id: int, data) -> bool:
+        """Starts sending data on message_id (a single frame right away
+        for up to 7 bytes). Returns False if message_id is already busy,
+        there is no free session, data is too long or message_id has
+        FLOW_CONTROL_API_BIT set."""
+        if not is_data_id(message_id):
+            return False
+        _length = len(data)
+        if _length <= 7:
+            self._send(self.Message(message_id,
+                                    bytes([PCI_SINGLE | _length]) +
+                                    bytes(data), extended=True))
+            return True
+        if _length > self.max_length or _length > MAX_LENGTH or \
+                message_id in self._ids or None not in self._ids:
+            return False
+        _fc_id = flow_control_id(message_id)
+        if _fc_id not in self._registered:
+            self._can_handler.register_msg_handler(_fc_id,
+                                                   self.flow_control)
+            self._registered.add(_fc_id)
+        _slot = self._ids.index(None)
+        self._buffers[_slot][0:_length] = data
+        self._ids[_slot] = message_id
+        self._lengths[_slot] = _length
+        self._sent[_slot] = 6
+        self._sequence[_slot] = 1
+        self._state[_slot] = self.WAIT_FLOW
+        self._last_ms[_slot] = self._clock_ms()
+        self._send(self.Message(message_id,
+                                bytes([PCI_FIRST | _length >> 8,
+                                       _length & 0xff]) +
+                                bytes(self._buffers[_slot][0:6]),
+                                extended=True))
+        return True
+
+    def _send(self, message) -> None:
+        self.frames += 1
+        self._can_handler.send(message)
+
+    def _end(self, slot: int, ok: bool) -> None:
+        _id = self._ids[slot]
+        self._ids[slot] = None
+        if ok:
+            self.completed += 1
+        else:
+            self.failed += 1
+        if self.on_done:
+            self.on_done(_id, ok)
+
+    def flow_control(self, message) -> None:
+        """Message handler for the flow control IDs."""
+        _data = message.data
+        _slot = None
+        _id = message.id & ~FLOW_CONTROL_API_BIT
+        if _id in self._ids:
+            _slot = self._ids.index(_id)
+        if _slot is None or len(_data) < 3 or \
+                _data[0] & 0xf0 != PCI_FLOW_CONTROL or \
+                self._state[_slot] != self.WAIT_FLOW:
+            return None
+        _status = _data[0] & 0x0f
+        self._last_ms[_slot] = self._clock_ms()
+        if _status == FLOW_CONTINUE:
+            self._state[_slot] = self.SENDING
+            # 0 never waits again
+            self._block_left[_slot] = _data[1] if _data[1] else -1
+            self._st_min[_slot] = _data[2] if _data[2] <= 127 else 127
+            # Let the first consecutive frame go out right away
+            self._last_ms[_slot] -= self._st_min[_slot]
+        elif _status == FLOW_OVERFLOW:
+            self._end(_slot, False)
+        return None
+
+    def step(self) -> None:
+        """Iteration handler, sends up to frames_per_step consecutive
+        frames, taking the sessions in turn."""
+        _now = self._clock_ms()
+        _budget = self.frames_per_step
+        _slots = len(self._ids)
+        for _k in range(_slots):
+            _slot = (self._next_slot + _k) % _slots
+            if self._ids[_slot] is None:
+                continue
+            if self._state[_slot] == self.WAIT_FLOW:
+                if _now - self._last_ms[_slot] > self.timeout_ms:
+                    self._end(_slot, False)
+                continue
+            while _budget and self._ids[_slot] is not None and \
+                    self._state[_slot] == self.SENDING and \
+                    _now - self._last_ms[_slot] >= self._st_min[_slot]:
+                self._consecutive(_slot, _now)
+                _budget -= 1
+                if self._st_min[_slot]:
+                    break
+            if not _budget:
+                self._next_slot = (_slot + 1) % _slots
+                break
+        return None
+
+    def _consecutive(self, slot: int, now: int) -> None:
+        _sent = self._sent[slot]
+        _end = min(_sent + 7, self._lengths[slot])
+        self._send(self.Message(self._ids[slot],
+                                bytes([PCI_CONSECUTIVE |
+                                       self._sequence[slot]]) +
+                                bytes(self._buffers[slot][_sent:_end]),
+                                extended=True))
+        self._sent[slot] = _end
+        self._sequence[slot] = (self._sequence[slot] + 1) & 0x0f
+        self._last_ms[slot] = now
+        if _end >= self._lengths[slot]:
+            self._end(slot, True)
+            return
+        if self._block_left[slot] > 0:
+            self._block_left[slot] -= 1
+            if self._block_left[slot] == 0:
+                self._state[slot] = self.WAIT_FLOW
@@ -0,0 +1,340 @@
+"""Binary CAN frame logger for the carrier board microSD slot.
+
+Every received and transmitted frame is stored as a fixed-size 16 byte
+record in one of two preallocated buffers. A buffer is written to the card
+once a whole block (sized to the FAT cluster) is full, a few sectors per
+flush_step() call, so the receive path never waits on the card for more
+than one chunk write.
+
+Log file layout, all little endian:
+    record 0:  file header
+               magic (8s) version (H) record size (H) block size (I)
+    record 1+: frame records
+               word0 (I): [31:28] DLC, [27:0] timestamp, us (wraps)
+               word1 (I): [31] TX, [30] RTR, [29] extended, [28:0] ID
+               data (8s)
+A record with DLC MARKER_DLC is a time marker. Its data holds the full
+64-bit microsecond timestamp, so a reader can unwrap the 28-bit timestamps.
+Records with DLC PAD_DLC are padding written by a forced flush of a
+partially filled block and should be skipped.
+
+File numbers continue after the highest prefix_NNNN.bin already in the
+directory, so the log of the run before a reset or brownout is kept.
+Rotating to a new file is spread over flush_step() calls like the block
+writes: the old file's last block is padded and written in chunks, and
+closing it and opening the next file takes a flush_step() of its own.
+"""
+
+import os
+import struct
+import time
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+
+def _clock_us() -> int:
+    return time.monotonic_ns() // 1000
+
+
+def _clock_ms() -> int:
+    return time.monotonic_ns() // 1000000
+
+
+class CANLogger:
+    MAGIC = b"FRCCANLG"
+    VERSION = 1
+
+    RECORD_SIZE = 16
+    RECORD_FORMAT = "<II8s"
+    HEADER_FORMAT = "<8sHHI"
+
+    TIMESTAMP_MASK = 0x0fffffff
+    DLC_LSB = 28
+    ID_MASK = 0x1fffffff
+    FLAG_EXTENDED = 1 << 29
+    FLAG_RTR = 1 << 30
+    FLAG_TX = 1 << 31
+
+    MARKER_DLC = 15
+    PAD_DLC = 14
+
+    # Emit a time marker when this many us passed since the last one, well
+    # before the 28-bit timestamp wraps (~268 s)
+    MARKER_INTERVAL = 1 << 26
+
+    # Default block size, the usual FAT32 cluster on a microSD card
+    BLOCK_SIZE = 4096
+    # Bytes written to the card per chunk, one SD sector
+    CHUNK_SIZE = 512
+
+    def __init__(self, path: str = "/sd", prefix: str = "can",
+                 block_size: int = BLOCK_SIZE,
+                 chunk_size: int = CHUNK_SIZE,
+                 flush_budget_ms: int = 2,
+                 flush_interval_ms: int = 0,
+                 sync_blocks: int = 8,
+                 max_file_blocks: int = 0,
+                 clock_us=None, clock_ms=None) -> None:
+        """Logs CAN frames to files path/prefix_NNNN.bin.
+
+        Args:
+            path (str): directory the card is mounted on (see
+                CarrierBoard.init_microsd()).
+            prefix (str): log file name prefix.
+            block_size (int): bytes per buffer, written as one block. Use
+                the card's FAT cluster size. Must be a multiple of
+                chunk_size.
+            chunk_size (int): bytes written per file.write() call. This
+                bounds the time one flush_step() call blocks.
+            flush_budget_ms (int): time flush_step() may spend writing
+                chunks. At least one chunk is written per call.
+            flush_interval_ms (int): if non-zero, a partially filled block
+                is padded and flushed once it is this old, bounding the
+                data lost on a brownout.
+            sync_blocks (int): flush the file to the card every N blocks.
+            max_file_blocks (int): start a new file after N blocks, 0 to
+                never rotate.
+            clock_us, clock_ms (function): time sources, default to
+                time.monotonic_ns() based clocks.
+        """
+        if block_size % chunk_size or block_size % self.RECORD_SIZE:
+            raise ValueError("block_size must be a multiple of chunk_size"
+                             " and RECORD_SIZE")
+        self.path = path
+        self.prefix = prefix
+        self.block_size = block_size
+        self.chunk_size = chunk_size
+        self.flush_budget_ms = flush_budget_ms
+        self.flush_interval_ms = flush_interval_ms
+        self.sync_blocks = sync_blocks
+        self.max_file_blocks = max_file_blocks
+        self._clock_us = clock_us if clock_us else _clock_us
+        self._clock_ms = clock_ms if clock_ms else _clock_ms
+
+        # The double buffer. Records go into _buffers[_active] while the
+        # other one (if _pending) is being written to the card.
+        self._buffers = (bytearray(block_size), bytearray(block_size))
+        self._views = (memoryview(self._buffers[0]),
+                       memoryview(self._buffers[1]))
+        self._active = 0
+        self._offset = 0
+        self._block_time = 0
+        self._pending = None
+        self._pending_offset = 0
+        self._empty_data = bytes(8)
+
+        # Counters
+        self.records = 0
+        self.dropped = 0
+        self.blocks_written = 0
+        self.max_flush_ms = 0
+
+        self._file = None
+        self._file_number = self._first_file_number()
+        self._file_blocks = 0
+        self._last_marker = 0
+        # Set while the old file's last block is written after a rotation
+        # started; the active buffer already belongs to the next file
+        self._rotating = False
+
+    @property
+    def filename(self) -> str:
+        return f"{self.path}/{self.prefix}_{self._file_number:04d}.bin"
+
+    def _first_file_number(self) -> int:
+        """One past the highest prefix_NNNN.bin in path, 0 if there is
+        none (or path is not there yet)."""
+        try:
+            _names = os.listdir(self.path)
+        except OSError:
+            return 0
+        _start = self.prefix + "_"
+        _number = -1
+        for _name in _names:
+            _digits = _name[len(_start):-len(".bin")]
+            if _name.startswith(_start) and _name.endswith(".bin") and \
+                    len(_digits) == 4 and _digits.isdigit():
+                _number = max(_number, int(_digits))
+        return _number + 1
+
+    def _new_file(self):
+        _file = open(self.filename, "wb")
+        self._file_number += 1
+        return _file
+
+    def open(self, file=None) -> None:
+        """Opens the next log file (or uses the given file object) and
+        starts it with the file header and a time marker."""
+        self.close()
+        if file is None:
+            file = self._new_file()
+        self._file = file
+        self._file_blocks = 0
+        self._put_header()
+        self._put_marker(self._clock_us())
+
+    def _start_rotation(self) -> None:
+        """Hands the rest of the current file to the writer and starts the
+        next file's header in the active buffer."""
+        if self._offset:
+            self._pad_block()
+            self._swap()
+        self._put_header()
+        self._put_marker(self._clock_us())
+        self._rotating = True
+
+    def _switch_file(self) -> None:
+        """Closes the finished file and opens the next one, whose header
+        is already buffered."""
+        self._file.flush()
+        self._file.close()
+        self._file = self._new_file()
+        self._file_blocks = 0
+        self._rotating = False
+
+    def close(self) -> None:
+        """Pads and writes out everything buffered, then closes the
+        file."""
+        if self._file is None:
+            return
+        while self._pending is not None:
+            self._write_chunk()
+        if self._rotating:
+            self._switch_file()
+        if self._offset:
+            self._pad_block()
+            self._swap()
+            while self._pending is not None:
+                self._write_chunk()
+        self._file.flush()
+        self._file.close()
+        self._file = None
+
+    def _put_header(self) -> None:
+        struct.pack_into(self.HEADER_FORMAT, self._buffers[self._active],
+                         self._offset, self.MAGIC, self.VERSION,
+                         self.RECORD_SIZE, self.block_size)
+        self._offset += self.RECORD_SIZE
+        self._block_time = self._clock_ms()
+
+    def _put_marker(self, now_us: int) -> None:
+        struct.pack_into(self.RECORD_FORMAT, self._buffers[self._active],
+                         self._offset,
+                         (self.MARKER_DLC << self.DLC_LSB) |
+                         (now_us & self.TIMESTAMP_MASK),
+                         0, struct.pack("<Q", now_us))
+        self._offset += self.RECORD_SIZE
+        self._last_marker = now_us
+
+    def _pad_block(self) -> None:
+        _buffer = self._buffers[self._active]
+        _pad = self.PAD_DLC << self.DLC_LSB
+        while self._offset < self.block_size:
+            struct.pack_into(self.RECORD_FORMAT, _buffer, self._offset,
+                             _pad, 0, self._empty_data)
+            self._offset += self.RECORD_SIZE
+
+    def _swap(self) -> bool:
+        """Hands the full active buffer to the writer. Returns False if
+        the writer is still busy with the other buffer."""
+        if self._pending is not None:
+            return False
+        self._pending = self._active
+        self._pending_offset = 0
+        self._active ^= 1
+        self._offset = 0
+        self._block_time = self._clock_ms()
+        return True
+
+    def log(self, message, tx: bool = False) -> bool:
+        """Records a canio.Message or RemoteTransmissionRequest. Returns
+        False (and counts it in self.dropped) when both buffers are
+        full."""
+        if self._file is None:
+            return False
+        if self._offset >= self.block_size and not self._swap():
+            self.dropped += 1
+            return False
+
+        _now = self._clock_us()
+        if _now - self._last_marker >= self.MARKER_INTERVAL:
+            self._put_marker(_now)
+            if self._offset >= self.block_size and not self._swap():
+                self.dropped += 1
+                return False
+
+        _id = message.id & self.ID_MASK
+        if message.extended:
+            _id |= self.FLAG_EXTENDED
+        if tx:
+            _id |= self.FLAG_TX
+        if hasattr(message, "data"):
+            _data = message.data
+            _dlc = len(_data)
+        else:
+            # A RemoteTransmissionRequest has a length but no data
+            _id |= self.FLAG_RTR
+            _data = self._empty_data
+            _dlc = message.length
+        struct.pack_into(self.RECORD_FORMAT, self._buffers[self._active],
+                         self._offset,
+                         (_dlc << self.DLC_LSB) | (_now & self.TIMESTAMP_MASK),
+                         _id, _data)
+        self._offset += self.RECORD_SIZE
+        self.records += 1
+        return True
+
+    def _write_chunk(self) -> None:
+        _view = self._views[self._pending]
+        _end = self._pending_offset + self.chunk_size
+        self._file.write(_view[self._pending_offset:_end])
+        self._pending_offset = _end
+        if _end >= self.block_size:
+            self._pending = None
+            self.blocks_written += 1
+            self._file_blocks += 1
+            if self.sync_blocks and \
+                    self.blocks_written % self.sync_blocks == 0:
+                self._file.flush()
+
+    def flush_step(self) -> None:
+        """Writes buffered blocks to the card for at most flush_budget_ms
+        (but at least one chunk). Call it every loop iteration, e.g. right
+        after CANHandler.step()."""
+        if self._file is None:
+            return
+        _start = self._clock_ms()
+
+        # The old file is written out: closing it and opening the next one
+        # is this step's work
+        if self._rotating and self._pending is None:
+            self._switch_file()
+            self._account_flush(_start)
+            return
+
+        # Hand over a full block, or an old partial one if the policy says
+        # so
+        if self._pending is None and self._offset:
+            if self._offset >= self.block_size:
+                self._swap()
+            elif (self.flush_interval_ms and
+                  _start - self._block_time >= self.flush_interval_ms):
+                self._pad_block()
+                self._swap()
+
+        while self._pending is not None:
+            self._write_chunk()
+            if self._clock_ms() - _start >= self.flush_budget_ms:
+                break
+
+        if (self.max_file_blocks and not self._rotating and
+                self._pending is None and
+                self._file_blocks >= self.max_file_blocks):
+            self._start_rotation()
+        self._account_flush(_start)
+
+    def _account_flush(self, start: int) -> None:
+        _elapsed = self._clock_ms() - start
+        if _elapsed > self.max_flush_ms:
+            self.max_flush_ms = _elapsed
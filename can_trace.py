@@ -0,0 +1,113 @@
+"""Receive-to-reply latency tracing for CANHandler.
+
+For every frame dispatched to a registered handler, CANHandler records four
+microsecond timestamps: when the frame was pulled from the listener, when
+its handler started, when it returned, and when its reply (if any) was
+handed to can.send. Records go into a fixed-size ring preallocated as an
+array, so the trace does not grow with the traffic; once full the oldest
+records are overwritten (and counted). The timestamps themselves are not
+free: the default clock is time.monotonic_ns(), a long integer on
+CircuitPython, so every timestamp taken allocates a short-lived object.
+export() streams the records out later as text lines, over the serial
+console or to a file on the microSD card, for tools/can_latency.py to turn
+into per-ID latency histograms.
+
+Export line format (hex ID, decimal microseconds, 32-bit wrapping):
+    T,<id>,<flags>,<received>,<handler start>,<handler end>,<sent>
+flags bit 0 is set for RemoteTransmissionRequests, bit 1 when a reply was
+sent (otherwise <sent> is 0).
+"""
+
+import time
+from array import array
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+
+def _clock_us() -> int:
+    return time.monotonic_ns() // 1000
+
+
+class CANTrace:
+    # Fields of one record in the ring
+    FIELD_ID = 0
+    FIELD_FLAGS = 1
+    FIELD_RECEIVED = 2
+    FIELD_START = 3
+    FIELD_END = 4
+    FIELD_SENT = 5
+    NUM_FIELDS = 6
+
+    FLAG_RTR = 1
+    FLAG_REPLIED = 2
+
+    LINE_PREFIX = "T"
+    TIME_MASK = 0xffffffff
+
+    def __init__(self, size: int = 256, clock_us=None) -> None:
+        """A ring of size trace records.
+
+        Args:
+            size (int): records kept, the oldest are overwritten.
+            clock_us (function): microsecond time source, defaults to
+                time.monotonic_ns() in us.
+        """
+        self.size = size
+        self._ring = array("L", [0] * (size * self.NUM_FIELDS))
+        # Next record written, and number of unexported records
+        self._head = 0
+        self.count = 0
+        self.overwritten = 0
+        self.records = 0
+        self.clock_us = clock_us if clock_us else _clock_us
+
+    def record(self, message_id: int, rtr: bool, received: int, start: int,
+               end: int, sent: int = None) -> None:
+        """Adds a record; sent is None if there was no reply."""
+        _i = self._head * self.NUM_FIELDS
+        _ring = self._ring
+        _mask = self.TIME_MASK
+        _ring[_i + self.FIELD_ID] = message_id
+        _ring[_i + self.FIELD_FLAGS] = (
+            (self.FLAG_RTR if rtr else 0) |
+            (self.FLAG_REPLIED if sent is not None else 0))
+        _ring[_i + self.FIELD_RECEIVED] = received & _mask
+        _ring[_i + self.FIELD_START] = start & _mask
+        _ring[_i + self.FIELD_END] = end & _mask
+        _ring[_i + self.FIELD_SENT] = sent & _mask if sent is not None else 0
+        self._head += 1
+        if self._head == self.size:
+            self._head = 0
+        if self.count == self.size:
+            self.overwritten += 1
+        else:
+            self.count += 1
+        self.records += 1
+
+    def __len__(self) -> int:
+        return self.count
+
+    def clear(self) -> None:
+        self.count = 0
+
+    def export(self, stream, max_records: int = None) -> int:
+        """Writes up to max_records (all by default) of the oldest
+        unexported records to stream (anything with write(str), e.g. an
+        open file or sys.stdout) and removes them from the ring. Call it
+        with a small max_records from an iteration handler to spread the
+        output over several steps. Returns the number written."""
+        _n = self.count if max_records is None \
+            else min(max_records, self.count)
+        _first = self._head - self.count
+        if _first < 0:
+            _first += self.size
+        _ring = self._ring
+        for _k in range(_n):
+            _i = ((_first + _k) % self.size) * self.NUM_FIELDS
+            stream.write(
+                f"{self.LINE_PREFIX},{_ring[_i]:x},{_ring[_i + 1]},"
+                f"{_ring[_i + 2]},{_ring[_i + 3]},{_ring[_i + 4]},"
+                f"{_ring[_i + 5]}\n")
+        self.count -= _n
+        return _n
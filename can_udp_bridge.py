@@ -0,0 +1,230 @@
+"""CAN-over-UDP bridge on the carrier board WIZNET5K Ethernet interface.
+
+Frames from the robot bus are packed many to a UDP datagram using the
+cannelloni framing, so standard CAN-over-UDP tunnels (cannelloni on a pit
+laptop feeding a vcan/SocketCAN interface) can read them. Datagrams from the
+host are unpacked and their frames are sent onto the bus.
+
+Datagram layout (network byte order):
+    header:  version (B) op_code (B) sequence (B) frame count (H)
+    frames:  can_id (I) length (B) data (length bytes, none for RTRs)
+where can_id carries the SocketCAN flags: bit 31 extended, bit 30 RTR.
+"""
+
+import struct
+import time
+
+from backends.messages import Message, RemoteTransmissionRequest
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+
+def _clock_ms() -> int:
+    return time.monotonic_ns() // 1000000
+
+
+class CANUDPBridge:
+    # cannelloni framing
+    VERSION = 2
+    OP_DATA = 0
+    HEADER_FORMAT = ">BBBH"
+    HEADER_SIZE = 5
+    FRAME_HEADER_FORMAT = ">IB"
+    FRAME_HEADER_SIZE = 5
+    FRAME_MAX_SIZE = FRAME_HEADER_SIZE + 8
+
+    CAN_EFF_FLAG = 0x80000000
+    CAN_RTR_FLAG = 0x40000000
+    CAN_EFF_MASK = 0x1fffffff
+    CAN_SFF_MASK = 0x7ff
+
+    DEFAULT_PORT = 20000
+
+    # Fits an Ethernet MTU (1500 - IP/UDP headers)
+    MAX_DATAGRAM = 1472
+
+    def __init__(self, socket_pool, can=None, listener=None,
+                 local_port: int = DEFAULT_PORT, remote: tuple = None,
+                 max_frames: int = 64, max_latency_ms: int = 5,
+                 max_datagram: int = MAX_DATAGRAM, clock_ms=None) -> None:
+        """Bridges a CAN interface and a UDP peer.
+
+        Args:
+            socket_pool: object with socket(), AF_INET and SOCK_DGRAM, e.g.
+                adafruit_wiznet5k_socketpool.SocketPool(cb.eth) on the
+                board, or the CPython socket module on a host.
+            can (canio.CAN): where frames from the host are sent.
+            listener (canio.Listener): frames drained by step() and
+                forwarded. Leave None to only forward() frames explicitly
+                (e.g. from a CANHandler handler).
+            local_port (int): UDP port the bridge listens on.
+            remote (tuple): (ip, port) of the host. If None, the source of
+                the first datagram received is used.
+            max_frames (int): send a datagram once this many frames are
+                batched.
+            max_latency_ms (int): send a datagram once its oldest frame is
+                this old.
+            max_datagram (int): largest datagram sent.
+            clock_ms (function): time source, defaults to
+                time.monotonic_ns() in ms.
+        """
+        self.can = can
+        self.listener = listener
+        self.remote = remote
+        self.max_latency_ms = max_latency_ms
+        self._clock_ms = clock_ms if clock_ms else _clock_ms
+
+        self.socket = socket_pool.socket(socket_pool.AF_INET,
+                                         socket_pool.SOCK_DGRAM)
+        self.socket.bind(("", local_port))
+        self.socket.settimeout(0)
+
+        # The batch being built, header is written on send
+        self.max_frames = min(
+            max_frames,
+            (max_datagram - self.HEADER_SIZE) // self.FRAME_MAX_SIZE)
+        self._tx_buffer = bytearray(max_datagram)
+        self._tx_view = memoryview(self._tx_buffer)
+        self._tx_offset = self.HEADER_SIZE
+        self._tx_count = 0
+        self._tx_deadline = 0
+        self._tx_sequence = 0
+
+        self._rx_buffer = bytearray(max_datagram)
+        self._rx_view = memoryview(self._rx_buffer)
+
+        # Counters
+        self.frames_to_host = 0
+        self.frames_from_host = 0
+        self.datagrams_sent = 0
+        self.datagrams_received = 0
+        self.frames_dropped = 0
+        self.bad_datagrams = 0
+
+    def forward(self, message) -> None:
+        """Adds a canio Message or RemoteTransmissionRequest to the batch
+        headed for the host. Can be registered as a CANHandler handler
+        (e.g. register_unmatched_handler)."""
+        if self.remote is None:
+            # Nobody to send to yet
+            self.frames_dropped += 1
+            return
+        _can_id = message.id
+        if message.extended:
+            _can_id = (_can_id & self.CAN_EFF_MASK) | self.CAN_EFF_FLAG
+        else:
+            _can_id &= self.CAN_SFF_MASK
+        if hasattr(message, "data"):
+            _data = message.data
+            _length = len(_data)
+        else:
+            _can_id |= self.CAN_RTR_FLAG
+            _data = None
+            _length = message.length
+
+        _offset = self._tx_offset
+        struct.pack_into(self.FRAME_HEADER_FORMAT, self._tx_buffer, _offset,
+                         _can_id, _length)
+        _offset += self.FRAME_HEADER_SIZE
+        if _data is not None:
+            self._tx_buffer[_offset:_offset + _length] = _data
+            _offset += _length
+        self._tx_offset = _offset
+        if self._tx_count == 0:
+            self._tx_deadline = self._clock_ms() + self.max_latency_ms
+        self._tx_count += 1
+        self.frames_to_host += 1
+        if self._tx_count >= self.max_frames:
+            self.flush()
+
+    def flush(self) -> None:
+        """Sends the batched frames now."""
+        if self._tx_count == 0:
+            return
+        struct.pack_into(self.HEADER_FORMAT, self._tx_buffer, 0,
+                         self.VERSION, self.OP_DATA, self._tx_sequence,
+                         self._tx_count)
+        self.socket.sendto(self._tx_view[:self._tx_offset], self.remote)
+        self._tx_sequence = (self._tx_sequence + 1) & 0xff
+        self._tx_offset = self.HEADER_SIZE
+        self._tx_count = 0
+        self.datagrams_sent += 1
+
+    def _inject(self, nbytes: int) -> None:
+        _buffer = self._rx_buffer
+        if nbytes < self.HEADER_SIZE:
+            self.bad_datagrams += 1
+            return
+        _version, _op_code, _sequence, _count = struct.unpack_from(
+            self.HEADER_FORMAT, _buffer, 0)
+        if _version != self.VERSION or _op_code != self.OP_DATA:
+            self.bad_datagrams += 1
+            return
+        _offset = self.HEADER_SIZE
+        for _ in range(_count):
+            if _offset + self.FRAME_HEADER_SIZE > nbytes:
+                self.bad_datagrams += 1
+                return
+            _can_id, _length = struct.unpack_from(
+                self.FRAME_HEADER_FORMAT, _buffer, _offset)
+            _offset += self.FRAME_HEADER_SIZE
+            if _length > 8:
+                # Not a classic CAN frame (or garbage): canio would raise
+                self.bad_datagrams += 1
+                return
+            _extended = bool(_can_id & self.CAN_EFF_FLAG)
+            _id = _can_id & (self.CAN_EFF_MASK if _extended
+                             else self.CAN_SFF_MASK)
+            if _can_id & self.CAN_RTR_FLAG:
+                _message = RemoteTransmissionRequest(
+                    id=_id, length=_length, extended=_extended)
+            else:
+                if _offset + _length > nbytes:
+                    self.bad_datagrams += 1
+                    return
+                _message = Message(
+                    id=_id, data=bytes(_buffer[_offset:_offset + _length]),
+                    extended=_extended)
+                _offset += _length
+            if self.can is not None:
+                self.can.send(_message)
+            self.frames_from_host += 1
+
+    def poll_host(self) -> None:
+        """Receives every waiting datagram from the host and sends its
+        frames onto the bus."""
+        while True:
+            try:
+                _nbytes, _address = self.socket.recvfrom_into(
+                    self._rx_view)
+            except OSError:
+                # Nothing waiting (EAGAIN on a non-blocking socket)
+                return
+            if not _nbytes:
+                return
+            if self.remote is None:
+                self.remote = _address
+            self.datagrams_received += 1
+            self._inject(_nbytes)
+
+    def step(self):
+        """Drains the listener into the batch, sends the batch if its
+        deadline passed and injects frames from the host. Returns None so
+        it can be registered as a CANHandler iteration handler."""
+        _listener = self.listener
+        if _listener is not None:
+            for _ in range(self.max_frames):
+                if not _listener.in_waiting():
+                    break
+                self.forward(_listener.receive())
+
+        if self._tx_count and self._clock_ms() >= self._tx_deadline:
+            self.flush()
+
+        self.poll_host()
+        return None
+
+    def close(self) -> None:
+        self.flush()
+        self.socket.close()
@@ -0,0 +1,192 @@
+"""Scheduled access to the I2C sensors behind the carrier board TCA9548A /
+PCA9546A I2C multiplexer.
+
+The channel currently selected on the mux is cached, so consecutive
+accesses on the same channel skip the select write. Sensor polls are
+registered with a period (e.g. a ToF timing budget), and each step() runs
+the polls that are due grouped by channel, in round-robin order, within a
+time budget. A mux that stops responding is recovered with a hardware
+reset.
+"""
+
+import time
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+
+def _clock_ms() -> int:
+    return time.monotonic_ns() // 1000000
+
+
+class MuxChannel:
+    def __init__(self, scheduler, channel: int) -> None:
+        """A busio.I2C look-alike for one mux channel. Hand it to sensor
+        drivers (e.g. adafruit_vl53l4cd.VL53L4CD) in place of the
+        adafruit_tca9548a channel object; the channel is only selected
+        when the mux is not already on it."""
+        self.scheduler = scheduler
+        self.channel = channel
+
+    def try_lock(self) -> bool:
+        if not self.scheduler.i2c.try_lock():
+            return False
+        try:
+            self.scheduler._select(self.channel)
+        except OSError:
+            self.scheduler.i2c.unlock()
+            raise
+        return True
+
+    def unlock(self) -> None:
+        self.scheduler.i2c.unlock()
+
+    def readfrom_into(self, address: int, buffer, **kwargs) -> None:
+        self.scheduler.i2c.readfrom_into(address, buffer, **kwargs)
+
+    def writeto(self, address: int, buffer, **kwargs) -> None:
+        self.scheduler.i2c.writeto(address, buffer, **kwargs)
+
+    def writeto_then_readfrom(self, address: int, buffer_out, buffer_in,
+                              **kwargs) -> None:
+        self.scheduler.i2c.writeto_then_readfrom(address, buffer_out,
+                                                 buffer_in, **kwargs)
+
+    def scan(self) -> list:
+        return [_address for _address in self.scheduler.i2c.scan()
+                if _address != self.scheduler.address]
+
+    def probe(self, address: int) -> bool:
+        return address in self.scan()
+
+
+class _Task:
+    def __init__(self, name, channel, function, period_ms) -> None:
+        self.name = name
+        self.channel = channel
+        self.function = function
+        self.period_ms = period_ms
+        self.due = 0
+        self.runs = 0
+        self.errors = 0
+        self.max_us = 0
+
+
+class I2CMuxScheduler:
+    DEFAULT_ADDRESS = 0x70
+
+    def __init__(self, i2c, address: int = DEFAULT_ADDRESS,
+                 num_channels: int = 8, reset=None,
+                 step_budget_us: int = 2000, max_errors: int = 3,
+                 clock_ms=None) -> None:
+        """Schedules sensor polls across the channels of an I2C mux.
+
+        Args:
+            i2c (busio.I2C): the bus the mux is on.
+            address (int): I2C address of the mux.
+            num_channels (int): 8 for a TCA9548A, 4 for a PCA9546A.
+            reset (function): called to hardware reset a stuck mux, e.g.
+                CarrierBoard.reset_i2c_mux.
+            step_budget_us (int): step() stops starting new polls once
+                this much time was spent (at least one poll runs).
+            max_errors (int): consecutive I2C errors before the mux is
+                reset.
+            clock_ms (function): time source, defaults to
+                time.monotonic_ns() in ms.
+        """
+        self.i2c = i2c
+        self.address = address
+        self.num_channels = num_channels
+        self.reset_function = reset
+        self.step_budget_us = step_budget_us
+        self.max_errors = max_errors
+        self._clock_ms = clock_ms if clock_ms else _clock_ms
+
+        # None means unknown (after a reset or an error), forcing a select
+        self.current_channel = None
+        self._select_buffer = bytearray(1)
+        self.channels = [MuxChannel(self, _c) for _c in range(num_channels)]
+
+        self._tasks = []
+        self._next_index = 0
+        self._consecutive_errors = 0
+
+        # Counters
+        self.selects = 0
+        self.selects_skipped = 0
+        self.resets = 0
+
+    def __getitem__(self, channel: int) -> MuxChannel:
+        return self.channels[channel]
+
+    def _select(self, channel: int) -> None:
+        """Selects channel on the mux. The bus must be locked."""
+        if channel == self.current_channel:
+            self.selects_skipped += 1
+            return
+        self._select_buffer[0] = 1 << channel
+        self.current_channel = None
+        self.i2c.writeto(self.address, self._select_buffer)
+        self.current_channel = channel
+        self.selects += 1
+
+    def add(self, channel: int, function, period_ms: int,
+            name: str = None) -> None:
+        """Registers function (no arguments) to be called every period_ms,
+        with the mux on channel. Use the sensor's measurement period, e.g.
+        its timing budget, so it is polled as soon as new data exists."""
+        self._tasks.append(_Task(name, channel, function, period_ms))
+        # Keep tasks grouped by channel so a step walks channels in order
+        self._tasks.sort(key=lambda _task: _task.channel)
+
+    def reset(self) -> None:
+        """Hardware resets the mux and forgets the selected channel."""
+        if self.reset_function:
+            self.reset_function()
+        self.current_channel = None
+        self._consecutive_errors = 0
+        self.resets += 1
+
+    def step(self) -> int:
+        """Runs the polls that are due, starting where the previous step
+        stopped (round-robin) so every sensor gets its turn. Returns the
+        number of polls run."""
+        _tasks = self._tasks
+        _num_tasks = len(_tasks)
+        if not _num_tasks:
+            return 0
+        _now = self._clock_ms()
+        _start_ns = time.monotonic_ns()
+        _budget_ns = self.step_budget_us * 1000
+        _runs = 0
+        _index = self._next_index
+        for _ in range(_num_tasks):
+            _task = _tasks[_index]
+            _index = (_index + 1) % _num_tasks
+            if _now - _task.due < 0:
+                continue
+            _task_start = time.monotonic_ns()
+            try:
+                _task.function()
+                self._consecutive_errors = 0
+            except OSError:
+                _task.errors += 1
+                self._consecutive_errors += 1
+                self.current_channel = None
+                if self._consecutive_errors >= self.max_errors:
+                    self.reset()
+            _elapsed_us = (time.monotonic_ns() - _task_start) // 1000
+            if _elapsed_us > _task.max_us:
+                _task.max_us = _elapsed_us
+            _task.runs += 1
+            _task.due = _now + _task.period_ms
+            _runs += 1
+            if time.monotonic_ns() - _start_ns >= _budget_ns:
+                break
+        self._next_index = _index
+        return _runs
+
+    def stats(self) -> list:
+        """(name, channel, runs, errors, max_us) for every task."""
+        return [(_t.name, _t.channel, _t.runs, _t.errors, _t.max_us)
+                for _t in self._tasks]
@@ -0,0 +1,53 @@
+"""Sampling of all the configured DIOs and AINs of a carrier board with one
+call, shared by the carrier boards' init_sample()/sample().
+
+setup_sample() stores what sample() reads on the board object:
+    _sample_dios: (bit, pin) of every configured DIO
+    _sample_ains: (slot, pin) of every configured AIN
+    sample_dio: the DIO bitmask of the last sample, bit N is dioN
+    sample_ain: array('H') with one slot per AIN, unconfigured AINs read 0
+"""
+
+from array import array
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+
+def setup_sample(board, dios, ains) -> None:
+    """(Re)builds the lists of configured inputs of board. dios and ains
+    are all of the board's DIO and AIN pin objects in order, None for the
+    ones not configured."""
+    board._sample_dios = [
+        (1 << _i, dios[_i]) for _i in range(len(dios))
+        if dios[_i] is not None
+    ]
+    board._sample_ains = [
+        (_i, ains[_i]) for _i in range(len(ains))
+        if ains[_i] is not None
+    ]
+    board.sample_dio = 0
+    board.sample_ain = array("H", [0] * len(ains))
+
+
+def read_sample(board, oversample: int = 1) -> int:
+    """Reads every configured DIO of board into one bitmask and every
+    configured AIN into the preallocated board.sample_ain. Each AIN is
+    read oversample times and averaged. Returns the DIO bitmask, also kept
+    in board.sample_dio."""
+    _dio = 0
+    for _bit, _pin in board._sample_dios:
+        if _pin.value:
+            _dio |= _bit
+    board.sample_dio = _dio
+
+    _values = board.sample_ain
+    for _i, _ain in board._sample_ains:
+        if oversample > 1:
+            _total = 0
+            for _ in range(oversample):
+                _total += _ain.value
+            _values[_i] = _total // oversample
+        else:
+            _values[_i] = _ain.value
+    return _dio
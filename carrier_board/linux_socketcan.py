@@ -0,0 +1,52 @@
+"""Support for Linux coprocessors (Raspberry Pi, Orange Pi, ...) with a
+SocketCAN interface on the robot CAN bus.
+
+Only the CAN interface is provided; it takes the same init_can
+configuration as the other carrier boards, plus the interface name:
+
+    cb = CarrierBoard({"init_can": {"channel": "can0",
+                                    "listener_match_list": [...]}})
+"""
+
+from backends.socketcan import CAN
+from backends.virtual_can import Message
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+
+class CarrierBoard:
+    # The Message class of the CAN interface, CANHandler and the modules
+    # registered with it build frames with it
+    Message = Message
+
+    def __init__(self, configuration: dict = {}) -> None:
+        self.config = configuration
+
+        # configure CAN interface, it self.config enables it..
+        if "init_can" in self.config and self.config["init_can"]:
+            self.init_can()
+        else:
+            self.can = None
+
+    def init_can(self):
+        _config = self.config["init_can"]
+        if not isinstance(_config, dict):
+            _config = {}
+
+        _channel = _config["channel"] if "channel" in _config else "can0"
+        _loopback = _config["loopback"] if "loopback" in _config else False
+        _batch = _config["batch"] if "batch" in _config else 64
+        _listener_match_list = (
+            _config["listener_match_list"]
+            if "listener_match_list" in _config
+            else None
+        )
+        _timeout = _config["timeout"] if "timeout" in _config else 0.1
+
+        # Bit rate and listen-only mode are set on the interface (ip link),
+        # not here
+        print(f"INFO: Starting SocketCAN with: {_channel=} {_loopback=}")
+        self.can = CAN(_channel, loopback=_loopback, batch=_batch)
+        self.listener = self.can.listen(matches=_listener_match_list,
+                                        timeout=_timeout)
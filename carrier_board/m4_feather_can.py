@@ -6,9 +6,10 @@ import board
 import busio
 import analogio
 import digitalio
+from carrier_board.io_sample import setup_sample, read_sample
 
 # For use with the M4 Feather CAN Express's built-in CAN..
-from canio import CAN
+from canio import CAN, Message
 # from canio import BusState, Message, RemoteTransmissionRequest
 
 # For use with the Ethernet FeatherWing socket..
@@ -34,6 +35,10 @@ class CarrierBoard:
     5V supply, 4 buffered AINs (3.3V), and 3 STEMMA QT/Qwiic
     connectors. A NEOPIXEL status LED is also provided."""
 
+    # The Message class of the CAN interface, CANHandler and the modules
+    # registered with it build frames with it
+    Message = Message
+
     # Neopixel interface
     NEOPIXEL_IF = board.D4
 
@@ -86,6 +91,8 @@ class CarrierBoard:
                 brightness=0.3,
                 auto_write=False
             )
+            # The color currently shown, used to skip redundant show()s
+            self.color = None
 
         def off(self) -> None:
             self.set_color(self.OFF)
@@ -94,8 +101,11 @@ class CarrierBoard:
             self.set_color(color)
 
         def set_color(self, color) -> None:
+            if color == self.color:
+                return
             self.neopixel_status.fill(color)
             self.neopixel_status.show()
+            self.color = color
 
     def __init__(self, configuration: dict = {}) -> None:
         # make sure running on a Feather M4 CAN, if not complain
@@ -156,12 +166,24 @@ class CarrierBoard:
         # enables it
         if "init_ain0" in self.config and self.config["init_ain0"]:
             self.ain0 = analogio.AnalogIn(self.AI0)
+        else:
+            self.ain0 = None
         if "init_ain1" in self.config and self.config["init_ain1"]:
             self.ain1 = analogio.AnalogIn(self.AI1)
+        else:
+            self.ain1 = None
         if "init_ain2" in self.config and self.config["init_ain2"]:
             self.ain2 = analogio.AnalogIn(self.AI2)
+        else:
+            self.ain2 = None
         if "init_ain3" in self.config and self.config["init_ain3"]:
             self.ain3 = analogio.AnalogIn(self.AI3)
+        else:
+            self.ain3 = None
+
+        # Build the tables used by sample() so each call only walks the
+        # configured I/Os
+        self.init_sample()
 
         # Configure the neopixel interface on, if self.config
         # enables it
@@ -207,6 +229,7 @@ class CarrierBoard:
                 self.dio2 = self.init_dio("init_dio2", self.DIO2)
             if self.dio3 is None:
                 self.dio3 = self.init_dio("init_dio3", self.DIO3)
+            self.init_sample()
 
     def init_dio(self, keyname, pin):
         if keyname in self.config and self.config[keyname]:
@@ -240,6 +263,23 @@ class CarrierBoard:
             _pin = None
         return _pin
 
+    def init_sample(self) -> None:
+        """(Re)builds the list of configured DIOs and AINs that sample()
+        reads. Call it again after enabling DIOs later on (for example
+        via enable_level_shifter(init_dios=True))."""
+        setup_sample(self, (self.dio0, self.dio1, self.dio2, self.dio3),
+                     (self.ain0, self.ain1, self.ain2, self.ain3))
+
+    def sample(self, oversample: int = 1) -> int:
+        """Reads every configured DIO into one bitmask (bit N is dioN) and
+        every configured AIN into the preallocated self.sample_ain
+        array('H') (slot N is ainN). Each AIN is read oversample times and
+        averaged.
+        :param int oversample: number of ADC reads averaged per AIN.
+        :return: the DIO bitmask, also kept in self.sample_dio
+        """
+        return read_sample(self, oversample)
+
     def init_can(self):
         # Before creating the canio.CAN interace, check for optional
         # features
@@ -0,0 +1,213 @@
+"""Batched channel updates for the PCA9685 PWM generators on the carrier
+board.
+
+Channel changes are collected in a shadow register image and written by
+commit(). Channels whose registers did not change are skipped and runs of
+contiguous channels are written with the PCA9685 register auto-increment
+in one I2C transaction, instead of one transaction per channel.
+"""
+
+import time
+from adafruit_bus_device.i2c_device import I2CDevice
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+
+class PCA9685Batch:
+    # Registers
+    _MODE1 = 0x00
+    _LED0_ON_L = 0x06
+    _PRESCALE = 0xfe
+
+    # MODE1 bits
+    _MODE1_RESTART = 0x80
+    _MODE1_AI = 0x20
+    _MODE1_SLEEP = 0x10
+
+    # Full on/off bit in LEDn_ON_H/LEDn_OFF_H
+    _FULL = 0x10
+
+    NUM_CHANNELS = 16
+    _REGS_PER_CHANNEL = 4
+
+    OSCILLATOR_FREQUENCY = 25000000
+
+    def __init__(self, i2c, address: int = 0x40, frequency: int = 50,
+                 merge_gap: int = 1) -> None:
+        """PCA9685 with batched writes.
+
+        Args:
+            i2c (busio.I2C): the bus the PCA9685 is on.
+            address (int): I2C address of the PCA9685.
+            frequency (int): PWM frequency, 50 Hz for servos.
+            merge_gap (int): unchanged channels between two changed ones
+                that are rewritten to join both runs into one transaction.
+                Rewriting a channel is 4 bytes, cheaper than starting a new
+                transaction.
+        """
+        self.i2c_device = I2CDevice(i2c, address)
+        self.merge_gap = merge_gap
+
+        _size = self.NUM_CHANNELS * self._REGS_PER_CHANNEL
+        # What the chip holds, and what it should hold after commit().
+        # Both are read back from the chip once auto-increment is on
+        self._shadow = bytearray(_size)
+        self._pending = bytearray(_size)
+        self._dirty = 0
+
+        # One transaction buffer big enough for all channels plus the
+        # register address
+        self._buffer = bytearray(1 + _size)
+        self._reg = bytearray(2)
+
+        # I2C timing of the last and worst commit(), in us
+        self.last_i2c_us = 0
+        self.max_i2c_us = 0
+        self.transactions = 0
+
+        self.frequency = frequency
+        self._read_channels()
+
+    def _write_reg(self, reg: int, value: int) -> None:
+        self._reg[0] = reg
+        self._reg[1] = value
+        with self.i2c_device as _i2c:
+            _i2c.write(self._reg)
+
+    def _read_reg(self, reg: int) -> int:
+        self._reg[0] = reg
+        with self.i2c_device as _i2c:
+            _i2c.write_then_readinto(self._reg, self._reg, out_end=1,
+                                     in_start=1)
+        return self._reg[1]
+
+    def _read_channels(self) -> None:
+        """Loads the shadow with what the chip holds, all channels full off
+        after power-up, or whatever a previous program left, so commit()
+        skips only what really is unchanged."""
+        self._buffer[0] = self._LED0_ON_L
+        with self.i2c_device as _i2c:
+            _i2c.write_then_readinto(self._buffer, self._shadow, out_end=1)
+        self._pending[:] = self._shadow
+        self._dirty = 0
+
+    @property
+    def frequency(self) -> int:
+        return self._frequency
+
+    @frequency.setter
+    def frequency(self, value: int) -> None:
+        _prescale = int(self.OSCILLATOR_FREQUENCY / 4096.0 / value + 0.5) - 1
+        if _prescale < 3:
+            raise ValueError("PCA9685 cannot output at the given frequency")
+        _mode1 = self._read_reg(self._MODE1) & ~self._MODE1_RESTART
+        # The prescaler can only be changed while asleep
+        self._write_reg(self._MODE1, (_mode1 & 0x7f) | self._MODE1_SLEEP)
+        self._write_reg(self._PRESCALE, _prescale)
+        self._write_reg(self._MODE1, _mode1 & ~self._MODE1_SLEEP)
+        time.sleep(0.005)
+        # Restart and make sure register auto-increment is on
+        self._write_reg(self._MODE1, (_mode1 & ~self._MODE1_SLEEP) |
+                        self._MODE1_RESTART | self._MODE1_AI)
+        self._frequency = value
+
+    def _set_registers(self, channel: int, on: int, off: int) -> None:
+        _i = channel * self._REGS_PER_CHANNEL
+        _pending = self._pending
+        _pending[_i] = on & 0xff
+        _pending[_i + 1] = on >> 8
+        _pending[_i + 2] = off & 0xff
+        _pending[_i + 3] = off >> 8
+        _shadow = self._shadow
+        if (_shadow[_i] != _pending[_i] or
+                _shadow[_i + 1] != _pending[_i + 1] or
+                _shadow[_i + 2] != _pending[_i + 2] or
+                _shadow[_i + 3] != _pending[_i + 3]):
+            self._dirty |= 1 << channel
+        else:
+            self._dirty &= ~(1 << channel)
+
+    def set_duty_cycle(self, channel: int, duty_cycle: int) -> None:
+        """Queues a 16-bit duty cycle (0-0xffff) for channel, like
+        adafruit_pca9685 PWMChannel.duty_cycle."""
+        if duty_cycle >= 0xffff:
+            self._set_registers(channel, self._FULL << 8, 0)
+        elif duty_cycle <= 0:
+            self._set_registers(channel, 0, self._FULL << 8)
+        else:
+            self._set_registers(channel, 0, duty_cycle >> 4)
+
+    def set_pulse_width(self, channel: int, pulse_us: float) -> None:
+        """Queues a pulse width in microseconds for channel."""
+        _counts = int(pulse_us * self._frequency * 4096 / 1000000)
+        self._set_registers(channel, 0, max(0, min(_counts, 4095)))
+
+    def set_angle(self, channel: int, angle: float,
+                  actuation_range: float = 180, min_pulse: int = 750,
+                  max_pulse: int = 2250) -> None:
+        """Queues a servo angle for channel, using the same defaults as
+        adafruit_motor.servo.Servo (and ServoKit)."""
+        _fraction = max(0.0, min(angle / actuation_range, 1.0))
+        self.set_pulse_width(channel,
+                             min_pulse + _fraction * (max_pulse - min_pulse))
+
+    def set_throttle(self, channel: int, throttle: float) -> None:
+        """Queues a continuous rotation/motor controller throttle
+        (-1.0..1.0) for channel."""
+        self.set_angle(channel, (throttle + 1) * 90)
+
+    @property
+    def dirty(self) -> int:
+        """Bitmask of channels waiting for commit()."""
+        return self._dirty
+
+    def commit(self) -> int:
+        """Writes every changed channel. Contiguous changed channels (with
+        up to merge_gap unchanged channels between them) go out in one
+        auto-increment transaction. Returns the number of transactions."""
+        _dirty = self._dirty
+        if not _dirty:
+            self.last_i2c_us = 0
+            return 0
+        _start_time = time.monotonic_ns()
+        _transactions = 0
+        _channel = 0
+        _num = self.NUM_CHANNELS
+        while _channel < _num:
+            if not _dirty & (1 << _channel):
+                _channel += 1
+                continue
+            # Grow the run while the next dirty channel is close enough
+            _first = _channel
+            _last = _channel
+            _next = _channel + 1
+            while _next < _num and _next - _last <= self.merge_gap + 1:
+                if _dirty & (1 << _next):
+                    _last = _next
+                _next += 1
+            self._write_run(_first, _last)
+            _transactions += 1
+            _channel = _last + 1
+        self._dirty = 0
+
+        self.last_i2c_us = (time.monotonic_ns() - _start_time) // 1000
+        if self.last_i2c_us > self.max_i2c_us:
+            self.max_i2c_us = self.last_i2c_us
+        self.transactions += _transactions
+        return _transactions
+
+    def _write_run(self, first: int, last: int) -> None:
+        _start = first * self._REGS_PER_CHANNEL
+        _end = (last + 1) * self._REGS_PER_CHANNEL
+        _buffer = self._buffer
+        _buffer[0] = self._LED0_ON_L + _start
+        _buffer[1:1 + _end - _start] = self._pending[_start:_end]
+        with self.i2c_device as _i2c:
+            _i2c.write(_buffer, end=1 + _end - _start)
+        self._shadow[_start:_end] = self._pending[_start:_end]
+
+    def refresh(self) -> None:
+        """Marks every channel changed so the next commit() rewrites the
+        whole chip (e.g. after a generator reset)."""
+        self._dirty = (1 << self.NUM_CHANNELS) - 1
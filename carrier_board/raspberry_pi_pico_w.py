@@ -2,14 +2,17 @@
 Pi Pico W board.
 """
 
+import time
 import board
 import busio
 import analogio
 import digitalio
+from carrier_board.io_sample import setup_sample, read_sample
 
 # For use with the Picobell CAN..
 # from adafruit_mcp2515 import canio
 from adafruit_mcp2515 import MCP2515 as CAN
+from adafruit_mcp2515.canio import Message
 
 # For use with the Ethernet FeatherWing socket..
 # import adafruit_connection_manager
@@ -19,10 +22,12 @@ from adafruit_wiznet5k.adafruit_wiznet5k import WIZNET5K
 # Board resources..
 # I2C multiplexer IC
 import adafruit_tca9548a
+from carrier_board.i2c_mux_scheduler import I2CMuxScheduler
 
 # PWM generators
 import adafruit_pca9685
 from adafruit_servokit import ServoKit
+from carrier_board.pca9685_batch import PCA9685Batch
 
 # For use with the MicroSD card socket..
 import sdcardio
@@ -42,6 +47,10 @@ class CarrierBoard:
     5V supply, 4 buffered AINs (3.3V), and 3 STEMMA QT/Qwiic
     connectors. A NEOPIXEL status LED is also provided."""
 
+    # The Message class of the CAN interface, CANHandler and the modules
+    # registered with it build frames with it
+    Message = Message
+
     # board-level resources..
 
     # Pin definitions used for the two NEOPIXEL interfaces.
@@ -246,7 +255,25 @@ class CarrierBoard:
             self.mux_resetn.value = True
 
             self._mux_i2c = busio.I2C(self._I2CMUX_SCL, self._I2CMUX_SDA)
-            self._i2cmux = adafruit_tca9548a.PCA9546A(self._mux_i2c)
+
+            # With "scheduled": True the I2Cx channels come from an
+            # I2CMuxScheduler, which caches the selected channel and can
+            # schedule sensor polls, instead of adafruit_tca9548a
+            _scheduled = (
+                isinstance(self.config["include_i2c_mux"], dict)
+                and "scheduled" in self.config["include_i2c_mux"]
+                and self.config["include_i2c_mux"]["scheduled"]
+            )
+            if _scheduled:
+                self.i2c_mux_scheduler = I2CMuxScheduler(
+                    self._mux_i2c,
+                    num_channels=4,
+                    reset=self.reset_i2c_mux
+                )
+                self._i2cmux = self.i2c_mux_scheduler
+            else:
+                self.i2c_mux_scheduler = None
+                self._i2cmux = adafruit_tca9548a.PCA9546A(self._mux_i2c)
 
             self.I2C0 = (
                 self._i2cmux[0]
@@ -449,6 +476,11 @@ class CarrierBoard:
             self.ls_oe_pin.value = True
             self.level_shifter_enabled = True
 
+        self.pwm = None
+        self.motor = None
+        self._pwm_oen = None
+        self._motor_oen = None
+        self.last_i2c_us = 0
         if "include_pwm_generators" in self.config and \
                 self.config["include_pwm_generators"]:
             print("Enabling PWM generator (PWM or Motor)")
@@ -457,6 +489,14 @@ class CarrierBoard:
             # create a PCA9685 instance
             self._pwm_i2c = busio.I2C(self._PWM_SCL, self._PWM_SDA)
 
+            # Batched updates collect channel changes and write them with
+            # commit_outputs() instead of one I2C transaction per channel
+            _batch_updates = (
+                self.config["include_pwm_generators"]["batch_updates"]
+                if "batch_updates" in self.config["include_pwm_generators"]
+                else False
+            )
+
             # Pull PWM generator IC output enable pin HIGH so that it will
             # not generate signals until enabled (LOW).
             self._pwm_oen = digitalio.DigitalInOut(self._PWM_OEN)
@@ -477,19 +517,39 @@ class CarrierBoard:
             ):
                 self._pwm_oen.value = False
                 print("Enabling PWM generator")
-                self.pwm = ServoKit(
-                    channels=8,
-                    i2c=self._pwm_i2c,
-                    address=self._SERVO_PWM_GENERATOR_I2C_ADDR
-                )
+                if _batch_updates:
+                    self.pwm = PCA9685Batch(
+                        self._pwm_i2c,
+                        address=self._SERVO_PWM_GENERATOR_I2C_ADDR
+                    )
+                else:
+                    self.pwm = ServoKit(
+                        channels=8,
+                        i2c=self._pwm_i2c,
+                        address=self._SERVO_PWM_GENERATOR_I2C_ADDR
+                    )
                 print("..done")
 
-            if "enable_motor_interface" in self.config and \
-                    self.config["enable_motor_interface"]:
-                self._pwm_motor.value = False
+            if (
+                "enable_motor_interface"
+                in self.config["include_pwm_generators"]
+                and self.config["include_pwm_generators"][
+                    "enable_motor_interface"
+                ]
+            ):
+                self._motor_oen.value = False
                 print("Enabling motor generator")
+                if _batch_updates:
+                    self.motor = PCA9685Batch(
+                        self._pwm_i2c,
+                        address=self._MOTOR_PWM_GENERATOR_I2C_ADDR
+                    )
                 print("..done")
 
+        # Build the tables used by sample() so each call only walks the
+        # configured I/Os
+        self.init_sample()
+
         # Configure the neopixel interface on, if self.config
         # enables it
         if "init_neopixel" in self.config and self.config["init_neopixel"]:
@@ -509,6 +569,23 @@ class CarrierBoard:
 
         self.status.on()
 
+    def init_sample(self) -> None:
+        """(Re)builds the list of configured DIOs and ADCs that sample()
+        reads."""
+        setup_sample(self, (self.dio0, self.dio1, self.dio2, self.dio3,
+                            self.dio4, self.dio5, self.dio6, self.dio7),
+                     (self.adc0, self.adc1))
+
+    def sample(self, oversample: int = 1) -> int:
+        """Reads every configured DIO into one bitmask (bit N is dioN) and
+        every configured ADC into the preallocated self.sample_ain
+        array('H') (slot N is adcN). Each ADC is read oversample times and
+        averaged.
+        :param int oversample: number of ADC reads averaged per input.
+        :return: the DIO bitmask, also kept in self.sample_dio
+        """
+        return read_sample(self, oversample)
+
     def init_neopixel_strip(self, num_pixels_in_strip) -> None:
         self.num_pixels_in_strip = num_pixels_in_strip
         self.neopixel_strip = neopixel.NeoPixel(
@@ -522,18 +599,36 @@ class CarrierBoard:
         self.neopixel_strip.show()
 
     def reset_i2c_mux(self) -> None:
-        self.mux_resetn = False
-        # A delay here is likely good...
-        self.mux_resetn = True
+        """Pulses the I2C mux reset pin (active low). The TCA9548A needs
+        the reset held for at least 500 ns, 1 ms is plenty."""
+        self.mux_resetn.value = False
+        time.sleep(0.001)
+        self.mux_resetn.value = True
+
+    def commit_outputs(self) -> int:
+        """Writes the pending channel changes of the batched PWM and motor
+        generators (config "batch_updates"). Returns the I2C time spent,
+        in us."""
+        _i2c_us = 0
+        for _generator in (self.pwm, self.motor):
+            if isinstance(_generator, PCA9685Batch):
+                _generator.commit()
+                _i2c_us += _generator.last_i2c_us
+        self.last_i2c_us = _i2c_us
+        return _i2c_us
 
     def disable_pwm(self) -> None:
-        self._pwm_oen.value = True
+        # Safe to call without PWM generators, e.g. from a CANHandler
+        # safety handler
+        if self._pwm_oen:
+            self._pwm_oen.value = True
 
     def enable_pwm(self):
         self._pwm_oen.value = False
 
     def disable_motor(self) -> None:
-        self._motor_oen.value = True
+        if self._motor_oen:
+            self._motor_oen.value = True
 
     def enable_motor(self) -> None:
         self._motor_oen.value = False
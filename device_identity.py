@@ -0,0 +1,149 @@
+"""Answers the FRC broadcast ENUMERATE and DEVICE_QUERY messages with the
+device's identity, so a host can inventory the bus with one broadcast (see
+tools/can_discover.py) instead of probing IDs one by one.
+
+The reply is a frame in the device's own ID space (its device type,
+manufacturer and device number) with the IDENTITY_API API, carrying the
+firmware version and a serial number. Rather than everybody answering at
+once, each device waits for a response slot picked by hashing its
+device_number (and type and manufacturer) with the round number of the
+request, which spreads 40+ replies over a window of SLOTS * SLOT_MS ms. A
+host that sees two devices share a slot can ask again with another round.
+
+Request payload (both APIs, every byte optional):
+    [0] round, reshuffles the slots
+    [1] device type, DEVICE_QUERY only: only this type answers
+    [2] manufacturer, DEVICE_QUERY only: only this manufacturer answers
+0xff (or a missing byte) matches any device type or manufacturer.
+"""
+
+import time
+from ids.msg_format import FRCCANDevice
+from ids.payload_format import PayloadFormat, Signal
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+
+def _clock_ms() -> int:
+    return time.monotonic_ns() // 1000000
+
+
+# The broadcast request IDs (device type, manufacturer and device number 0)
+ENUMERATE_ID = FRCCANDevice(
+    api=FRCCANDevice.API_CLASS_BROADCAST_ENUMERATE).message_id
+DEVICE_QUERY_ID = FRCCANDevice(
+    api=FRCCANDevice.API_CLASS_BROADCAST_DEVICE_QUERY).message_id
+
+# Matches any device type or manufacturer in a DEVICE_QUERY
+ANY = 0xff
+
+# Number of response slots and their length
+SLOTS = 32
+SLOT_MS = 4
+
+# API of the identity reply, the last API of the device's ID space
+IDENTITY_API = FRCCANDevice.API_MASK
+
+IDENTITY_PAYLOAD = PayloadFormat([
+    Signal("major"),
+    Signal("minor"),
+    Signal("patch"),
+    Signal("round"),
+    Signal("serial", "uint32"),
+])
+
+
+def response_slot(device_type: int, manufacturer: int, device_number: int,
+                  round_number: int = 0, slots: int = SLOTS) -> int:
+    """The slot a device answers in. A multiplicative hash, so neighbouring
+    device numbers land far apart and every round reshuffles them."""
+    _h = (device_number * 2654435761 + device_type * 40503 +
+          manufacturer * 9973 + round_number * 7919) & 0xffffffff
+    return (_h >> 16) % slots
+
+
+class DeviceIdentity:
+    def __init__(self, device_type: int, manufacturer: int,
+                 device_number: int, firmware_version: tuple = (0, 0, 0),
+                 serial: int = 0, slots: int = SLOTS,
+                 slot_ms: int = SLOT_MS, clock_ms=None) -> None:
+        """Identity of a device and its ENUMERATE/DEVICE_QUERY responder.
+
+        Args:
+            device_type (int): FRCCANDevice.DEVICE_TYPE_* of the device.
+            manufacturer (int): FRCCANDevice.MANUF_* of the device.
+            device_number (int): device number, 0 to 63.
+            firmware_version (tuple): (major, minor, patch).
+            serial (int): 32-bit serial number, e.g. from
+                microcontroller.cpu.uid, tells apart devices configured
+                with the same ID.
+            slots (int): number of response slots.
+            slot_ms (int): length of a response slot.
+            clock_ms (function): time source, defaults to
+                time.monotonic_ns() in ms.
+        """
+        self.device_type = device_type
+        self.manufacturer = manufacturer
+        self.device_number = device_number
+        self.firmware_version = firmware_version
+        self.serial = serial
+        self.slots = slots
+        self.slot_ms = slot_ms
+        self._clock_ms = clock_ms if clock_ms else _clock_ms
+        self.reply_id = FRCCANDevice(
+            device_type=device_type, manufacturer=manufacturer,
+            api=IDENTITY_API, device_number=device_number).message_id
+
+        # Time the pending reply is due, None if there is none
+        self._due = None
+        self._round = 0
+        self.requests = 0
+        self.replies = 0
+        # The CANHandler's Message class, set by register()
+        self.Message = None
+
+    def register(self, can_handler) -> None:
+        """Registers the request handlers and the reply iteration handler
+        with a CANHandler. Call it after register_iteration_handler(),
+        which replaces the iteration handlers. The carrier board's
+        listener_match_list must let ENUMERATE_ID and DEVICE_QUERY_ID
+        through."""
+        self.Message = can_handler.Message
+        can_handler.register_msg_handler(ENUMERATE_ID, self.enumerate)
+        can_handler.register_msg_handler(DEVICE_QUERY_ID, self.device_query)
+        can_handler.add_iteration_handler(self.step)
+
+    def _schedule(self, data) -> None:
+        self.requests += 1
+        self._round = data[0] if len(data) > 0 else 0
+        _slot = response_slot(self.device_type, self.manufacturer,
+                              self.device_number, self._round, self.slots)
+        self._due = self._clock_ms() + _slot * self.slot_ms
+
+    def enumerate(self, message) -> None:
+        """ENUMERATE handler: every device answers."""
+        self._schedule(message.data)
+
+    def device_query(self, message) -> None:
+        """DEVICE_QUERY handler: answers if the device type and
+        manufacturer in the request match."""
+        _data = message.data
+        if len(_data) > 1 and _data[1] not in (ANY, self.device_type):
+            return
+        if len(_data) > 2 and _data[2] not in (ANY, self.manufacturer):
+            return
+        self._schedule(_data)
+
+    def step(self):
+        """Iteration handler: returns the reply once its slot is due."""
+        if self._due is None or self._clock_ms() - self._due < 0:
+            return None
+        self._due = None
+        self.replies += 1
+        _major, _minor, _patch = self.firmware_version
+        return self.Message(self.reply_id,
+                            bytes(IDENTITY_PAYLOAD.encode_raw(
+                                (_major, _minor, _patch, self._round,
+                                 self.serial))),
+                            extended=True)
@@ -8,6 +8,7 @@ from carrier_board.m4_feather_can import CarrierBoard
 from canio import Match
 from can_handler import CANHandler
 from ids.heartbeat import HeartBeatMsg
+from pixel_animator import PixelAnimator
 from adafruit_ticks import ticks_ms, ticks_less, ticks_add
 import time
 
@@ -24,11 +25,6 @@ class RobotSignalLight:
     STATE_ENABLED = 1
     STATE_ERROR = 2
 
-    # During blinking, since it is an RGB LED, we can't just invert
-    # the LED, so we need to know whether on or off
-    OFF = False
-    ON = True
-
     # The mapping of the RSL in terms of RGB colors to state
     COLOR_STATE = {
         STATE_DISABLED: ORANGE,
@@ -66,17 +62,25 @@ class RobotSignalLight:
         # Initial state..
         self.state = self.STATE_ERROR
 
-        # Blink information (LEDs on or off, and time for )
-        self.blink = self.OFF
+        # The animator precomputes the frames of each state once, step()
+        # then only calls show() when the frame changes
+        self.animator = PixelAnimator(self.cb.neopixel)
+        self.patterns = {}
+        for _state in self.COLOR_STATE:
+            if self.BLINK_STATE[_state]:
+                self.patterns[_state] = self.animator.blink_pattern(
+                    self.COLOR_STATE[_state], self.BLACK,
+                    self.BLINK_PERIOD_HALF)
+            else:
+                self.patterns[_state] = self.animator.solid_pattern(
+                    self.COLOR_STATE[_state])
 
         # Show the initial colors
-        self.cb.neopixel.fill(self.COLOR_STATE[self.state])
-        self.cb.neopixel.show()
+        self.animator.play(self.patterns[self.state])
+        self.animator.show()
 
         # Setup the time in the future to re-evaluate
-        _now = ticks_ms()
-        self.blink_time = ticks_add(_now, self.BLINK_PERIOD_HALF)
-        self.timeout_time = ticks_add(_now, self.TIMEOUT_PERIOD)
+        self.timeout_time = ticks_add(ticks_ms(), self.TIMEOUT_PERIOD)
 
     def heartbeat_msg(self, message: HeartBeatMsg) -> None:
         """The heartbeat_msg() function should be called ONLY if a heartbeat
@@ -94,37 +98,14 @@ class RobotSignalLight:
         self.timeout_time = ticks_add(_now, self.TIMEOUT_PERIOD)
 
     def step(self) -> None:
-        # Get the current time
-        _now = ticks_ms()
-
         # Check to see if the timeout period has passed.
-        # If so, change the state to error and show it
-        if ticks_less(self.timeout_time, _now):
+        # If so, change the state to error
+        if ticks_less(self.timeout_time, ticks_ms()):
             self.state = self.STATE_ERROR
-            cb.neopixel.fill(self.COLOR_STATE[self.state])
-            cb.neopixel.show()
-
-            self.timeout_time = ticks_add(_now, self.TIMEOUT_PERIOD)
-            if ticks_less(self.blink_time, _now):
-                self.blink_time = ticks_add(_now, self.BLINK_PERIOD_HALF)
-
-        # If not timed out, it is time to blink the current state?
-        elif ticks_less(self.blink_time, _now):
-            if self.BLINK_STATE[self.state]:
-                # off to on..
-                if self.blink == self.OFF:
-                    self.cb.neopixel.fill(self.COLOR_STATE[self.state])
-                    self.blink = self.ON
-                # on to off..
-                else:
-                    cb.neopixel.fill(self.BLACK)
-                    self.blink = self.OFF
-            else:
-                cb.neopixel.fill(self.COLOR_STATE[self.state])
-            self.cb.neopixel.show()
 
-            # Advance the blink time
-            self.blink_time = ticks_add(_now, self.BLINK_PERIOD_HALF)
+        # play() is a no-op when the state's pattern is already running
+        self.animator.play(self.patterns[self.state])
+        self.animator.step()
 
 
 # How much do we initialize the carrier board?  Just the CAN interface and
@@ -1,19 +1,158 @@
 
+from array import array
+
+
+class _MONOTONIC_QUEUE:
+    """Sample numbers of the window whose values are monotonic, so the
+    window minimum (or maximum) is always at the front. Each sample is
+    pushed and popped at most once, O(1) amortized per sample."""
+
+    def __init__(self, maxlen, keep_smaller):
+        self.maxlen = maxlen
+        self.keep_smaller = keep_smaller
+        self.ring = [0] * maxlen
+        self.head = 0
+        self.length = 0
+
+    def push(self, number, value, values):
+        _maxlen = self.maxlen
+        # Drop the samples at the back that can never be the min (max)
+        # again now that value is in the window
+        while self.length:
+            _back = self.ring[(self.head + self.length - 1) % _maxlen]
+            _back_value = values[_back % _maxlen]
+            if self.keep_smaller:
+                if _back_value < value:
+                    break
+            elif _back_value > value:
+                break
+            self.length -= 1
+        self.ring[(self.head + self.length) % _maxlen] = number
+        self.length += 1
+
+    def expire(self, oldest):
+        # Drop the front samples that left the window
+        while self.length and self.ring[self.head] < oldest:
+            self.head = (self.head + 1) % self.maxlen
+            self.length -= 1
+
+    def front(self):
+        return self.ring[self.head]
+
+
 class CIRCULAR_BUFFER:
-    def __init__(self, maxlen):
+    """A fixed size ring buffer of sensor samples stored in an array, with
+    streaming statistics updated in O(1) per sample: running sum/average,
+    min, max and an exponential moving average. median() is a sliding
+    median for outlier rejection. Statistics only cover samples actually
+    added, so a buffer that is not full yet does not average in zeros."""
+
+    # Re-add the window from scratch this often so float rounding errors in
+    # the running sum don't accumulate
+    RESUM_INTERVAL = 1024
+
+    def __init__(self, maxlen, typecode="f", ema_alpha=0.25):
         self.maxlen = maxlen
-        self.lst = [0] * maxlen
+        self.lst = array(typecode, [0] * maxlen)
         self.lst_index = 0
+        self.count = 0
+        self.total = 0
+        self.ema_alpha = ema_alpha
+        self.ema = None
+
+        # Total number of samples ever added, sample N is in slot
+        # N % maxlen
+        self._number = 0
+        self._min_queue = _MONOTONIC_QUEUE(maxlen, True)
+        self._max_queue = _MONOTONIC_QUEUE(maxlen, False)
+        # The window, kept sorted, for the median
+        self._sorted = []
+
+    def _find(self, value):
+        # Binary search, leftmost position value can be inserted at
+        _lo = 0
+        _hi = len(self._sorted)
+        while _lo < _hi:
+            _mid = (_lo + _hi) >> 1
+            if self._sorted[_mid] < value:
+                _lo = _mid + 1
+            else:
+                _hi = _mid
+        return _lo
 
     def add(self, val):
-        self.lst[self.lst_index] = val
-        self.lst_index += 1
-        if self.lst_index == self.maxlen:
-            self.lst_index = 0
+        _lst = self.lst
+        _index = self.lst_index
+        if self.count == self.maxlen:
+            _old = _lst[_index]
+            self.total -= _old
+            self._sorted.pop(self._find(_old))
+        else:
+            self.count += 1
+        _lst[_index] = val
+        # Read back, so stats see the value as stored (e.g. float32)
+        val = _lst[_index]
+        self.total += val
+        self._sorted.insert(self._find(val), val)
+
+        # Expire first: the ring has maxlen slots, the sample leaving the
+        # window must be out of the queues (and its slot unreferenced)
+        # before the new sample is pushed
+        _number = self._number
+        _oldest = _number + 1 - self.count
+        self._min_queue.expire(_oldest)
+        self._max_queue.expire(_oldest)
+        self._min_queue.push(_number, val, _lst)
+        self._max_queue.push(_number, val, _lst)
+        self._number = _number + 1
+
+        if self.ema is None:
+            self.ema = val
+        else:
+            self.ema += self.ema_alpha * (val - self.ema)
+
+        _index += 1
+        if _index == self.maxlen:
+            _index = 0
+        self.lst_index = _index
+
+        if self._number % self.RESUM_INTERVAL == 0:
+            self.total = sum(_lst) if self.count == self.maxlen \
+                else sum(_lst[:self.count])
+
+    def clear(self):
+        self.lst_index = 0
+        self.count = 0
+        self.total = 0
+        self.ema = None
+        self._number = 0
+        self._min_queue.length = 0
+        self._max_queue.length = 0
+        self._sorted = []
+
+    @property
+    def full(self):
+        return self.count == self.maxlen
 
     def average(self):
-        _total = 0
-        for i in range(self.maxlen):
-            _total += self.lst[i]
-        return _total / self.maxlen
-# Write your code here :-)
+        if not self.count:
+            return 0
+        return self.total / self.count
+
+    def minimum(self):
+        if not self.count:
+            return None
+        return self.lst[self._min_queue.front() % self.maxlen]
+
+    def maximum(self):
+        if not self.count:
+            return None
+        return self.lst[self._max_queue.front() % self.maxlen]
+
+    def median(self):
+        if not self.count:
+            return None
+        _mid = self.count >> 1
+        if self.count & 1:
+            return self._sorted[_mid]
+        return (self._sorted[_mid - 1] + self._sorted[_mid]) / 2
@@ -1,12 +1,13 @@
 
 import math
-import struct
-import time
 import canio
 import neopixel
 import adafruit_vl53l4cd
-from circular_buffer import CIRCULAR_BUFFER
+from range_acquisition import DUAL_RANGE_ACQUISITION, DUAL_RANGE_CALIBRATION
+from signal_filters import HysteresisDetector, MedianFilter
 from frc_can import FRCCANDevice
+from payload_format import PayloadFormat, Signal
+from publish_policy import PublishPolicy
 from can_carrier_board import CANCarrierBoard
 from led_string import LED_STRING
 
@@ -20,12 +21,25 @@ class INTAKE_DUAL_SENSOR_2023:
     STATE_OBJECT_DETECTED = 2
 
     OBJECT_THRESHOLD = 25.0
+    # Same threshold in the integer mm used by the filters
+    OBJECT_THRESHOLD_MM = 250
+
+    # Center and width in mm plus both raw distances and the detected
+    # state, the whole intake status in one 7 byte frame (was two native
+    # order floats)
+    DISTANCE_PAYLOAD = PayloadFormat([
+        Signal("center", "int16", scale=0.1),
+        Signal("width", "uint12", scale=0.1),
+        Signal("left_distance", "uint12", scale=0.1),
+        Signal("right_distance", "uint12", scale=0.1),
+        Signal("detected", "uint1"),
+    ])
 
     def __init__(self, i2c0, i2c1, device_number=1,
                  filter=False, debug=False, calibrate_log=False,
                  do_calibrate=False,
                  real_sensor_distance=0, left_sensor_distance=0,
-                 right_sensor_distance=0):
+                 right_sensor_distance=0, policy=None):
         self.distance_message = FRCCANDevice(
             device_type=FRCCANDevice.DEVICE_TYPE_MISCELLANEOUS,
             manufacturer=FRCCANDevice.MANUFACTURER_TEAM_USE,
@@ -35,6 +49,11 @@ class INTAKE_DUAL_SENSOR_2023:
         self.debug = debug
         self.calibrate_log = calibrate_log
         self.filter = filter
+        # With filter enabled, frames are sent on a detection edge, a
+        # center/width change of more than 1 cm or every 500 ms
+        self.policy = policy if policy else PublishPolicy(
+            deadband=1.0, max_interval_ms=500,
+            dlc=self.DISTANCE_PAYLOAD.length)
         self.do_calibrate = do_calibrate
 
         if self.debug:
@@ -80,12 +99,29 @@ class INTAKE_DUAL_SENSOR_2023:
             self.device_info(self.vl53_1)
         # self.vl53_1.start_ranging()
 
+        # Both sensors range at the same time and are polled without
+        # waiting
+        self.acquisition = DUAL_RANGE_ACQUISITION(self.vl53_0, self.vl53_1)
+        # Calibration is also polled, from iterate(), CAN messages are
+        # handled while it runs
+        self.calibration = DUAL_RANGE_CALIBRATION(
+            self.acquisition, samples=20, window=5,
+            on_sample=self.calibration_sample)
+        self.state = self.STATE_OBJECT_NOT_DETECTED
+
+        # Object detection works on integer mm: a 3 sample median drops
+        # single bad readings, then two samples on the other side of the
+        # threshold are needed to change state
+        self.median = MedianFilter(3)
+        self.detector = HysteresisDetector(
+            on_threshold=self.OBJECT_THRESHOLD_MM, on_count=2)
+
         # create debug/diagnostics interface
         self.led_string = LED_STRING(led_pixels_per_m=60,
                                      sensor=self)
 
         if self.do_calibrate:
-            self.calibrate()
+            self.start_calibration()
         else:
             if left_sensor_distance > 0:
                 self.left_distance_max = left_sensor_distance - 2.0
@@ -97,9 +133,9 @@ class INTAKE_DUAL_SENSOR_2023:
                 self.right_distance_max = real_sensor_distance - 2.0
 
         self.device_info(self.vl53_0)
-        self.device_info(self.vl53_1)            
-        while True:
-            self.test_function()
+        self.device_info(self.vl53_1)
+        if not self.calibration.running:
+            self.acquisition.start()
 
     # ----
     def device_info(self, sensor):
@@ -114,31 +150,16 @@ class INTAKE_DUAL_SENSOR_2023:
 
     # ---------------------------------------
     def test_function(self):
+        # Never waits on a sensor, prints a result whenever a new pair of
+        # samples is in
+        if not self.acquisition.step():
+            return
         _width = 0
         _center = 0
+        self.left_distance = self.acquisition.distances[0]
+        self.right_distance = self.acquisition.distances[1]
 
-        self.vl53_0.start_ranging()
-
-        # wait for a reading from both sides
-        while not self.vl53_0.data_ready:
-            pass
-        self.vl53_0.clear_interrupt()
-        self.left_distance = self.vl53_0.distance
-
-        if self.left_distance > self.left_distance_max:
-            pass
-        else:
-            self.vl53_1.start_ranging()
-            while not self.vl53_1.data_ready:
-                pass
-            self.vl53_1.clear_interrupt()
-            # read a second one..
-            while not self.vl53_1.data_ready:
-                pass
-            self.vl53_1.clear_interrupt()
-            self.right_distance = self.vl53_1.distance
-            self.vl53_1.stop_ranging()
-
+        if self.left_distance <= self.left_distance_max:
             _left_normalized = (self.left_distance / self.left_sensor_distance) * \
                 self.real_sensor_distance
             _right_normalized = (self.right_distance / self.right_sensor_distance) * \
@@ -147,59 +168,38 @@ class INTAKE_DUAL_SENSOR_2023:
             _width = self.real_sensor_distance - \
                 (_left_normalized + _right_normalized)
             _center = _left_normalized + (_width/2)
-            # print(f"detect real_sensor_distance: {self.real_sensor_distance:.2f}, left_distance: {self.left_distance:.2f}, _left_normalized: {_left_normalized:.2f}, right_distance: {self.right_distance:.2f}, _right_normalized: {_right_normalized:.2f}, _center: {_center:.2f}, _width: {_width:.2f}")
 
         print(f"({_width:.2f},{_center:.2f})")
 
     # ---------------------------------------
-    def calibrate(self):
+    def start_calibration(self):
+        """Starts calibrating, iterate() polls it until it is done. Both
+        sensors are sampled at the same time, calibration takes one
+        sensor's worth of timing budgets instead of two."""
         if self.debug:
-            print("calibrate()")
+            print("start_calibration()")
 
-        self.vl53_0.start_ranging()
-        
         self.led_string.calibrating()
-        _samples = 20
         if self.debug or self.calibrate_log:
-            print(" Calibrating VL53L4CD #0")
-        sensor_data_0 = CIRCULAR_BUFFER(5)
-        for i in range(_samples):
-            while not self.vl53_0.data_ready:
-                pass
-            self.vl53_0.clear_interrupt()
-            _distance = self.vl53_0.distance
-            if self.debug or self.calibrate_log:
-                print(f" +++ {_distance}")
-            sensor_data_0.add(_distance)
-        _left_distance_avg = sensor_data_0.average()
+            print(" Calibrating VL53L4CD #0 and #1")
+        self.calibration.start()
+
+    def calibration_sample(self, index, distance):
+        if self.debug or self.calibrate_log:
+            print(f" +++ #{index} {distance}")
+
+    def finish_calibration(self):
+        _left_distance_avg, _right_distance_avg = self.calibration.averages
         self.left_sensor_distance = _left_distance_avg
         if self.debug or self.calibrate_log:
-            print(f" ..sees width: {_left_distance_avg}")
+            print(f" ..#0 sees width: {_left_distance_avg}")
         self.left_distance_max = _left_distance_avg - 2.0
 
-        self.vl53_0.stop_ranging()
-
-        self.vl53_1.start_ranging()
-
-        if self.debug or self.calibrate_log:
-            print(" Calibrating VL53L4CD #1")
-        sensor_data_1 = CIRCULAR_BUFFER(5)
-        for i in range(_samples):
-            while not self.vl53_1.data_ready:
-                pass
-            self.vl53_1.clear_interrupt()
-            _distance = self.vl53_1.distance
-            if self.debug or self.calibrate_log:
-                print(f" +++ {_distance}")
-            sensor_data_1.add(_distance)
-        _right_distance_avg = sensor_data_1.average()
         self.right_sensor_distance = _right_distance_avg
         if self.debug or self.calibrate_log:
-            print(f" ..sees width: {_right_distance_avg}")
+            print(f" ..#1 sees width: {_right_distance_avg}")
         self.right_distance_max = _right_distance_avg - 2.0
 
-        self.vl53_1.stop_ranging()
-
     # ---------------------------------------
     def filter_enable(self, message):
         if self.debug:
@@ -234,19 +234,22 @@ class INTAKE_DUAL_SENSOR_2023:
         if self.debug:
             print("iterate")
 
-        # wait for a reading from both sides
-        while not self.vl53_0.data_ready:
-            pass
-        self.vl53_0.clear_interrupt()
-        while not self.vl53_1.data_ready:
-            pass
-        self.vl53_1.clear_interrupt()
+        # A running calibration takes the samples until it is done
+        if self.calibration.running:
+            if self.calibration.poll():
+                self.finish_calibration()
+            return None
+
+        # Nothing to do until both sensors have a new sample; never wait
+        # for one, CAN messages need handling in the meantime
+        if not self.acquisition.step():
+            return None
 
         if self.debug:
             print("update")
         # the following are relative to the total width..
-        self.left_distance = self.vl53_0.distance
-        self.right_distance = self.vl53_1.distance
+        self.left_distance = self.acquisition.distances[0]
+        self.right_distance = self.acquisition.distances[1]
 
         # This is where we should filter.. and keep state.
         # Two states: OBJECT_CAPTURED, OBJECT_MISSING
@@ -254,21 +257,11 @@ class INTAKE_DUAL_SENSOR_2023:
         #    and send message
         # if captured and 2 samples with deistance > X goto OBJECT_missing
         #    and send message
-        if self.filter:
-            _send_message = False
-            if self.state > self.STATE_OBJECT_NOT_DETECTED:
-                if self.left_distance > self.OBJECT_THRESHOLD:
-                    self.state -= 1
-                    if self.state == self.STATE_OBJECT_NOT_DETECTED:
-                        _send_message = True
-            else:
-                if self.left_distance <= self.OBJECT_THRESHOLD:
-                    self.state += 1
-                    if self.state == self.STATE_OBJECT_DETECTED:
-                        _send_message = True
-        else:
-            _send_message = True
-
+        self.detector.update(self.median.update(int(self.left_distance * 10)))
+        self.state = (
+            self.STATE_OBJECT_DETECTED if self.detector.state
+            else self.STATE_OBJECT_NOT_DETECTED
+        )
         if (self.left_distance > self.left_distance_max) and \
            (self.right_distance > self.right_distance_max):
             if self.debug:
@@ -281,8 +274,15 @@ class INTAKE_DUAL_SENSOR_2023:
             #    print(f"..detected {_center}, {_width}")
             # self.led_string.detected()
 
+        if self.filter:
+            _send_message = self.policy.update(
+                (_center, _width), edge=self.detector.changed)
+        else:
+            _send_message = True
         if _send_message:
-            msg_body = struct.pack("@ff", _center, _width)
+            msg_body = bytes(self.DISTANCE_PAYLOAD.encode(
+                _center, _width, self.left_distance, self.right_distance,
+                self.detector.state))
             message = canio.Message(id=self.distance_message.message_id,
                                     data=msg_body,
                                     extended=True)
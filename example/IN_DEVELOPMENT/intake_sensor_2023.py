@@ -1,11 +1,13 @@
 
 import math
-import struct
 import time
 import canio
 import neopixel
 import adafruit_vl53l4cd
 from frc_can import FRCCANDevice
+from payload_format import PayloadFormat, Signal
+from publish_policy import PublishPolicy
+from signal_filters import HysteresisDetector, MedianFilter
 from can_carrier_board import CANCarrierBoard
 
 
@@ -18,8 +20,18 @@ class INTAKE_SENSOR_2023:
     STATE_OBJECT_DETECTED = 2
 
     OBJECT_THRESHOLD = 25.0
-
-    def __init__(self, i2c, device_number=1, filter=False, debug=False):
+    # Same threshold in the integer mm used by the filters
+    OBJECT_THRESHOLD_MM = 250
+
+    # Distance in mm (0..409.5 cm) and the detected state, 2 bytes instead
+    # of a native order float
+    DISTANCE_PAYLOAD = PayloadFormat([
+        Signal("distance", "uint12", scale=0.1),
+        Signal("detected", "uint1"),
+    ])
+
+    def __init__(self, i2c, device_number=1, filter=False, debug=False,
+                 policy=None):
         self.distance_message = FRCCANDevice(
             device_type=FRCCANDevice.DEVICE_TYPE_MISCELLANEOUS,
             manufacturer=FRCCANDevice.MANUFACTURER_TEAM_USE,
@@ -28,6 +40,11 @@ class INTAKE_SENSOR_2023:
 
         self.debug = debug
         self.filter = filter
+        # With filter enabled, frames are sent on a detection edge, a
+        # distance change of more than 1 cm or every 500 ms
+        self.policy = policy if policy else PublishPolicy(
+            deadband=1.0, max_interval_ms=500,
+            dlc=self.DISTANCE_PAYLOAD.length)
 
         self.i2c = i2c
         self.vl53 = adafruit_vl53l4cd.VL53L4CD(self.i2c)
@@ -57,6 +74,14 @@ class INTAKE_SENSOR_2023:
         else:
             self.state = self.STATE_OBJECT_DETECTED
 
+        # Object detection works on integer mm: a 3 sample median drops
+        # single bad readings, then two samples on the other side of the
+        # threshold are needed to change state
+        self.median = MedianFilter(3)
+        self.detector = HysteresisDetector(
+            on_threshold=self.OBJECT_THRESHOLD_MM, on_count=2,
+            state=self.state == self.STATE_OBJECT_DETECTED)
+
         carrier_board = CANCarrierBoard()
         _carrier_pixel_pin = carrier_board.NEOPIXEL
         self.num_carrier_pixels = 35
@@ -79,18 +104,14 @@ class INTAKE_SENSOR_2023:
         # Two states: OBJECT_CAPTURED, OBJECT_MISSING
         # if missing and 2 samples with distance < X goto OBJECT_CAPTURED and send message
         # if captured and 2 samples with deistance > X goto OBJECT_missing and send message
+        self.detector.update(self.median.update(int(_distance * 10)))
+        self.state = (
+            self.STATE_OBJECT_DETECTED if self.detector.state
+            else self.STATE_OBJECT_NOT_DETECTED
+        )
         if self.filter:
-            _send_message = False
-            if self.state > self.STATE_OBJECT_NOT_DETECTED:
-                if self.vl53.distance > self.OBJECT_THRESHOLD:
-                    self.state -= 1
-                    if self.state == self.STATE_OBJECT_NOT_DETECTED:
-                        _send_message = True
-            else:
-                if self.vl53.distance <= self.OBJECT_THRESHOLD:
-                    self.state += 1
-                    if self.state == self.STATE_OBJECT_DETECTED:
-                        _send_message = True
+            _send_message = self.policy.update(
+                _distance, edge=self.detector.changed)
         else:
             _send_message = True
 
@@ -113,7 +134,8 @@ class INTAKE_SENSOR_2023:
         self.carrier_pixel.show()
 
         if _send_message:
-            msg_body = struct.pack("@f", _distance)
+            msg_body = bytes(self.DISTANCE_PAYLOAD.encode(
+                _distance, self.detector.state))
             message = canio.Message(id=self.distance_message.message_id,
                                 data=msg_body,
                                 extended=True)
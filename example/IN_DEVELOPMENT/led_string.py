@@ -3,6 +3,7 @@ import math
 import time
 import neopixel
 from can_carrier_board import CANCarrierBoard
+from pixel_animator import PixelAnimator
 
 
 class LED_STRING:
@@ -25,23 +26,25 @@ class LED_STRING:
         carrier_board = CANCarrierBoard()
         _carrier_pixel_pin = carrier_board.NEOPIXEL
         self.carrier_pixel = neopixel.NeoPixel(_carrier_pixel_pin, self.num_leds, brightness=0.3, auto_write=False)
-        self.carrier_pixel.fill(self.YELLOW)
-        self.carrier_pixel.show()
+        # show() is only called when the frame changes
+        self.animator = PixelAnimator(self.carrier_pixel)
+        self.animator.set_color(self.YELLOW)
+        self.animator.show()
         time.sleep(1)
 
     def not_detected(self):
-        self.carrier_pixel.fill(self.RED)
-        self.carrier_pixel.show()
+        self.animator.set_color(self.RED)
+        self.animator.step()
 
     def calibrating(self):
-        self.carrier_pixel.fill(self.ORANGE)
-        self.carrier_pixel.show()
+        self.animator.set_color(self.ORANGE)
+        self.animator.show()
 
     def detected(self):
         left_led_index = int((self.sensor.left_distance / self.sensor.left_distance_max) * self.num_leds)
         right_led_index = self.num_leds - int((self.sensor.right_distance / self.sensor.right_distance_max) * self.num_leds)
-        self.carrier_pixel.fill(self.BLACK)
-        for i in range(left_led_index, right_led_index):
-            self.carrier_pixel[i] = self.GREEN
+        self.animator.set_frame(
+            self.animator.span(left_led_index, right_led_index,
+                               self.GREEN, self.BLACK))
         print("..detected")
-        self.carrier_pixel.show()
+        self.animator.step()
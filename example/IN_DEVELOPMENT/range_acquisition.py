@@ -0,0 +1,139 @@
+
+import time
+from circular_buffer import CIRCULAR_BUFFER
+
+
+def _clock_ms():
+    return time.monotonic_ns() // 1000000
+
+
+class DUAL_RANGE_ACQUISITION:
+    """Non-blocking acquisition of two VL53L4CD sensors ranging at the same
+    time. step() checks data_ready of each sensor once and never waits, so
+    it can be called from a CANHandler iteration handler. A pair of samples
+    is reported as soon as both sensors produced a new reading and the two
+    readings are no more than max_age_ms apart."""
+
+    def __init__(self, sensor_0, sensor_1, max_age_ms=None, clock_ms=None):
+        self.sensors = (sensor_0, sensor_1)
+        self._clock_ms = clock_ms if clock_ms else _clock_ms
+        # Two timing budgets is as old as a sample should get before it is
+        # not paired with the other sensor's newest sample
+        if max_age_ms is None:
+            max_age_ms = 2 * max(sensor_0.timing_budget,
+                                 sensor_1.timing_budget)
+        self.max_age_ms = max_age_ms
+
+        self.distances = [0.0, 0.0]
+        self.timestamps = [None, None]
+        # Set when a sensor has a sample newer than the last reported pair
+        self.fresh = [False, False]
+        self.samples = [0, 0]
+        self.pairs = 0
+        self.stale_pairs = 0
+        self.ranging = False
+
+    def start(self):
+        for _sensor in self.sensors:
+            _sensor.start_ranging()
+        self.fresh = [False, False]
+        self.ranging = True
+
+    def stop(self):
+        for _sensor in self.sensors:
+            _sensor.stop_ranging()
+        self.ranging = False
+
+    def age(self, index, now=None):
+        """ms since sensor index produced its last sample, None if it never
+        did."""
+        if self.timestamps[index] is None:
+            return None
+        if now is None:
+            now = self._clock_ms()
+        return now - self.timestamps[index]
+
+    def poll(self, index):
+        """Reads sensor index if it has a new sample. Returns True if it
+        did."""
+        _sensor = self.sensors[index]
+        if not _sensor.data_ready:
+            return False
+        _sensor.clear_interrupt()
+        self.distances[index] = _sensor.distance
+        self.timestamps[index] = self._clock_ms()
+        self.fresh[index] = True
+        self.samples[index] += 1
+        return True
+
+    def step(self):
+        """Polls both sensors once. Returns True when a new pair of samples
+        is available in self.distances."""
+        if not self.ranging:
+            self.start()
+        self.poll(0)
+        self.poll(1)
+        if not (self.fresh[0] and self.fresh[1]):
+            return False
+        if abs(self.timestamps[0] - self.timestamps[1]) > self.max_age_ms:
+            # The older one is left over from long ago, keep the newer one
+            # and wait for its partner
+            _older = 0 if self.timestamps[0] < self.timestamps[1] else 1
+            self.fresh[_older] = False
+            self.stale_pairs += 1
+            return False
+        self.fresh[0] = False
+        self.fresh[1] = False
+        self.pairs += 1
+        return True
+
+
+class DUAL_RANGE_CALIBRATION:
+    """Non-blocking calibration of a DUAL_RANGE_ACQUISITION: start() then
+    call poll() from an iteration handler until it returns True. Each
+    poll() reads whichever sensor has a new sample and never waits. Once
+    both sensors gave `samples` readings, the averages of the last window of
+    them are in self.averages and the sensors are stopped."""
+
+    def __init__(self, acquisition, samples=20, window=5, on_sample=None):
+        self.acquisition = acquisition
+        self.samples = samples
+        self.window = window
+        # Called with (index, distance) for every sample taken, for logging
+        self.on_sample = on_sample
+        self.counts = [0, 0]
+        self.averages = [None, None]
+        self.running = False
+        self.done = False
+        self._buffers = None
+
+    def start(self):
+        self.counts = [0, 0]
+        self.averages = [None, None]
+        self._buffers = (CIRCULAR_BUFFER(self.window),
+                         CIRCULAR_BUFFER(self.window))
+        self.acquisition.start()
+        self.running = True
+        self.done = False
+
+    def poll(self):
+        """Takes the samples that are ready. Returns True once calibration
+        is done."""
+        if not self.running:
+            return self.done
+        for _index in range(2):
+            if (self.counts[_index] < self.samples and
+                    self.acquisition.poll(_index)):
+                self.counts[_index] += 1
+                _distance = self.acquisition.distances[_index]
+                if self.on_sample:
+                    self.on_sample(_index, _distance)
+                self._buffers[_index].add(_distance)
+        if self.counts[0] < self.samples or self.counts[1] < self.samples:
+            return False
+        self.acquisition.stop()
+        self.averages = [self._buffers[0].average(),
+                         self._buffers[1].average()]
+        self.running = False
+        self.done = True
+        return True
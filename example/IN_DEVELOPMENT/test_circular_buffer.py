@@ -0,0 +1,46 @@
+import random
+from circular_buffer import CIRCULAR_BUFFER
+
+
+def _median(window):
+    _sorted = sorted(window)
+    _mid = len(_sorted) >> 1
+    if len(_sorted) & 1:
+        return _sorted[_mid]
+    return (_sorted[_mid - 1] + _sorted[_mid]) / 2
+
+
+"""This is a test wrapper to make sure the streaming min/max/median match
+the window they summarize.."""
+if __name__ == "__main__":
+    for values in ([1, 2, 3, 4], [4, 3, 2, 1]):
+        buffer = CIRCULAR_BUFFER(3)
+        for value in values:
+            buffer.add(value)
+        window = values[-3:]
+        if (buffer.minimum(), buffer.maximum()) != (min(window),
+                                                    max(window)):
+            raise RuntimeError(f"{values}: min {buffer.minimum()} max"
+                               f" {buffer.maximum()}, expected"
+                               f" {min(window)} {max(window)}")
+    print("PASS: monotonic and reversed sequences")
+
+    random.seed(33)
+    for trial in range(200):
+        maxlen = random.randint(1, 8)
+        buffer = CIRCULAR_BUFFER(maxlen, typecode="l")
+        added = []
+        for _ in range(random.randint(1, 40)):
+            value = random.randint(-5, 5)
+            buffer.add(value)
+            added.append(value)
+            window = added[-maxlen:]
+            if buffer.minimum() != min(window) or \
+                    buffer.maximum() != max(window) or \
+                    buffer.median() != _median(window):
+                raise RuntimeError(
+                    f"trial {trial}: window {window} gave min"
+                    f" {buffer.minimum()} max {buffer.maximum()} median"
+                    f" {buffer.median()}")
+    print("PASS: min/max/median match a brute force window over 200"
+          " trials")
@@ -0,0 +1,93 @@
+from range_acquisition import DUAL_RANGE_ACQUISITION, DUAL_RANGE_CALIBRATION
+
+
+class _Clock:
+    def __init__(self):
+        self.ms = 0
+
+    def clock_ms(self):
+        return self.ms
+
+
+class _Sensor:
+    """A VL53L4CD whose data_ready turns True every period polls."""
+
+    def __init__(self, period, distances, timing_budget=50):
+        self.period = period
+        self.distances = list(distances)
+        self.timing_budget = timing_budget
+        self.polls = 0
+        self.reads = 0
+        self.ranging = False
+        self.distance = None
+
+    @property
+    def data_ready(self):
+        if not self.ranging:
+            return False
+        self.polls += 1
+        return self.polls % self.period == 0
+
+    def clear_interrupt(self):
+        self.distance = self.distances[self.reads % len(self.distances)]
+        self.reads += 1
+
+    def start_ranging(self):
+        self.ranging = True
+
+    def stop_ranging(self):
+        self.ranging = False
+
+
+"""This is a test wrapper to make sure both sensors are polled without
+waiting, paired by age and calibrated by polling.."""
+if __name__ == "__main__":
+    clock = _Clock()
+    left = _Sensor(2, [10.0, 11.0])
+    right = _Sensor(3, [20.0])
+    acquisition = DUAL_RANGE_ACQUISITION(left, right,
+                                         clock_ms=clock.clock_ms)
+    pairs = []
+    for step in range(12):
+        clock.ms += 10
+        if acquisition.step():
+            pairs.append((step, list(acquisition.distances)))
+    # Left is ready every 2nd poll, right every 3rd: a pair every 3rd step
+    if [_p[0] for _p in pairs] != [2, 5, 8, 11] or \
+            pairs[0][1] != [10.0, 20.0] or left.polls != 12:
+        raise RuntimeError(f"unexpected pairs {pairs}")
+    print(f"PASS: {len(pairs)} pairs, one step per poll")
+
+    # A left sample too old to pair with right's is dropped
+    clock = _Clock()
+    left = _Sensor(1, [30.0])
+    right = _Sensor(10, [40.0])
+    acquisition = DUAL_RANGE_ACQUISITION(left, right, max_age_ms=15,
+                                         clock_ms=clock.clock_ms)
+    acquisition.step()
+    # Left stalls, right's first sample arrives 100 ms later
+    left.ranging = False
+    clock.ms += 100
+    paired = any(acquisition.step() for _ in range(10))
+    if paired or acquisition.fresh != [False, True] or \
+            acquisition.stale_pairs != 1:
+        raise RuntimeError("a stale sample was paired")
+    print("PASS: stale sample not paired")
+
+    left = _Sensor(4, [100.0, 102.0])
+    right = _Sensor(7, [200.0])
+    calibration = DUAL_RANGE_CALIBRATION(
+        DUAL_RANGE_ACQUISITION(left, right), samples=6, window=4)
+    calibration.start()
+    polls = 1
+    while not calibration.poll():
+        polls += 1
+        if polls > 1000:
+            raise RuntimeError("calibration never finished")
+    if polls != 6 * 7 or calibration.averages != [101.0, 200.0] or \
+            left.ranging or right.ranging or calibration.counts != [6, 6]:
+        raise RuntimeError(f"calibration took {polls} polls, averages"
+                           f" {calibration.averages}")
+    if not calibration.poll() or left.reads != 6:
+        raise RuntimeError("a finished calibration kept sampling")
+    print(f"PASS: calibrated {calibration.averages} in {polls} polls")
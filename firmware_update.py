@@ -0,0 +1,330 @@
+"""File (code) update over CAN, the device side.
+
+Files are sent in blocks of BLOCK_SIZE bytes into the CircuitPython
+filesystem (which boot.py must remount writable, storage.remount("/",
+False)). Frames use FRCCANDevice.DEVICE_TYPE_FIRMWARE_UPDATE with the team
+use manufacturer; the device number is the receiver's, or its group number
+when the host updates several identical devices at once (multicast).
+
+Host to device (all little endian):
+    PATH      [sequence, up to 7 bytes of the path], sequence 0 restarts it;
+              a missing or out of order chunk, or a path longer than
+              MAX_PATH, makes the next START fail with ERROR_NO_PATH
+    START     size (I) crc32 (I) of the file
+    DATA      8 bytes of the current block, frames of a block in order
+    BLOCK_END block (H) epoch (B) 0 (B) crc32 (I) of the block
+    FINISH    size (I) crc32 (I)
+    ABORT     nothing
+Device to host, on the receiver's own device number:
+    STATUS    state (B) error (B) next block (H) block seen (H) epoch (B) 0
+
+The host keeps a window of blocks in flight (it does not wait for each
+block). The receiver only accepts the next block it expects with a good
+CRC and acknowledges every BLOCK_END with the next block it wants; a block
+seen at or past that number was rejected and the host goes back to it
+(epochs keep the host from going back twice for one loss). Blocks are
+appended to <path>.part as they arrive and the file size and CRC are kept
+in <path>.upd, so a START for the same file after an interruption resumes
+at the first missing block. FINISH checks the CRC of the whole file and
+renames it into place. The host side is tools/can_update.py.
+"""
+
+import os
+import struct
+from binascii import crc32
+from ids.msg_format import FRCCANDevice
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+BLOCK_SIZE = 256
+MAX_PATH = 64
+
+# Device number every receiver also listens on, unless given another group
+GROUP_ALL = FRCCANDevice.DEVICE_NUMBER_MASK
+
+# APIs, the lower the ID the higher the priority: acknowledgments first,
+# then data, the control frames last
+API_STATUS = 0x01
+API_DATA = 0x10
+API_BLOCK_END = 0x11
+API_PATH = 0x20
+API_START = 0x21
+API_FINISH = 0x22
+API_ABORT = 0x23
+
+STATE_IDLE = 0
+STATE_RECEIVING = 1
+STATE_DONE = 2
+STATE_ERROR = 3
+
+ERROR_NONE = 0
+ERROR_NO_PATH = 1
+ERROR_FILE = 2
+ERROR_CRC = 3
+ERROR_SIZE = 4
+ERROR_STATE = 5
+
+STATUS_FORMAT = "<BBHHBx"
+BLOCK_END_FORMAT = "<HBxI"
+START_FORMAT = "<II"
+BLOCK_END_LENGTH = struct.calcsize(BLOCK_END_FORMAT)
+START_LENGTH = struct.calcsize(START_FORMAT)
+
+# Mask for a listener Match accepting every API of one device number
+MATCH_MASK = FRCCANDevice.MESSAGE_ID_MASK ^ FRCCANDevice.API_MASK_ALL
+
+
+def update_id(api: int, device_number: int) -> int:
+    return FRCCANDevice(
+        device_type=FRCCANDevice.DEVICE_TYPE_FIRMWARE_UPDATE,
+        manufacturer=FRCCANDevice.MANUF_TEAM_USE, api=api,
+        device_number=device_number).message_id
+
+
+class FirmwareUpdateReceiver:
+    def __init__(self, device_number: int, group: int = GROUP_ALL,
+                 root: str = "/", block_size: int = BLOCK_SIZE) -> None:
+        """Receives files sent by tools/can_update.py.
+
+        Args:
+            device_number (int): the receiver's update device number.
+            group (int): device number shared with identical devices for
+                multicast updates, None for none.
+            root (str): directory the paths sent are relative to.
+            block_size (int): must match the host's.
+        """
+        self.device_number = device_number
+        self.group = group
+        self.root = root
+        self.block_size = block_size
+        self._status_id = update_id(API_STATUS, device_number)
+
+        # Preallocated block and path buffers
+        self._buffer = bytearray(block_size)
+        self._fill = 0
+        self._overflow = False
+        self._path = bytearray(MAX_PATH)
+        self._path_length = 0
+        # Set when a path chunk was lost, out of order or too long
+        self._path_bad = False
+
+        self._file = None
+        self._target = None
+        self._size = 0
+        self._crc = 0
+        self._next = 0
+        self.state = STATE_IDLE
+        self.error = ERROR_NONE
+        self.blocks_received = 0
+        self.blocks_rejected = 0
+        # Control frames too short or too long for their format, dropped
+        self.frames_malformed = 0
+        # The CANHandler's Message class, set by register()
+        self.Message = None
+
+    def match_ids(self) -> list:
+        """IDs for the listener Matches (with mask=MATCH_MASK, extended)
+        that let the update frames through."""
+        _ids = [update_id(0, self.device_number)]
+        if self.group is not None:
+            _ids.append(update_id(0, self.group))
+        return _ids
+
+    def register(self, can_handler) -> None:
+        """Registers the update frame handlers with a CANHandler."""
+        self.Message = can_handler.Message
+        _numbers = [self.device_number]
+        if self.group is not None:
+            _numbers.append(self.group)
+        for _number in _numbers:
+            for _api, _function in ((API_DATA, self.data),
+                                    (API_BLOCK_END, self.block_end),
+                                    (API_PATH, self.path),
+                                    (API_START, self.start),
+                                    (API_FINISH, self.finish),
+                                    (API_ABORT, self.abort)):
+                can_handler.register_msg_handler(update_id(_api, _number),
+                                                 _function)
+
+    def _status(self, seen: int = 0, epoch: int = 0):
+        return self.Message(self._status_id,
+                            struct.pack(STATUS_FORMAT, self.state,
+                                        self.error, self._next & 0xffff,
+                                        seen & 0xffff, epoch & 0xff),
+                            extended=True)
+
+    def _fail(self, error: int):
+        self._close()
+        self.state = STATE_ERROR
+        self.error = error
+        return self._status()
+
+    def _close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _block_length(self, block: int) -> int:
+        return min(self.block_size, self._size - block * self.block_size)
+
+    def path(self, message) -> None:
+        _data = message.data
+        if len(_data) < 1:
+            return
+        if _data[0] == 0:
+            self._path_length = 0
+            self._path_bad = False
+        _chunk = len(_data) - 1
+        if _data[0] * 7 != self._path_length or \
+                self._path_length + _chunk > MAX_PATH:
+            self._path_bad = True
+            return
+        self._path[self._path_length:self._path_length + _chunk] = _data[1:]
+        self._path_length += _chunk
+
+    def _malformed(self, message, length: int) -> bool:
+        """Counts a control frame that is not length bytes long."""
+        if len(message.data) == length:
+            return False
+        self.frames_malformed += 1
+        return True
+
+    def start(self, message):
+        if self._malformed(message, START_LENGTH):
+            return None
+        if self._path_length == 0 or self._path_bad:
+            return self._fail(ERROR_NO_PATH)
+        try:
+            _name = self._path[:self._path_length].decode()
+        except UnicodeError:
+            return self._fail(ERROR_NO_PATH)
+        _size, _crc = struct.unpack(START_FORMAT, message.data)
+        self._close()
+        self._target = self.root.rstrip("/") + "/" + _name.lstrip("/")
+        _part = self._target + ".part"
+        _meta = self._target + ".upd"
+        self._size = _size
+        self._crc = _crc
+        self._next = 0
+        self._fill = 0
+        self._overflow = False
+        try:
+            # Resume if the partial file is for the same contents and ends
+            # on a block boundary
+            if self._read_meta(_meta) == (_size, _crc):
+                _have = os.stat(_part)[6]
+                if _have % self.block_size == 0:
+                    self._next = _have // self.block_size
+            if self._next:
+                self._file = open(_part, "ab")
+            else:
+                with open(_meta, "w") as _fd:
+                    _fd.write(f"{_size} {_crc}\n")
+                self._file = open(_part, "wb")
+        except OSError:
+            return self._fail(ERROR_FILE)
+        self.state = STATE_RECEIVING
+        self.error = ERROR_NONE
+        return self._status()
+
+    @staticmethod
+    def _read_meta(meta: str) -> tuple:
+        try:
+            with open(meta) as _fd:
+                _fields = _fd.read().split()
+            return int(_fields[0]), int(_fields[1])
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def data(self, message) -> None:
+        _data = message.data
+        _fill = self._fill
+        _end = _fill + len(_data)
+        if _end > self.block_size:
+            self._overflow = True
+            return
+        self._buffer[_fill:_end] = _data
+        self._fill = _end
+
+    def block_end(self, message):
+        if self._malformed(message, BLOCK_END_LENGTH):
+            return None
+        _block, _epoch, _crc = struct.unpack(BLOCK_END_FORMAT, message.data)
+        _fill = self._fill
+        _overflow = self._overflow
+        self._fill = 0
+        self._overflow = False
+        if self.state != STATE_RECEIVING:
+            return self._status(_block, _epoch)
+        if _block != self._next:
+            # A block already written (resent for another device of the
+            # group) is not a loss, anything else is
+            if _block > self._next:
+                self.blocks_rejected += 1
+            return self._status(_block, _epoch)
+        _view = memoryview(self._buffer)[:_fill]
+        if (_overflow or _fill != self._block_length(_block) or
+                crc32(_view) != _crc):
+            self.blocks_rejected += 1
+            return self._status(_block, _epoch)
+        try:
+            self._file.write(_view)
+            self._file.flush()
+        except OSError:
+            return self._fail(ERROR_FILE)
+        self._next += 1
+        self.blocks_received += 1
+        return self._status(_block, _epoch)
+
+    def finish(self, message):
+        if self._malformed(message, START_LENGTH):
+            return None
+        _size, _crc = struct.unpack(START_FORMAT, message.data)
+        if self.state == STATE_DONE and (_size, _crc) == (self._size,
+                                                          self._crc):
+            # The host missed our DONE
+            return self._status()
+        if self.state != STATE_RECEIVING or \
+                (_size, _crc) != (self._size, self._crc):
+            self.error = ERROR_STATE
+            return self._status()
+        if self._next * self.block_size < self._size:
+            self.error = ERROR_SIZE
+            return self._status()
+        self._close()
+        _part = self._target + ".part"
+        _meta = self._target + ".upd"
+        try:
+            if self._file_crc(_part) != _crc:
+                os.remove(_part)
+                os.remove(_meta)
+                return self._fail(ERROR_CRC)
+            try:
+                os.remove(self._target)
+            except OSError:
+                pass
+            os.rename(_part, self._target)
+            os.remove(_meta)
+        except OSError:
+            return self._fail(ERROR_FILE)
+        self.state = STATE_DONE
+        self.error = ERROR_NONE
+        return self._status()
+
+    def _file_crc(self, path: str) -> int:
+        _crc = 0
+        _view = memoryview(self._buffer)
+        with open(path, "rb") as _fd:
+            while True:
+                _n = _fd.readinto(self._buffer)
+                if not _n:
+                    return _crc
+                _crc = crc32(_view[:_n], _crc)
+
+    def abort(self, message):
+        """Stops the transfer, keeping the partial file to resume."""
+        self._close()
+        self.state = STATE_IDLE
+        self.error = ERROR_NONE
+        return self._status()
@@ -0,0 +1,269 @@
+"""Heap and garbage collection instrumentation for CANHandler.
+
+Registered with CANHandler.register_heap_monitor(), a HeapMonitor samples
+gc.mem_free() around every step and every handler call and keeps, per
+handler, how much it allocates. A free heap that grows during a step or a
+handler means the automatic GC ran there; those steps are counted and
+timed, since a pause in the middle of dispatch is how frames get missed.
+
+With auto_gc=False the automatic GC is disabled and the monitor collects
+only in idle windows: at the end of a step that handled one of idle_ids
+(the roboRIO heartbeat by default, the bus is quiet right after it) when
+the free heap is below collect_below or collect_interval_ms has passed.
+Below emergency_below it collects at the end of any step rather than let
+an allocation fail. Each collection is timed (worst-case pause) and the
+free heap after it is kept to spot leaks (a steady decline, see
+leak_rate()); every fragmentation_every collections the largest block
+that can still be allocated is measured to spot fragmentation. The probe
+allocates and collects repeatedly, so its time is part of that
+collection's pause.
+"""
+
+import gc
+import time
+from array import array
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+# The roboRIO heartbeat, see ids/heartbeat.py
+HEARTBEAT_ID = 0x01011840
+
+
+def _clock_us() -> int:
+    return time.monotonic_ns() // 1000
+
+
+def _no_mem_free() -> int:
+    # CPython has no gc.mem_free(), the monitor then sees no allocations
+    return 0
+
+
+class HeapMonitor:
+    # Why a collection ran, index into collections_by_reason
+    REASON_IDLE = 0
+    REASON_EMERGENCY = 1
+    REASON_REQUESTED = 2
+
+    def __init__(self, auto_gc: bool = True, collect_below: int = 16384,
+                 collect_interval_ms: int = 1000,
+                 emergency_below: int = 4096, idle_ids=(HEARTBEAT_ID,),
+                 leak_samples: int = 16, fragmentation_every: int = 16,
+                 gc_module=None, clock_us=None) -> None:
+        """Heap instrumentation and scheduled collections.
+
+        Args:
+            auto_gc (bool): leave the automatic GC on. With False it is
+                disabled and collections only run when scheduled.
+            collect_below (int): free bytes under which an idle window
+                collects.
+            collect_interval_ms (int): an idle window collects at least
+                this often, 0 only collects below collect_below.
+            emergency_below (int): free bytes under which any step end
+                collects.
+            idle_ids (tuple): message IDs after which the bus is quiet.
+            leak_samples (int): free heap after the last leak_samples
+                collections used by leak_rate().
+            fragmentation_every (int): collections between largest block
+                measurements, 0 never measures.
+            gc_module: provides mem_free(), collect(), enable() and
+                disable(), defaults to gc.
+            clock_us (function): microsecond time source, defaults to
+                time.monotonic_ns() in us.
+        """
+        self.gc = gc_module if gc_module else gc
+        self.mem_free = getattr(self.gc, "mem_free", _no_mem_free)
+        self.clock_us = clock_us if clock_us else _clock_us
+        self.auto_gc = auto_gc
+        self.collect_below = collect_below
+        self.collect_interval_us = collect_interval_ms * 1000
+        self.emergency_below = emergency_below
+        self.idle_ids = idle_ids
+        self.fragmentation_every = fragmentation_every
+        if not auto_gc:
+            self.gc.disable()
+
+        self._step_free = 0
+        self._step_start = 0
+        self._last_collect = self.clock_us()
+
+        self.steps = 0
+        self.step_alloc_max = 0
+        self.step_alloc_total = 0
+        self.min_free = None
+        # Steps and handler calls the automatic GC ran in
+        self.auto_collections = 0
+        self.auto_gc_step_max_us = 0
+        # message ID (or -1 - index for iteration handlers) to
+        # [calls, bytes allocated, most bytes in one call]
+        self.handlers = {}
+
+        self.collections = 0
+        self.collections_by_reason = [0, 0, 0]
+        self.pause_max_us = 0
+        self.pause_total_us = 0
+
+        # Ring of (time in ms, free bytes) after each collection
+        self._leak_time = array("L", [0] * leak_samples)
+        self._leak_free = array("L", [0] * leak_samples)
+        self._leak_count = 0
+        self.largest_block = None
+        self.fragmentation = None
+
+    def step_start(self) -> None:
+        self._step_free = self.mem_free()
+        self._step_start = self.clock_us()
+
+    def handler_done(self, key: int, free_before: int) -> None:
+        """Accounts a handler call, free_before is mem_free() before it."""
+        _allocated = free_before - self.mem_free()
+        if _allocated < 0:
+            self.auto_collections += 1
+            return
+        _entry = self.handlers.get(key)
+        if _entry is None:
+            _entry = [0, 0, 0]
+            self.handlers[key] = _entry
+        _entry[0] += 1
+        _entry[1] += _allocated
+        if _allocated > _entry[2]:
+            _entry[2] = _allocated
+
+    def step_done(self, idle: bool = False) -> None:
+        """Accounts the step and collects if it is time to; idle is True
+        when the step handled one of idle_ids."""
+        self.steps += 1
+        _free = self.mem_free()
+        _allocated = self._step_free - _free
+        if _allocated < 0:
+            self.auto_collections += 1
+            _elapsed = self.clock_us() - self._step_start
+            if _elapsed > self.auto_gc_step_max_us:
+                self.auto_gc_step_max_us = _elapsed
+        else:
+            self.step_alloc_total += _allocated
+            if _allocated > self.step_alloc_max:
+                self.step_alloc_max = _allocated
+        if self.min_free is None or _free < self.min_free:
+            self.min_free = _free
+
+        if _free < self.emergency_below:
+            self.collect(self.REASON_EMERGENCY)
+        elif idle and (
+                _free < self.collect_below or
+                (self.collect_interval_us and
+                 self.clock_us() - self._last_collect >=
+                 self.collect_interval_us)):
+            self.collect(self.REASON_IDLE)
+
+    def collect(self, reason: int = REASON_REQUESTED) -> int:
+        """Runs a collection now, returns its pause in us (including the
+        fragmentation probe when one is due, it holds the loop too)."""
+        _start = self.clock_us()
+        self.gc.collect()
+        _end = self.clock_us()
+        self.collections += 1
+        self.collections_by_reason[reason] += 1
+
+        _free = self.mem_free()
+        _i = self._leak_count % len(self._leak_free)
+        self._leak_time[_i] = (_end // 1000) & 0xffffffff
+        self._leak_free[_i] = _free
+        self._leak_count += 1
+        if self.fragmentation_every and \
+                self.collections % self.fragmentation_every == 0:
+            self.measure_fragmentation(_free)
+            _end = self.clock_us()
+
+        _pause = _end - _start
+        self._last_collect = _end
+        self.pause_total_us += _pause
+        if _pause > self.pause_max_us:
+            self.pause_max_us = _pause
+        return _pause
+
+    def measure_fragmentation(self, free: int = None,
+                              allocate=bytearray) -> float:
+        """Finds the largest block that can be allocated by bisection.
+        Returns the fraction of the free heap it is missing (0: not
+        fragmented, close to 1: badly fragmented).
+
+        Args:
+            free (int): the free heap, read if not given.
+            allocate (function): allocates a block of the given size,
+                raising MemoryError if it can't.
+        """
+        if free is None:
+            free = self.mem_free()
+        _low = 0
+        _high = free
+        while _high - _low > 64:
+            _size = (_low + _high) // 2
+            try:
+                _block = allocate(_size)
+                del _block
+                _low = _size
+            except MemoryError:
+                _high = _size
+            # Dropping the probe does not free it, and with the automatic
+            # GC disabled a failed allocation does not collect either
+            self.gc.collect()
+        self.largest_block = _low
+        self.fragmentation = 1 - _low / free if free else 0
+        return self.fragmentation
+
+    def leak_rate(self) -> float:
+        """Least squares slope of the free heap after the collections
+        kept, in bytes per minute. Negative means memory is lost, None
+        until there are 4 samples."""
+        _n = min(self._leak_count, len(self._leak_free))
+        if _n < 4:
+            return None
+        _first = self._leak_count - _n
+        _size = len(self._leak_free)
+        _t0 = self._leak_time[_first % _size]
+        _sum_t = _sum_f = _sum_tt = _sum_tf = 0
+        for _k in range(_first, self._leak_count):
+            _t = ((self._leak_time[_k % _size] - _t0) & 0xffffffff) / 60000
+            _f = self._leak_free[_k % _size]
+            _sum_t += _t
+            _sum_f += _f
+            _sum_tt += _t * _t
+            _sum_tf += _t * _f
+        _denominator = _n * _sum_tt - _sum_t * _sum_t
+        if not _denominator:
+            return None
+        return (_n * _sum_tf - _sum_t * _sum_f) / _denominator
+
+    def stats(self) -> dict:
+        return {
+            "steps": self.steps,
+            "free": self.mem_free(),
+            "min_free": self.min_free,
+            "step_alloc_max": self.step_alloc_max,
+            "step_alloc_mean": self.step_alloc_total / self.steps
+            if self.steps else 0,
+            "auto_collections": self.auto_collections,
+            "auto_gc_step_max_us": self.auto_gc_step_max_us,
+            "collections": self.collections,
+            "collections_by_reason": list(self.collections_by_reason),
+            "pause_max_us": self.pause_max_us,
+            "pause_mean_us": self.pause_total_us / self.collections
+            if self.collections else 0,
+            "leak_bytes_per_min": self.leak_rate(),
+            "largest_block": self.largest_block,
+            "fragmentation": self.fragmentation,
+        }
+
+    def report(self) -> str:
+        """Per handler allocations, worst first, then the totals."""
+        _lines = []
+        for _key, (_calls, _bytes, _max) in sorted(
+                self.handlers.items(), key=lambda _kv: -_kv[1][1]):
+            _name = f"iteration {-1 - _key}" if _key < 0 \
+                else f"0x{_key:08x}"
+            _lines.append(f"{_name}: {_calls} calls, {_bytes} bytes,"
+                          f" {_bytes / _calls:.1f} per call, max {_max}")
+        for _name, _value in self.stats().items():
+            _lines.append(f"{_name}: {_value}")
+        return "\n".join(_lines)
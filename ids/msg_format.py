@@ -1,5 +1,51 @@
 
-from micropython import const
+try:
+    from micropython import const
+except ImportError:
+    # CPython, const() only matters to the MicroPython compiler
+    def const(value):
+        return value
+
+
+class _Decode:
+    """A read-only code to name table used like a dict (in, [], get(),
+    keys(), values(), items()). The (code, name) pairs are one constant
+    tuple, which a .mpy loads as a single object (and frozen firmware keeps
+    in flash), where a dict literal is built on the heap entry by entry at
+    every import."""
+
+    def __init__(self, pairs: tuple) -> None:
+        self._pairs = pairs
+
+    def get(self, code: int, default=None):
+        for _code, _name in self._pairs:
+            if _code == code:
+                return _name
+        return default
+
+    def __contains__(self, code: int) -> bool:
+        return self.get(code) is not None
+
+    def __getitem__(self, code: int) -> str:
+        _name = self.get(code)
+        if _name is None:
+            raise KeyError(code)
+        return _name
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self) -> tuple:
+        return tuple(_code for _code, _name in self._pairs)
+
+    def values(self) -> tuple:
+        return tuple(_name for _code, _name in self._pairs)
+
+    def items(self) -> tuple:
+        return self._pairs
 
 
 class FRCCANDevice:
@@ -61,21 +107,21 @@ class FRCCANDevice:
     DEVICE_TYPE_MISCELLANEOUS = const(10)
     DEVICE_TYPE_IO_BREAKOUT = const(11)
     DEVICE_TYPE_FIRMWARE_UPDATE = const(31)
-    DEVICE_TYPE_DECODE = {
-        0: "Broadcast",
-        1: "Robot Controller",
-        2: "Motor Controller",
-        3: "Relay Controller",
-        4: "Gyro",
-        5: "Accelerometer",
-        6: "Ultrasonic",
-        7: "Geartooth",
-        8: "Power Dist",
-        9: "Pneumatics Controller",
-        10: "Misc",
-        11: "IO Breakout",
-        31: "Firmware Update"
-    }
+    DEVICE_TYPE_DECODE = _Decode((
+        (0, "Broadcast"),
+        (1, "Robot Controller"),
+        (2, "Motor Controller"),
+        (3, "Relay Controller"),
+        (4, "Gyro"),
+        (5, "Accelerometer"),
+        (6, "Ultrasonic"),
+        (7, "Geartooth"),
+        (8, "Power Dist"),
+        (9, "Pneumatics Controller"),
+        (10, "Misc"),
+        (11, "IO Breakout"),
+        (31, "Firmware Update"),
+    ))
 
     """Manufacturer field encodings"""
     MANUF_BROADCAST = const(0)
@@ -95,25 +141,25 @@ class FRCCANDevice:
     MANUF_REDUX = const(14)
     MANUF_ANDYMARK = const(15)
     MANUF_VIVID_HOSTING = const(16)
-    MANUF_DECODE = {
-        MANUF_BROADCAST: "Broadcast",
-        MANUF_NI: "NI",
-        MANUF_LUMINARY_MICRO: "Luminary Micro",
-        MANUF_DEKA: "DEKA",
-        MANUF_CTR_ELECTRONICS: "CTRE",
-        MANUF_REV_ROBOTICS: "REV",
-        MANUF_GRAPPLE: "Grapple",
-        MANUF_MINDSENSORS: "Mindsensors",
-        MANUF_TEAM_USE: "Team Use",
-        MANUF_KAUAI_LABS: "Kauai Labs",
-        MANUF_COPPERFORGE: "Copperforge",
-        MANUF_PLAYING_WITH_FUSION: "Playing With Fusion",
-        MANUF_STUDICA: "Studica",
-        MANUF_THE_THRIFTY_BOT: "The Thrifty Bot",
-        MANUF_REDUX: "Redux",
-        MANUF_ANDYMARK: "AndyMark",
-        MANUF_VIVID_HOSTING: "Vivid Hosting"
-    }
+    MANUF_DECODE = _Decode((
+        (MANUF_BROADCAST, "Broadcast"),
+        (MANUF_NI, "NI"),
+        (MANUF_LUMINARY_MICRO, "Luminary Micro"),
+        (MANUF_DEKA, "DEKA"),
+        (MANUF_CTR_ELECTRONICS, "CTRE"),
+        (MANUF_REV_ROBOTICS, "REV"),
+        (MANUF_GRAPPLE, "Grapple"),
+        (MANUF_MINDSENSORS, "Mindsensors"),
+        (MANUF_TEAM_USE, "Team Use"),
+        (MANUF_KAUAI_LABS, "Kauai Labs"),
+        (MANUF_COPPERFORGE, "Copperforge"),
+        (MANUF_PLAYING_WITH_FUSION, "Playing With Fusion"),
+        (MANUF_STUDICA, "Studica"),
+        (MANUF_THE_THRIFTY_BOT, "The Thrifty Bot"),
+        (MANUF_REDUX, "Redux"),
+        (MANUF_ANDYMARK, "AndyMark"),
+        (MANUF_VIVID_HOSTING, "Vivid Hosting"),
+    ))
 
     # APIs aren't documented here since each manufacturer owns that space
     # but there is one API which can have some info here.. the broadcast
@@ -130,19 +176,19 @@ class FRCCANDevice:
     API_CLASS_BROADCAST_FIRMWARE_VERSION = const(8)
     API_CLASS_BROADCAST_ENUMERATE = const(9)
     API_CLASS_BROADCAST_SYSTEM_RESUME = const(10)
-    API_CLASS_BROADCAST_DECODE = {
-        API_CLASS_BROADCAST_DISABLE: "Disable",
-        API_CLASS_BROADCAST_SYSTEM_HALT: "System Halt",
-        API_CLASS_BROADCAST_SYSTEM_RESET: "System Reset",
-        API_CLASS_BROADCAST_DEVICE_ASSIGN: "System Assign",
-        API_CLASS_BROADCAST_DEVICE_QUERY: "Device Query",
-        API_CLASS_BROADCAST_HEARTBEAT: "Heart Beat",
-        API_CLASS_BROADCAST_SYNC: "Sync",
-        API_CLASS_BROADCAST_UPDATE: "Update",
-        API_CLASS_BROADCAST_FIRMWARE_VERSION: "Firmware Version",
-        API_CLASS_BROADCAST_ENUMERATE: "Enumerate",
-        API_CLASS_BROADCAST_SYSTEM_RESUME: "System Resume"
-    }
+    API_CLASS_BROADCAST_DECODE = _Decode((
+        (API_CLASS_BROADCAST_DISABLE, "Disable"),
+        (API_CLASS_BROADCAST_SYSTEM_HALT, "System Halt"),
+        (API_CLASS_BROADCAST_SYSTEM_RESET, "System Reset"),
+        (API_CLASS_BROADCAST_DEVICE_ASSIGN, "System Assign"),
+        (API_CLASS_BROADCAST_DEVICE_QUERY, "Device Query"),
+        (API_CLASS_BROADCAST_HEARTBEAT, "Heart Beat"),
+        (API_CLASS_BROADCAST_SYNC, "Sync"),
+        (API_CLASS_BROADCAST_UPDATE, "Update"),
+        (API_CLASS_BROADCAST_FIRMWARE_VERSION, "Firmware Version"),
+        (API_CLASS_BROADCAST_ENUMERATE, "Enumerate"),
+        (API_CLASS_BROADCAST_SYSTEM_RESUME, "System Resume"),
+    ))
 
     def __init__(self, device_type=None, manufacturer=None, api=None,
                  device_number=None, message_id=None) -> None:
@@ -0,0 +1,143 @@
+# Scaled integer signals packed into one CAN payload, the compact
+# alternative to struct.pack("@ff", ...) for team device status frames
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+
+class Signal:
+    def __init__(self, name: str, kind: str = "uint8", scale: float = 1,
+                 offset: float = 0) -> None:
+        """One scaled integer signal in a CAN payload.
+
+        Args:
+            name (str): signal name, used by decode_dict().
+            kind (str): "intN" or "uintN" for N from 1 to 32 bits, e.g.
+                "int8", "int16", "uint12".
+            scale (float): engineering units per count.
+            offset (float): engineering value of a count of 0.
+            The value sent is round((value - offset) / scale), clamped to
+            the range of kind.
+        """
+        if kind.startswith("uint"):
+            self.signed = False
+            self.bits = int(kind[4:])
+        elif kind.startswith("int"):
+            self.signed = True
+            self.bits = int(kind[3:])
+        else:
+            raise ValueError(f"unknown signal kind {kind}")
+        if not 1 <= self.bits <= 32:
+            raise ValueError(f"signal {name} must be 1 to 32 bits")
+        self.name = name
+        self.kind = kind
+        self.scale = scale
+        self.offset = offset
+        self.mask = (1 << self.bits) - 1
+        if self.signed:
+            self.minimum = -(1 << (self.bits - 1))
+            self.maximum = (1 << (self.bits - 1)) - 1
+        else:
+            self.minimum = 0
+            self.maximum = self.mask
+        # Set by PayloadFormat
+        self.lsb = 0
+
+    def to_raw(self, value) -> int:
+        _raw = int(round((value - self.offset) / self.scale))
+        if _raw < self.minimum:
+            return self.minimum
+        if _raw > self.maximum:
+            return self.maximum
+        return _raw
+
+    def from_raw(self, raw: int):
+        return raw * self.scale + self.offset
+
+    def __str__(self) -> str:
+        return (f"{self.name}: {self.kind} bits {self.lsb + self.bits - 1}:"
+                f"{self.lsb} scale {self.scale} offset {self.offset}")
+
+
+class PayloadFormat:
+    MAX_BITS = 64
+
+    def __init__(self, signals: list) -> None:
+        """Packs several scaled integer signals into one CAN payload (at
+        most 8 bytes). Signals are packed in order starting at bit 0 of
+        byte 0, little endian (the byte order the roboRIO uses), so the
+        same PayloadFormat decodes the payload on a host.
+
+        A device and the code reading its frames share the signal list,
+        e.g.:
+            PayloadFormat([Signal("center", "int16", scale=0.1),
+                           Signal("width", "uint12", scale=0.1),
+                           Signal("detected", "uint1")])
+        """
+        self.signals = signals
+        _lsb = 0
+        for _signal in signals:
+            _signal.lsb = _lsb
+            _lsb += _signal.bits
+        if _lsb > self.MAX_BITS:
+            raise ValueError(f"signals need {_lsb} bits, a frame holds"
+                             f" {self.MAX_BITS}")
+        self.bits = _lsb
+        self.length = (_lsb + 7) // 8
+        # Reused by encode()
+        self._buffer = bytearray(self.length)
+
+    def encode_raw(self, raws, buffer: bytearray = None) -> bytearray:
+        """Packs already scaled integer values."""
+        _packed = 0
+        for _i, _signal in enumerate(self.signals):
+            _packed |= (raws[_i] & _signal.mask) << _signal.lsb
+        _buffer = buffer if buffer is not None else self._buffer
+        for _i in range(self.length):
+            _buffer[_i] = _packed & 0xff
+            _packed >>= 8
+        return _buffer
+
+    def encode(self, *values) -> bytearray:
+        """Scales and packs one value per signal. The returned bytearray
+        is reused by the next call; copy it if it needs to live longer."""
+        _packed = 0
+        for _i, _signal in enumerate(self.signals):
+            _packed |= (_signal.to_raw(values[_i]) & _signal.mask) << \
+                _signal.lsb
+        _buffer = self._buffer
+        for _i in range(self.length):
+            _buffer[_i] = _packed & 0xff
+            _packed >>= 8
+        return _buffer
+
+    def decode_raw(self, data) -> list:
+        """Unpacks the signals as integer counts."""
+        _packed = 0
+        for _i in range(min(len(data), self.length) - 1, -1, -1):
+            _packed = (_packed << 8) | data[_i]
+        _raws = []
+        for _signal in self.signals:
+            _raw = (_packed >> _signal.lsb) & _signal.mask
+            if _signal.signed and _raw > _signal.maximum:
+                _raw -= 1 << _signal.bits
+            _raws.append(_raw)
+        return _raws
+
+    def decode(self, data) -> list:
+        """Unpacks the signals in engineering units."""
+        _raws = self.decode_raw(data)
+        return [_signal.from_raw(_raws[_i])
+                for _i, _signal in enumerate(self.signals)]
+
+    def decode_dict(self, data) -> dict:
+        """Unpacks the signals into a {name: value} dict."""
+        _values = self.decode(data)
+        return {_signal.name: _values[_i]
+                for _i, _signal in enumerate(self.signals)}
+
+    def __str__(self) -> str:
+        _s = f"payload: {self.length} bytes, {self.bits} bits"
+        for _signal in self.signals:
+            _s += f"\n {_signal}"
+        return _s
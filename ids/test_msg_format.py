@@ -31,3 +31,17 @@ if __name__ == '__main__':
     _pass_str = f"Universal heartbeat (message_id of {uhb.message_id})" + \
         f"\n decomposition is {uhb}"
     print(_pass_str)
+
+    # The decode tables behave like the dicts they replace
+    if FRCCANDevice.DEVICE_TYPE_DECODE[31] != "Firmware Update" or \
+            12 in FRCCANDevice.DEVICE_TYPE_DECODE or \
+            FRCCANDevice.MANUF_DECODE.get(99, "?") != "?" or \
+            len(FRCCANDevice.MANUF_DECODE) != 17 or \
+            list(FRCCANDevice.API_CLASS_BROADCAST_DECODE)[:2] != [0, 1]:
+        raise RuntimeError("decode tables do not behave like dicts")
+    try:
+        FRCCANDevice.MANUF_DECODE[99]
+        raise RuntimeError("unknown manufacturer decoded")
+    except KeyError:
+        pass
+    print("PASS: decode tables")
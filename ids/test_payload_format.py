@@ -0,0 +1,38 @@
+from payload_format import PayloadFormat, Signal
+
+
+"""This is a test wrapper to make sure the above stuff is correct.."""
+if __name__ == '__main__':
+    fmt = PayloadFormat([
+        Signal("center", "int16", scale=0.1),
+        Signal("width", "uint12", scale=0.1),
+        Signal("detected", "uint1"),
+        Signal("temperature", "int8", scale=0.5, offset=20),
+    ])
+    print(fmt)
+
+    data = bytes(fmt.encode(-12.3, 40.5, 1, 15.5))
+    if len(data) != 5:
+        raise RuntimeError(f"expected a 5 byte payload, not {len(data)}")
+    values = fmt.decode(data)
+    expected = [-12.3, 40.5, 1, 15.5]
+    for value, expected_value in zip(values, expected):
+        if abs(value - expected_value) > 1e-9:
+            raise RuntimeError(f"decoded {values}, expected {expected}")
+    print(f"PASS: {expected} -> {data.hex()} -> {values}")
+
+    # Out of range values are clamped
+    values = fmt.decode_raw(fmt.encode(5000, 999, 3, -200))
+    if values != [32767, 4095, 1, -128]:
+        raise RuntimeError(f"unexpected clamped values {values}")
+    print(f"PASS: clamped values {values}")
+
+    raised = False
+    try:
+        PayloadFormat([Signal("a", "uint32"), Signal("b", "uint32"),
+                       Signal("c", "uint1")])
+    except ValueError:
+        raised = True
+    if not raised:
+        raise RuntimeError("expected a ValueError for a 65 bit payload")
+    print("PASS: payload larger than 64 bits rejected")
@@ -0,0 +1,137 @@
+"""Import time and heap use of the protocol core, on a board or the host.
+
+Each module is imported cold: everything an earlier measurement loaded is
+dropped from sys.modules first, so shared modules (ids.msg_format) count
+toward every module that needs them. The last row imports the whole core
+at once, the cost paid at boot before the first frame can be sent. Heap
+is gc.mem_alloc() on the board and tracemalloc on the host, after a
+collection so only what the import keeps is counted. Any hardware module
+loaded is listed; the core must load none (built-in modules such as board
+do not show in sys.modules on the board, libraries such as
+adafruit_mcp2515 do).
+
+On a board, copy it next to the library and from the REPL or code.py:
+
+    import import_benchmark
+    import_benchmark.main()
+
+On the host, from the repository root:
+
+    python import_benchmark.py [module ...]
+"""
+
+import gc
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+# Modules making up the protocol core, in dependency order
+CORE_MODULES = (
+    "ids.msg_format",
+    "ids.payload_format",
+    "ids.heartbeat",
+    "can_handler",
+    "publish_policy",
+    "signal_filters",
+    "can_trace",
+    "heap_monitor",
+    "device_identity",
+    "can_isotp",
+    "firmware_update",
+)
+
+# Top level names of modules that touch hardware
+HARDWARE_MODULES = (
+    "adafruit_mcp2515",
+    "adafruit_ticks",
+    "analogio",
+    "board",
+    "busio",
+    "canio",
+    "digitalio",
+    "microcontroller",
+    "neopixel",
+    "pwmio",
+)
+
+
+def _clock_us() -> int:
+    return time.monotonic_ns() // 1000
+
+
+def _heap_used() -> int:
+    gc.collect()
+    if tracemalloc:
+        return tracemalloc.get_traced_memory()[0]
+    return gc.mem_alloc()
+
+
+def measure(names) -> dict:
+    """Imports the module name (or tuple of names) cold and unloads
+    everything it loaded again.
+
+    Returns:
+        dict: name, us (import time), bytes (heap kept), loaded (modules
+            loaded) and hardware (the hardware modules among them).
+    """
+    if isinstance(names, str):
+        names = (names,)
+    _before = set(sys.modules)
+    if tracemalloc:
+        tracemalloc.start()
+    _used = _heap_used()
+    _start = _clock_us()
+    for _name in names:
+        __import__(_name)
+    _us = _clock_us() - _start
+    _bytes = _heap_used() - _used
+    if tracemalloc:
+        tracemalloc.stop()
+    _loaded = sorted(_name for _name in sys.modules if _name not in _before)
+    for _name in _loaded:
+        del sys.modules[_name]
+    return {
+        "name": names[0] if len(names) == 1 else f"{len(names)} modules",
+        "us": _us,
+        "bytes": _bytes,
+        "loaded": _loaded,
+        "hardware": [_name for _name in _loaded
+                     if _name.split(".")[0] in HARDWARE_MODULES],
+    }
+
+
+def run(modules=CORE_MODULES) -> list:
+    """Measures every module, then all of them together."""
+    _results = [measure(_name) for _name in modules]
+    if len(modules) > 1:
+        _results.append(measure(tuple(modules)))
+    return _results
+
+
+def report(results) -> str:
+    _lines = [f"{'module':<22} {'ms':>7} {'bytes':>7} {'loaded':>6}"
+              f"  hardware"]
+    for _result in results:
+        _lines.append(f"{_result['name']:<22}"
+                      f" {_result['us'] / 1000:>7.2f}"
+                      f" {_result['bytes']:>7}"
+                      f" {len(_result['loaded']):>6}"
+                      f"  {' '.join(_result['hardware']) or '-'}")
+    return "\n".join(_lines)
+
+
+def main(modules=CORE_MODULES) -> list:
+    _results = run(modules)
+    print(report(_results))
+    return _results
+
+
+if __name__ == "__main__":
+    main(tuple(sys.argv[1:]) or CORE_MODULES)
@@ -0,0 +1,124 @@
+"""A generic CAN I/O breakout device built on CarrierBoard.sample().
+
+All of the configured DIOs and AINs of a carrier board are sampled with
+one call and published as a single team-use CAN frame at a fixed rate.
+"""
+
+from backends.messages import Message
+from adafruit_ticks import ticks_ms, ticks_add, ticks_less
+from ids.msg_format import FRCCANDevice
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+
+class IOBreakout:
+    # API used for the periodic snapshot frame
+    IO_BREAKOUT_SNAPSHOT = 1
+
+    # Snapshot payload layout (8 bytes, big endian bit packing)
+    # [0]: DIO bitmask, bit N is dioN
+    # [1]: AIN0[11:4]
+    # [2]: AIN0[3:0] AIN1[11:8]
+    # [3]: AIN1[7:0]
+    # [4]: AIN2[11:4]
+    # [5]: AIN2[3:0] AIN3[11:8]
+    # [6]: AIN3[7:0]
+    # [7]: rolling sequence counter
+    # AINs are sent with 12 bits of resolution (the upper 12 bits of the
+    # 16-bit analogio value), which is what the ADCs really resolve.
+    SNAPSHOT_NUM_AINS = 4
+    SNAPSHOT_COUNTER_BYTE = 7
+
+    def __init__(self, carrier_board, device_number: int = 1,
+                 period_ms: int = 20, oversample: int = 1,
+                 policy=None) -> None:
+        """Publishes CarrierBoard.sample() snapshots as one CAN frame.
+        Register iterate() with CANHandler.register_iteration_handler().
+
+        Args:
+            carrier_board (CarrierBoard): board whose DIOs/AINs are sampled.
+            device_number (int): FRC device number of this breakout.
+            period_ms (int): time between published snapshots.
+            oversample (int): ADC reads averaged per AIN per snapshot.
+            policy (PublishPolicy): if set, a sampled snapshot is only sent
+                when a DIO changed or the policy accepts the AIN values
+                (deadband/keep-alive), otherwise every period.
+        """
+        self.cb = carrier_board
+        self.period_ms = period_ms
+        self.oversample = oversample
+        self.policy = policy
+        self._last_dio = None
+
+        self.snapshot_message = FRCCANDevice(
+            device_type=FRCCANDevice.DEVICE_TYPE_IO_BREAKOUT,
+            manufacturer=FRCCANDevice.MANUF_TEAM_USE,
+            api=self.IO_BREAKOUT_SNAPSHOT,
+            device_number=device_number)
+
+        # Preallocate the payload and message, they are reused every
+        # period
+        self._payload = bytearray(8)
+        self._message = Message(id=self.snapshot_message.message_id,
+                                data=self._payload,
+                                extended=True)
+        self._counter = 0
+        self._next_time = ticks_ms()
+
+    @classmethod
+    def pack_snapshot(cls, buf: bytearray, dio: int, ains,
+                      counter: int) -> None:
+        """Packs a DIO bitmask and up to four 16-bit AIN values into buf
+        using the snapshot layout above."""
+        _a = [0] * cls.SNAPSHOT_NUM_AINS
+        for _i in range(min(len(ains), cls.SNAPSHOT_NUM_AINS)):
+            _a[_i] = ains[_i] >> 4
+        buf[0] = dio & 0xff
+        buf[1] = _a[0] >> 4
+        buf[2] = ((_a[0] & 0xf) << 4) | (_a[1] >> 8)
+        buf[3] = _a[1] & 0xff
+        buf[4] = _a[2] >> 4
+        buf[5] = ((_a[2] & 0xf) << 4) | (_a[3] >> 8)
+        buf[6] = _a[3] & 0xff
+        buf[cls.SNAPSHOT_COUNTER_BYTE] = counter & 0xff
+
+    @classmethod
+    def unpack_snapshot(cls, buf) -> tuple:
+        """Returns (dio, [ain0..ain3], counter) from a snapshot payload.
+        AIN values are returned as 12-bit values."""
+        _ains = [
+            (buf[1] << 4) | (buf[2] >> 4),
+            ((buf[2] & 0xf) << 8) | buf[3],
+            (buf[4] << 4) | (buf[5] >> 4),
+            ((buf[5] & 0xf) << 8) | buf[6],
+        ]
+        return buf[0], _ains, buf[cls.SNAPSHOT_COUNTER_BYTE]
+
+    def snapshot(self) -> Message:
+        """Samples the carrier board now and returns the snapshot
+        message."""
+        return self._pack(self.cb.sample(self.oversample))
+
+    def _pack(self, dio: int) -> Message:
+        self.pack_snapshot(self._payload, dio, self.cb.sample_ain,
+                           self._counter)
+        self._counter = (self._counter + 1) & 0xff
+        self._message.data = self._payload
+        return self._message
+
+    def iterate(self):
+        """Returns a snapshot message once per period_ms (when the policy
+        allows it), None otherwise."""
+        _now = ticks_ms()
+        if ticks_less(_now, self._next_time):
+            return None
+        self._next_time = ticks_add(_now, self.period_ms)
+        if self.policy is None:
+            return self.snapshot()
+        _dio = self.cb.sample(self.oversample)
+        _edge = self._last_dio is not None and _dio != self._last_dio
+        self._last_dio = _dio
+        if not self.policy.update(self.cb.sample_ain, edge=_edge):
+            return None
+        return self._pack(_dio)
@@ -0,0 +1,202 @@
+"""NeoPixel animation engine for the carrier board NeoPixel interface.
+
+Patterns are precomputed once into frames, lists holding one color tuple
+per pixel, so a running animation only slice assigns a frame to the strip
+(a pixelbuf takes one color per pixel) and calls show(). show() is skipped
+when the frame on the strip is already the one being asked for and is
+called at most once per step(), so LED work is spread across loop
+iterations instead of delaying CAN dispatch.
+"""
+
+from adafruit_ticks import ticks_ms, ticks_add, ticks_less
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+
+class Pattern:
+    def __init__(self, frames: list, interval_ms: int = 0,
+                 repeat: bool = True) -> None:
+        """A list of precomputed frames shown interval_ms apart.
+
+        Args:
+            frames (list): frames, as built by PixelAnimator.
+            interval_ms (int): time each frame is shown. 0 for a static
+                (single frame) pattern.
+            repeat (bool): start over after the last frame, otherwise hold
+                the last frame.
+        """
+        self.frames = frames
+        self.interval_ms = interval_ms
+        self.repeat = repeat
+
+
+class PixelAnimator:
+    # Common colors
+    BLACK = (0, 0, 0)
+    RED = (255, 0, 0)
+    GREEN = (0, 255, 0)
+    BLUE = (0, 0, 255)
+    ORANGE = (255, 69, 0)
+    YELLOW = (255, 255, 0)
+
+    # Minimum time between two show() calls. Each show() on a long strip
+    # blocks for a few ms, there is no point in refreshing faster than the
+    # eye can follow.
+    MIN_SHOW_INTERVAL = 20
+
+    def __init__(self, pixels, min_show_interval: int = None) -> None:
+        """Animation engine on top of a neopixel.NeoPixel object created
+        with auto_write=False (e.g. CarrierBoard.neopixel).
+
+        Args:
+            pixels (neopixel.NeoPixel): the strip to drive.
+            min_show_interval (int): minimum ms between show() calls.
+        """
+        self.pixels = pixels
+        self.num_pixels = len(pixels)
+        self.bpp = pixels.bpp if hasattr(pixels, "bpp") else 3
+        self.min_show_interval = (
+            min_show_interval
+            if min_show_interval is not None
+            else self.MIN_SHOW_INTERVAL
+        )
+
+        # Solid color frames are cached since they are used all the time
+        self._solid_frames = {}
+
+        # Scratch frame for spans computed at run time
+        self._scratch = self.new_frame()
+
+        # What is on the strip right now and what should be
+        self._shown = None
+        self._pending = None
+
+        # The running pattern (if any)
+        self._pattern = None
+        self._frame_index = 0
+        _now = ticks_ms()
+        self._frame_time = _now
+        self._show_time = _now
+
+    def new_frame(self) -> list:
+        """Returns a black frame sized for the strip."""
+        return [self._color(self.BLACK)] * self.num_pixels
+
+    def _color(self, color) -> tuple:
+        # A color is a (r, g, b) or (r, g, b, w) tuple; pad/trim to bpp
+        return (tuple(color) + (0,) * self.bpp)[:self.bpp]
+
+    def solid(self, color) -> list:
+        """Returns the (cached) frame with every pixel set to color."""
+        color = tuple(color)
+        if color not in self._solid_frames:
+            self._solid_frames[color] = \
+                [self._color(color)] * self.num_pixels
+        return self._solid_frames[color]
+
+    def span(self, start: int, end: int, color, background=BLACK,
+             frame: list = None) -> list:
+        """Writes a frame with pixels [start, end) set to color and the rest
+        to background using two slice copies (no per-pixel loop). The
+        scratch frame is used unless frame is given."""
+        _frame = frame if frame is not None else self._scratch
+        _start = max(0, min(start, self.num_pixels))
+        _end = max(0, min(end, self.num_pixels))
+        _frame[:] = self.solid(background)
+        if _end > _start:
+            _frame[_start:_end] = self.solid(color)[_start:_end]
+        return _frame
+
+    def blink_pattern(self, on_color, off_color=BLACK,
+                      half_period_ms: int = 125) -> Pattern:
+        """A two frame on/off blink, e.g. the enabled RSL."""
+        return Pattern([self.solid(on_color), self.solid(off_color)],
+                       half_period_ms)
+
+    def solid_pattern(self, color) -> Pattern:
+        """A static single color pattern, e.g. an alliance color."""
+        return Pattern([self.solid(color)])
+
+    def progress_frames(self, color, background=BLACK) -> list:
+        """Precomputes num_pixels + 1 frames of a progress bar, frame N
+        has the first N pixels lit."""
+        return [self.span(0, _n, color, background, self.new_frame())
+                for _n in range(self.num_pixels + 1)]
+
+    def progress_pattern(self, color, background=BLACK,
+                         interval_ms: int = 50,
+                         repeat: bool = True) -> Pattern:
+        """A filling progress bar animation."""
+        return Pattern(self.progress_frames(color, background),
+                       interval_ms, repeat)
+
+    def play(self, pattern: Pattern) -> None:
+        """Starts running pattern from its first frame. Playing the pattern
+        that is already running does nothing."""
+        if pattern is self._pattern:
+            return
+        self._pattern = pattern
+        self._frame_index = 0
+        self._frame_time = ticks_add(ticks_ms(), pattern.interval_ms)
+        self.set_frame(pattern.frames[0])
+
+    def stop(self) -> None:
+        """Stops the running pattern, holding the current frame."""
+        self._pattern = None
+
+    def set_frame(self, frame: list) -> None:
+        """Queues frame to be shown by the next step(). Nothing is queued
+        when frame is what the strip already shows."""
+        if self._shown is not None and frame == self._shown:
+            self._pending = None
+        else:
+            self._pending = frame
+
+    def set_color(self, color) -> None:
+        """Stops any pattern and queues a solid color."""
+        self._pattern = None
+        self.set_frame(self.solid(color))
+
+    @property
+    def dirty(self) -> bool:
+        """True if a frame is waiting to be shown."""
+        return self._pending is not None
+
+    def step(self) -> bool:
+        """Advances the running pattern and shows at most one pending frame.
+        Call it every loop iteration. Returns True if show() was called."""
+        _now = ticks_ms()
+        _pattern = self._pattern
+        if (_pattern is not None and _pattern.interval_ms and
+                not ticks_less(_now, self._frame_time)):
+            _index = self._frame_index + 1
+            if _index >= len(_pattern.frames):
+                _index = 0 if _pattern.repeat else len(_pattern.frames) - 1
+            self._frame_index = _index
+            self._frame_time = ticks_add(_now, _pattern.interval_ms)
+            self.set_frame(_pattern.frames[_index])
+
+        if self._pending is None:
+            return False
+        if (self._shown is not None and
+                ticks_less(_now, ticks_add(self._show_time,
+                                           self.min_show_interval))):
+            return False
+        return self.show()
+
+    def show(self) -> bool:
+        """Writes the pending frame to the strip now, ignoring the show
+        interval. Returns True if show() was called."""
+        _frame = self._pending
+        if _frame is None:
+            return False
+        self.pixels[:] = _frame
+        self.pixels.show()
+        if self._shown is None:
+            self._shown = list(_frame)
+        else:
+            self._shown[:] = _frame
+        self._pending = None
+        self._show_time = ticks_ms()
+        return True
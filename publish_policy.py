@@ -0,0 +1,159 @@
+"""Transmission policy for sensor frames returned by CANHandler iteration
+handlers.
+
+Instead of sending every cycle or only on a state edge, a sensor asks its
+PublishPolicy whether the new values are worth a frame. A frame is sent when
+any value has moved more than its deadband since the last frame sent, when
+a state edge occurs, or when max_interval_ms has passed (a keep-alive so the
+roboRIO can tell the sensor is still there). Suppressed frames are counted
+so the bus load saved can be reported.
+"""
+
+import time
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+
+def _clock_ms() -> int:
+    return time.monotonic_ns() // 1000000
+
+
+def frame_bits(dlc: int = 8, extended: bool = True) -> int:
+    """Bits a data frame occupies on the bus, including the 3 bit
+    interframe space, without stuff bits."""
+    if extended:
+        return 67 + 8 * dlc
+    return 47 + 8 * dlc
+
+
+class PublishPolicy:
+    # Reasons a frame was sent, index into sent_by_reason
+    REASON_FIRST = 0
+    REASON_EDGE = 1
+    REASON_DEADBAND = 2
+    REASON_KEEP_ALIVE = 3
+
+    def __init__(self, deadband=0, max_interval_ms: int = 1000,
+                 min_interval_ms: int = 0, dlc: int = 8,
+                 extended: bool = True, bitrate: int = 1000000,
+                 clock_ms=None) -> None:
+        """Decides when a sensor's values are sent.
+
+        Args:
+            deadband (number or list): change, per value, that is worth a
+                frame. A single number applies to every value; 0 sends on
+                any change.
+            max_interval_ms (int): longest time between frames (keep-alive),
+                0 disables the keep-alive.
+            min_interval_ms (int): shortest time between deadband triggered
+                frames, limits a noisy value. Edges are never held back.
+            dlc (int): payload length of the frame, for the bus load
+                estimate.
+            extended (bool): the frame uses a 29-bit ID.
+            bitrate (int): CAN bit rate, for the bus load estimate.
+            clock_ms (function): time source, defaults to
+                time.monotonic_ns() in ms.
+        """
+        self.deadband = deadband
+        self.max_interval_ms = max_interval_ms
+        self.min_interval_ms = min_interval_ms
+        self.bitrate = bitrate
+        self.frame_bits = frame_bits(dlc, extended)
+        self._clock_ms = clock_ms if clock_ms else _clock_ms
+
+        # Values of the last frame sent
+        self._sent_values = None
+        self._last_send = 0
+        self._start = None
+        # Reason for the last update() returning True
+        self.reason = None
+
+        self.offered = 0
+        self.sent = 0
+        self.suppressed = 0
+        self.sent_by_reason = [0, 0, 0, 0]
+
+    def _moved(self, values) -> bool:
+        _deadband = self.deadband
+        _per_value = isinstance(_deadband, (list, tuple))
+        _sent = self._sent_values
+        for _i in range(len(values)):
+            _band = _deadband[_i] if _per_value else _deadband
+            if abs(values[_i] - _sent[_i]) > _band:
+                return True
+        return False
+
+    def update(self, values, edge: bool = False) -> bool:
+        """Returns True if a frame with values should be sent now.
+
+        Args:
+            values (number or sequence): the values the frame would carry
+                (a list, tuple or array).
+            edge (bool): a state change happened (e.g.
+                HysteresisDetector.changed), always sent.
+        """
+        if isinstance(values, (int, float)):
+            values = (values,)
+        _now = self._clock_ms()
+        self.offered += 1
+
+        if self._start is None:
+            self._start = _now
+        if self._sent_values is None:
+            _reason = self.REASON_FIRST
+        elif edge:
+            _reason = self.REASON_EDGE
+        elif (self.max_interval_ms and
+                _now - self._last_send >= self.max_interval_ms):
+            _reason = self.REASON_KEEP_ALIVE
+        elif (_now - self._last_send >= self.min_interval_ms and
+                self._moved(values)):
+            _reason = self.REASON_DEADBAND
+        else:
+            self.suppressed += 1
+            self.reason = None
+            return False
+
+        if self._sent_values is None or \
+                len(self._sent_values) != len(values):
+            self._sent_values = list(values)
+        else:
+            for _i in range(len(values)):
+                self._sent_values[_i] = values[_i]
+        self._last_send = _now
+        self.sent += 1
+        self.sent_by_reason[_reason] += 1
+        self.reason = _reason
+        return True
+
+    def force(self) -> None:
+        """Makes the next update() send, e.g. after a configuration change
+        or an RTR for the sensor."""
+        self._sent_values = None
+
+    @property
+    def bits_saved(self) -> int:
+        return self.suppressed * self.frame_bits
+
+    def bus_load_saved(self) -> float:
+        """Fraction of the bus bandwidth saved so far compared to sending
+        on every update()."""
+        if self._start is None:
+            return 0.0
+        _elapsed_ms = self._clock_ms() - self._start
+        if _elapsed_ms <= 0:
+            return 0.0
+        return self.bits_saved * 1000 / (self.bitrate * _elapsed_ms)
+
+    def stats(self) -> dict:
+        return {
+            "offered": self.offered,
+            "sent": self.sent,
+            "suppressed": self.suppressed,
+            "edge": self.sent_by_reason[self.REASON_EDGE],
+            "deadband": self.sent_by_reason[self.REASON_DEADBAND],
+            "keep_alive": self.sent_by_reason[self.REASON_KEEP_ALIVE],
+            "bits_saved": self.bits_saved,
+            "bus_load_saved": self.bus_load_saved(),
+        }
@@ -0,0 +1,270 @@
+"""Integer (fixed-point) signal filters for sensor devices.
+
+Every filter preallocates its state in __init__ and update() only does
+integer arithmetic, so filtering at sensor rate (100+ Hz) on CircuitPython
+does not churn the heap with float objects. Values are plain ints in
+whatever unit the sensor reports (e.g. mm); filters that need fractions use
+FRAC_BITS fixed-point internally, except KalmanFilter1D, which uses
+KALMAN_FRAC_BITS (Q8) to stay in the small int range. Filters with an
+update(value) method can be chained with Pipeline.
+"""
+
+import time
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+# Fixed-point fraction bits used for gains and internal state
+FRAC_BITS = 16
+ONE = 1 << FRAC_BITS
+
+# KalmanFilter1D multiplies Q8 gains by Q8 state, so every intermediate
+# stays below 2**30, in CircuitPython's small int range (no longint
+# allocations) as long as samples differ from the estimate by less than
+# KALMAN_MAX_VALUE units and the noise variances stay under
+# KALMAN_MAX_VARIANCE units^2
+KALMAN_FRAC_BITS = 8
+KALMAN_ONE = 1 << KALMAN_FRAC_BITS
+KALMAN_MAX_VALUE = 1 << (30 - 2 * KALMAN_FRAC_BITS)
+KALMAN_MAX_VARIANCE = 1 << (30 - 2 * KALMAN_FRAC_BITS)
+
+
+def to_fixed(value: float, frac_bits: int = FRAC_BITS) -> int:
+    """Converts a number to fixed-point with frac_bits fraction bits."""
+    return int(round(value * (1 << frac_bits)))
+
+
+def from_fixed(value: int, frac_bits: int = FRAC_BITS) -> float:
+    """Converts a fixed-point number back to a float (for display)."""
+    return value / (1 << frac_bits)
+
+
+class MedianFilter:
+    def __init__(self, size: int = 5) -> None:
+        """Median of the last size samples, rejects single-sample outliers
+        (e.g. a ToF sensor missing the target for one reading)."""
+        self.size = size
+        self._ring = [0] * size
+        self._sorted = [0] * size
+        self._index = 0
+        self.count = 0
+        self.value = None
+
+    def update(self, value: int) -> int:
+        _sorted = self._sorted
+        _count = self.count
+        if _count == self.size:
+            # Remove the sample leaving the window from the sorted copy
+            _old = self._ring[self._index]
+            _i = 0
+            while _sorted[_i] != _old:
+                _i += 1
+            while _i < _count - 1:
+                _sorted[_i] = _sorted[_i + 1]
+                _i += 1
+            _count -= 1
+        # Insertion into the sorted copy, the window is small
+        _i = _count
+        while _i > 0 and _sorted[_i - 1] > value:
+            _sorted[_i] = _sorted[_i - 1]
+            _i -= 1
+        _sorted[_i] = value
+        _count += 1
+        self.count = _count
+
+        self._ring[self._index] = value
+        self._index += 1
+        if self._index == self.size:
+            self._index = 0
+
+        self.value = _sorted[_count >> 1]
+        return self.value
+
+    def reset(self) -> None:
+        self.count = 0
+        self._index = 0
+        self.value = None
+
+
+class KalmanFilter1D:
+    def __init__(self, process_noise: int, measurement_noise: int,
+                 initial_value: int = None,
+                 initial_error: int = None) -> None:
+        """A constant-value (random walk) Kalman filter in fixed-point.
+
+        Args:
+            process_noise (int): q, how much the true value is expected to
+                move between samples, as a variance in sensor units^2.
+            measurement_noise (int): r, the sensor's variance in sensor
+                units^2.
+            initial_value (int): starting estimate, defaults to the first
+                sample.
+            initial_error (int): starting estimate variance, defaults to
+                measurement_noise.
+        Raises:
+            ValueError: if process_noise plus measurement_noise (or
+                initial_error) reaches KALMAN_MAX_VARIANCE.
+        """
+        _initial_error = (initial_error if initial_error is not None
+                          else measurement_noise)
+        if process_noise + max(measurement_noise, _initial_error) >= \
+                KALMAN_MAX_VARIANCE:
+            raise ValueError(f"noise variances must add up to less than"
+                             f" {KALMAN_MAX_VARIANCE}")
+        self.q = process_noise << KALMAN_FRAC_BITS
+        self.r = measurement_noise << KALMAN_FRAC_BITS
+        self._r_scaled = self.r << KALMAN_FRAC_BITS
+        self._p = _initial_error << KALMAN_FRAC_BITS
+        self._x = None if initial_value is None \
+            else initial_value << KALMAN_FRAC_BITS
+        self.gain = 0
+        self.value = initial_value
+
+    def update(self, value: int) -> int:
+        """Filters a sample, which must be within KALMAN_MAX_VALUE units of
+        the estimate."""
+        _z = value << KALMAN_FRAC_BITS
+        if self._x is None:
+            self._x = _z
+        else:
+            # Predict, then correct by the Kalman gain (KALMAN_FRAC_BITS
+            # fixed point). The gain is rounded up, so the error after the
+            # correction stays below r and the predicted error below q + r
+            # (or q + the initial error), which keeps every product below
+            # 2**30
+            _p = self._p + self.q
+            _k = KALMAN_ONE - self._r_scaled // (_p + self.r)
+            _correction = _k * (_z - self._x)
+            self._x += _correction >> KALMAN_FRAC_BITS
+            _p = (KALMAN_ONE - _k) * _p
+            self._p = _p >> KALMAN_FRAC_BITS
+            self.gain = _k
+        # Round to the nearest sensor unit
+        self.value = (self._x + (KALMAN_ONE >> 1)) >> KALMAN_FRAC_BITS
+        return self.value
+
+
+class HysteresisDetector:
+    def __init__(self, on_threshold: int, off_threshold: int = None,
+                 on_count: int = 2, off_count: int = None,
+                 below: bool = True, state: bool = False) -> None:
+        """Two-threshold, sample counting detector. With below=True (e.g.
+        an object is detected when the distance is small) the state turns
+        on after on_count consecutive samples <= on_threshold and off after
+        off_count consecutive samples > off_threshold.
+
+        Args:
+            on_threshold (int): threshold to turn on.
+            off_threshold (int): threshold to turn off, defaults to
+                on_threshold (counting alone provides the hysteresis).
+            on_count (int): consecutive samples needed to turn on.
+            off_count (int): consecutive samples needed to turn off,
+                defaults to on_count.
+            below (bool): detect values below the thresholds, otherwise
+                above.
+            state (bool): initial state.
+        """
+        self.on_threshold = on_threshold
+        self.off_threshold = (off_threshold if off_threshold is not None
+                              else on_threshold)
+        self.on_count = on_count
+        self.off_count = off_count if off_count is not None else on_count
+        self.below = below
+        self.state = state
+        self.changed = False
+        self._count = 0
+
+    def update(self, value: int) -> bool:
+        """Returns the state. self.changed is True if this sample changed
+        it (the edge to report)."""
+        if self.state:
+            _leaving = (value > self.off_threshold if self.below
+                        else value < self.off_threshold)
+            _needed = self.off_count
+        else:
+            _leaving = (value <= self.on_threshold if self.below
+                        else value >= self.on_threshold)
+            _needed = self.on_count
+        if _leaving:
+            self._count += 1
+            if self._count >= _needed:
+                self.state = not self.state
+                self._count = 0
+                self.changed = True
+                return self.state
+        else:
+            self._count = 0
+        self.changed = False
+        return self.state
+
+
+class Debouncer:
+    def __init__(self, count: int = 3, state: bool = False) -> None:
+        """Debounces a digital input (e.g. a DIO read through
+        CarrierBoard.sample()): the state follows the input once it has
+        been stable for count samples."""
+        self.count = count
+        self.state = state
+        self.changed = False
+        self._count = 0
+
+    def update(self, value) -> bool:
+        if bool(value) != self.state:
+            self._count += 1
+            if self._count >= self.count:
+                self.state = not self.state
+                self._count = 0
+                self.changed = True
+                return self.state
+        else:
+            self._count = 0
+        self.changed = False
+        return self.state
+
+
+class RateLimiter:
+    def __init__(self, max_step: int, value: int = None) -> None:
+        """Output follows the input but moves at most max_step per
+        sample (slew rate limit)."""
+        self.max_step = max_step
+        self.value = value
+
+    def update(self, value: int) -> int:
+        if self.value is None:
+            self.value = value
+        elif value > self.value + self.max_step:
+            self.value += self.max_step
+        elif value < self.value - self.max_step:
+            self.value -= self.max_step
+        else:
+            self.value = value
+        return self.value
+
+
+class Pipeline:
+    def __init__(self, *filters) -> None:
+        """Chains filters, each update() result feeds the next filter.
+        E.g. Pipeline(MedianFilter(5), KalmanFilter1D(4, 100),
+        HysteresisDetector(250))."""
+        self.filters = filters
+        self.value = None
+
+    def update(self, value):
+        for _filter in self.filters:
+            value = _filter.update(value)
+        self.value = value
+        return value
+
+    def __getitem__(self, index: int):
+        return self.filters[index]
+
+
+def benchmark(filter_object, samples) -> float:
+    """Runs every sample in samples through filter_object.update() and
+    returns the mean time per sample in us."""
+    _update = filter_object.update
+    _start = time.monotonic_ns()
+    for _sample in samples:
+        _update(_sample)
+    _elapsed = time.monotonic_ns() - _start
+    return _elapsed / 1000 / len(samples)
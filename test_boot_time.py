@@ -0,0 +1,65 @@
+import os
+import sys
+import tempfile
+from tools.boot_time import measure, report
+from tools.mpy_build import MANIFEST, build, find_mpy_cross, sources
+
+
+"""This is a test wrapper to make sure the .mpy build is complete and
+reproducible and the boot time harness measures or skips each build."""
+if __name__ == "__main__":
+    modules = sources()
+    host_only = ("boot_benchmark.py", "import_benchmark.py",
+                 "can_udp_bridge.py", "backends/socketcan.py",
+                 "carrier_board/linux_socketcan.py")
+    if "ids/msg_format.py" not in modules or \
+            "can_handler.py" not in modules or \
+            "carrier_board/io_sample.py" not in modules or \
+            any(_m in modules for _m in host_only) or \
+            any(os.path.basename(_m).startswith("test_") for _m in modules):
+        raise RuntimeError(f"unexpected library modules {modules}")
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            sources(directory)
+        except FileNotFoundError:
+            pass
+        else:
+            raise RuntimeError("missing library modules not reported")
+    print(f"PASS: {len(modules)} library modules")
+
+    if find_mpy_cross() is None:
+        print("SKIP: mpy-cross not found, .mpy build not tested")
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            first = os.path.join(directory, "first")
+            second = os.path.join(directory, "second")
+            written = build(first)
+            build(second)
+            if len(written) != len(modules) or \
+                    not os.path.exists(os.path.join(first, "ids",
+                                                    "msg_format.mpy")):
+                raise RuntimeError(f"unexpected build {written}")
+            with open(os.path.join(first, MANIFEST)) as fd:
+                manifest = fd.read()
+            with open(os.path.join(second, MANIFEST)) as fd:
+                if fd.read() != manifest:
+                    raise RuntimeError("two builds differ")
+        print(f"PASS: {len(written)} modules compiled, builds identical")
+
+    # CPython stands in for micropython to run the source build
+    results = measure(sys.executable, runs=1, heapsize=None,
+                      builds=("source",))
+    source = results["source"]
+    if "skipped" in source:
+        raise RuntimeError(f"source build not measured: {source}")
+    if not 0 < source["import_us"] <= source["first_frame_us"] <= \
+            source["process_us"]:
+        raise RuntimeError(f"unexpected times {source}")
+    print(report(results))
+    print("PASS: source build measured")
+
+    results = measure("no-such-micropython", runs=1)
+    if any("skipped" not in _result for _result in results.values()):
+        raise RuntimeError(f"builds run without an interpreter {results}")
+    print(report(results))
+    print("PASS: builds skipped without micropython")
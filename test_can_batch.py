@@ -0,0 +1,72 @@
+import os
+import tempfile
+from ids.heartbeat import HeartBeatMsg
+from tools.can_batch import run, numpy
+
+
+def heartbeat(match_number, enabled, autonomous):
+    hb = HeartBeatMsg()
+    hb.match_number = match_number
+    hb.enabled = enabled
+    hb.autonomous = autonomous
+    return bytes(hb.data).hex()
+
+
+def write_match(filename, match_number, dropout):
+    with open(filename, "w") as fd:
+        for i in range(2000):
+            t = 1000 + i * 0.005
+            if i % 4 == 0:
+                if dropout and 1005 <= t < 1005.5:
+                    continue
+                phase = (0, 0) if t < 1001 else \
+                    (1, 1) if t < 1003 else (1, 0)
+                fd.write(f"({t:.6f}) can0 {HeartBeatMsg.HEARTBEAT_ID:08X}#"
+                         f"{heartbeat(match_number, *phase)}\n")
+            else:
+                fd.write(f"({t:.6f}) can0 02051807#0102030405060708\n")
+
+
+"""This is a test wrapper to make sure the batch summaries, merged report
+and cache agree.."""
+if __name__ == "__main__":
+    if numpy is None:
+        print("SKIP: numpy is not installed")
+        raise SystemExit
+    path = tempfile.mkdtemp()
+    logs = []
+    for match_number in (1, 2, 3):
+        logs.append(os.path.join(path, f"qm{match_number}.log"))
+        write_match(logs[-1], match_number, match_number == 2)
+    cache = os.path.join(path, "cache")
+
+    seen = []
+    report = run(logs, jobs=2, cache=cache,
+                 progress=lambda done, total, f, cached, e:
+                 seen.append(cached))
+    if report["logs"] != 3 or report["errors"] or any(seen):
+        raise RuntimeError(f"unexpected first run {report['errors']}"
+                           f" {seen}")
+    matches = sorted(m["match_number"] for m in report["matches"])
+    if matches != [1, 2, 3]:
+        raise RuntimeError(f"unexpected matches {matches}")
+    timeline = [p for _, p in report["matches"][0]["timeline"]]
+    if timeline != ["disabled", "auto", "teleop"]:
+        raise RuntimeError(f"unexpected timeline {timeline}")
+    if not 500 <= report["max_heartbeat_gap_ms"] < 600:
+        raise RuntimeError(f"expected the 0.5 s heartbeat dropout, got"
+                           f" {report['max_heartbeat_gap_ms']} ms")
+    rate = report["ids"]["0x02051807"]["max_rate_hz"]
+    if not 140 < rate < 160:
+        raise RuntimeError(f"unexpected status frame rate {rate}")
+    print(f"PASS: {report['frames']} frames, bus load"
+          f" {report['max_bus_load'] * 100:.1f}%, matches {matches},"
+          f" timeline {timeline}")
+
+    seen = []
+    again = run(logs, jobs=2, cache=cache,
+                progress=lambda done, total, f, cached, e:
+                seen.append(cached))
+    if not all(seen) or again["frames"] != report["frames"]:
+        raise RuntimeError("second run did not come from the cache")
+    print("PASS: second run served from the cache")
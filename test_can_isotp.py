@@ -0,0 +1,142 @@
+from backends.virtual_can import CAN, Message, VirtualBus
+from can_handler import CANHandler
+from can_isotp import FLOW_CONTROL_API_BIT, ISOTPReceiver, ISOTPSender, \
+    flow_control_id
+
+
+class _Clock:
+    def __init__(self):
+        self.ms = 0
+
+    def clock_ms(self):
+        return self.ms
+
+
+class _Board:
+    def __init__(self, bus):
+        self.can = CAN(bus)
+        self.listener = self.can.listen(timeout=0)
+
+
+"""This is a test wrapper to make sure segmented payloads are reassembled,
+concurrently and without starving single frames.."""
+if __name__ == "__main__":
+    clock = _Clock()
+    bus = VirtualBus()
+    monitor = CAN(bus).listen(timeout=0)
+
+    received = {}
+
+    def on_message(message_id, data):
+        received.setdefault(message_id, []).append(bytes(data))
+
+    # A ToF array sensor with two data IDs and a calibration sender
+    tof_ids = [0x0a080081, 0x0a0800c1]
+    cal_id = 0x0a080102
+    receiver_handler = CANHandler(_Board(bus), drain_queue=True)
+    receiver = ISOTPReceiver(on_message, max_sessions=3, max_length=200,
+                             block_size=4, st_min_ms=1,
+                             clock_ms=clock.clock_ms)
+    receiver.register(receiver_handler, tof_ids + [cal_id, 0x0a080142])
+
+    done = []
+    senders = []
+    handlers = []
+    for _i in range(2):
+        _handler = CANHandler(_Board(bus), drain_queue=True)
+        if _i == 0:
+            # The ToF sensor also sends a status frame every step
+            _handler.register_iteration_handler(
+                lambda: Message(0x0a080041, b"\x01", extended=True))
+        _sender = ISOTPSender(frames_per_step=2, clock_ms=clock.clock_ms,
+                              on_done=lambda _id, _ok: done.append(
+                                  (_id, _ok)))
+        _sender.register(_handler)
+        senders.append(_sender)
+        handlers.append(_handler)
+
+    zones = [bytes((i + z) & 0xff for i in range(128)) for z in range(2)]
+    table = bytes(range(200))
+    if not (senders[0].send(tof_ids[0], zones[0]) and
+            senders[0].send(tof_ids[1], zones[1]) and
+            senders[1].send(cal_id, table) and
+            senders[1].send(0x0a080142, b"short")):
+        raise RuntimeError("could not start the transfers")
+    if senders[0].send(tof_ids[0], zones[0]):
+        raise RuntimeError("a busy ID accepted a second transfer")
+
+    steps = 0
+    while len(done) < 3 and steps < 1000:
+        clock.ms += 1
+        steps += 1
+        for handler in handlers + [receiver_handler]:
+            handler.step()
+        # Single frames still go out every step, at most 2 segments each
+        frames = []
+        message = monitor.receive()
+        while message:
+            frames.append(message)
+            message = monitor.receive()
+        from_tof = [m for m in frames if m.id in tof_ids]
+        if len(from_tof) > 2:
+            raise RuntimeError(f"{len(from_tof)} segments in one step")
+        if not any(m.id == 0x0a080041 for m in frames):
+            raise RuntimeError(f"status frame starved at step {steps}")
+
+    if sorted(done) != sorted([(tof_ids[0], True), (tof_ids[1], True),
+                               (cal_id, True)]):
+        raise RuntimeError(f"transfers did not complete: {done}")
+    if received != {tof_ids[0]: [zones[0]], tof_ids[1]: [zones[1]],
+                    cal_id: [table], 0x0a080142: [b"short"]}:
+        raise RuntimeError(f"payloads differ: {received}")
+    print(f"PASS: 3 concurrent transfers and a single frame in {steps}"
+          f" steps, {senders[0].frames + senders[1].frames} frames")
+
+    # Too long for the receiver's buffers: refused with an overflow
+    done.clear()
+    if not senders[1].send(cal_id, bytes(250)):
+        raise RuntimeError("the sender refused a 250 byte payload")
+    for _ in range(5):
+        clock.ms += 1
+        for handler in handlers + [receiver_handler]:
+            handler.step()
+    if done != [(cal_id, False)] or receiver.refused != 1:
+        raise RuntimeError(f"overflow not reported: {done}")
+    print("PASS: oversized payload refused")
+
+    # A short first frame is ignored rather than raising
+    for data in (b"\x10", b"\x10\x14\x00"):
+        if receiver.receive(Message(cal_id, data, extended=True)) \
+                is not None:
+            raise RuntimeError(f"short first frame {data} answered")
+    print("PASS: short first frames ignored")
+
+    # No flow control: the sender gives up after its timeout
+    done.clear()
+    senders[1].send(0x0a080182, bytes(20))
+    for _ in range(3):
+        clock.ms += 600
+        handlers[1].step()
+    if done != [(0x0a080182, False)]:
+        raise RuntimeError(f"flow control timeout not reported: {done}")
+    if flow_control_id(cal_id) == cal_id:
+        raise RuntimeError("flow control ID equals the data ID")
+    print("PASS: flow control timeout")
+
+    # An API with bit 9 set is its own flow control ID: refused
+    own_id = cal_id | FLOW_CONTROL_API_BIT
+    frames = senders[1].frames
+    if flow_control_id(own_id) != own_id or \
+            senders[1].send(own_id, bytes(20)) or \
+            senders[1].send(own_id, b"short") or senders[1].frames != frames:
+        raise RuntimeError("sent on an ID with the flow control API bit")
+    handler = CANHandler(_Board(bus))
+    try:
+        ISOTPReceiver(on_message).register(handler, [cal_id, own_id])
+    except ValueError:
+        pass
+    else:
+        raise RuntimeError("registered an ID with the flow control API bit")
+    if handler.handler_table or handler.iteration_handler:
+        raise RuntimeError("a refused registration registered handlers")
+    print("PASS: IDs with the flow control API bit refused")
@@ -0,0 +1,92 @@
+import os
+import tempfile
+from can_logger import CANLogger
+from tools.can_log_formats import read_asc, read_candump, chunks, numpy
+from tools.can_log_reader import CANLogReader
+
+
+CANDUMP = """\
+(1700000000.000100) can0 01011840#0102030405060708
+(1700000000.000200) can0 123#R
+(1700000000.000300) can0 0A080041#DEAD
+  can0  0A080041   [2]  BE EF
+  can0  123   [0]  remote request
+"""
+
+ASC = """\
+date Sat Mar 2 10:00:00.000 am 2024
+base hex  timestamps absolute
+Begin Triggerblock Sat Mar 2 10:00:00.000 am 2024
+   0.000100 1  1011840x        Rx   d 8 01 02 03 04 05 06 07 08
+   0.000200 1  123             Tx   r
+   0.000300 1  ErrorFrame
+   0.000400 1  A080041x        Rx   d 2 DE AD  Length = 240000 BitCount = 62
+End TriggerBlock
+"""
+
+
+class _Frame:
+    def __init__(self, id, data):
+        self.id = id
+        self.extended = True
+        self.data = data
+
+
+"""This is a test wrapper to make sure the streaming readers parse each
+format and that bulk chunks match record by record reads.."""
+if __name__ == "__main__":
+    path = tempfile.mkdtemp()
+    filename = os.path.join(path, "candump.log")
+    with open(filename, "w") as fd:
+        fd.write(CANDUMP)
+    records = list(read_candump(filename))
+    summary = [(r.id, r.extended, r.rtr, r.data.hex()) for r in records]
+    expected = [(0x01011840, True, False, "0102030405060708"),
+                (0x123, False, True, ""),
+                (0x0a080041, True, False, "dead"),
+                (0x0a080041, True, False, "beef"),
+                (0x123, False, True, "")]
+    if summary != expected or records[1].timestamp != 1700000000000200:
+        raise RuntimeError(f"unexpected candump records {summary}")
+    print(f"PASS: {len(records)} candump records")
+
+    filename = os.path.join(path, "log.asc")
+    with open(filename, "w") as fd:
+        fd.write(ASC)
+    records = list(read_asc(filename))
+    summary = [(r.timestamp, r.id, r.rtr, r.tx, r.data.hex())
+               for r in records]
+    expected = [(100, 0x01011840, False, False, "0102030405060708"),
+                (200, 0x123, True, True, ""),
+                (400, 0x0a080041, False, False, "dead")]
+    if summary != expected:
+        raise RuntimeError(f"unexpected ASC records {summary}")
+    print(f"PASS: {len(records)} ASC records")
+
+    if numpy is None:
+        print("SKIP: numpy is not installed, chunks() not tested")
+    else:
+        now = [0]
+        logger = CANLogger(path=path, block_size=1024, chunk_size=512,
+                           clock_us=lambda: now[0],
+                           clock_ms=lambda: now[0] // 1000)
+        logger.open()
+        for i in range(3000):
+            now[0] += 250_000
+            logger.log(_Frame(0x01011840 + i, bytes([i & 0xff] * (i % 9))))
+            logger.flush_step()
+        logger.close()
+        filename = os.path.join(path, "can_0000.bin")
+        with CANLogReader(filename) as reader:
+            times = [r.timestamp for r in reader]
+        bulk = numpy.concatenate([c["timestamp"]
+                                  for c in chunks(filename, 700)])
+        if bulk.tolist() != times:
+            raise RuntimeError("chunk timestamps differ from the reader")
+        print(f"PASS: {len(bulk)} binary frames in chunks match the reader")
+
+        text = numpy.concatenate([c["id"] for c in
+                                  chunks(os.path.join(path, "log.asc"), 2)])
+        if text.tolist() != [0x01011840, 0x123, 0x0a080041]:
+            raise RuntimeError(f"unexpected ASC chunk ids {text}")
+        print("PASS: text log chunks")
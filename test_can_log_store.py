@@ -0,0 +1,65 @@
+import os
+import tempfile
+from ids.heartbeat import HeartBeatMsg
+from tools.can_log_store import build, CANLogStore, numpy
+
+
+REV_STATUS_0 = 0x02051800
+
+
+def heartbeat(match_number, enabled, autonomous):
+    hb = HeartBeatMsg()
+    hb.match_number = match_number
+    hb.enabled = enabled
+    hb.autonomous = autonomous
+    return bytes(hb.data).hex()
+
+
+"""This is a test wrapper to make sure store queries return exactly the
+frames a full scan would.."""
+if __name__ == "__main__":
+    if numpy is None:
+        print("SKIP: numpy is not installed")
+        raise SystemExit
+    path = tempfile.mkdtemp()
+    log = os.path.join(path, "match.log")
+    expected = []
+    with open(log, "w") as fd:
+        for i in range(3000):
+            t = 1000 + i * 0.005
+            if i % 4 == 0:
+                # 1 s disabled, 3 s auto, then teleop
+                phase = (0, 0) if t < 1001 else \
+                    (1, 1) if t < 1004 else (1, 0)
+                fd.write(f"({t:.6f}) can0 {HeartBeatMsg.HEARTBEAT_ID:08X}#"
+                         f"{heartbeat(42, *phase)}\n")
+                continue
+            device = 7 if i % 4 == 1 else 8
+            fd.write(f"({t:.6f}) can0 {REV_STATUS_0 + device:08X}#"
+                     f"{i & 0xff:02X}\n")
+            if device == 7 and 1001 <= t < 1004:
+                expected.append(i & 0xff)
+
+    store_path = os.path.join(path, "qm42.canstore")
+    index = build(log, store_path, chunk_size=512)
+    if index["frames"] != 3000 or len(index["ids"]) != 3:
+        raise RuntimeError(f"unexpected index {index['frames']} frames,"
+                           f" {len(index['ids'])} ids")
+    phases = [p[0] for p in index["matches"][0]["phases"]]
+    if phases != ["disabled", "auto", "teleop"]:
+        raise RuntimeError(f"unexpected match phases {phases}")
+    print(f"PASS: built {index['frames']} frames, phases {phases}")
+
+    store = CANLogStore(store_path)
+    frames = store.query(manufacturer=5, device_number=7, match_number=42,
+                         phase="auto")
+    got = frames["data"][:, 0].tolist()
+    if got != expected:
+        raise RuntimeError(f"query returned {len(got)} frames, expected"
+                           f" {len(expected)}")
+    print(f"PASS: {len(got)} REV device 7 frames during auto in match 42")
+
+    if len(store.rows(match_number=41)) or \
+            len(store.rows(device_number=9)):
+        raise RuntimeError("expected no rows for match 41 / device 9")
+    print("PASS: empty queries")
@@ -0,0 +1,135 @@
+import os
+import tempfile
+from can_logger import CANLogger
+from tools.can_log_reader import CANLogReader
+
+
+class _Frame:
+    def __init__(self, id, data=None, extended=True, length=0):
+        self.id = id
+        self.extended = extended
+        if data is not None:
+            self.data = data
+        else:
+            self.length = length
+
+
+class _Clock:
+    def __init__(self):
+        self.us = 1000
+
+    def clock_us(self):
+        return self.us
+
+    def clock_ms(self):
+        return self.us // 1000
+
+
+"""This is a test wrapper to make sure the logger and reader agree.."""
+if __name__ == "__main__":
+    clock = _Clock()
+    path = tempfile.mkdtemp()
+    logger = CANLogger(path=path, block_size=1024, chunk_size=512,
+                       clock_us=clock.clock_us, clock_ms=clock.clock_ms)
+    logger.open()
+
+    # Enough frames to fill several blocks and wrap the 28-bit timestamp
+    num_frames = 500
+    for i in range(num_frames):
+        clock.us += 1_000_000
+        if i % 50 == 49:
+            logger.log(_Frame(0x123, length=8, extended=False), tx=True)
+        else:
+            logger.log(_Frame(0x01011840 + i, bytes([i & 0xff] * (i % 9))))
+        logger.flush_step()
+    logger.close()
+
+    if logger.dropped != 0:
+        raise RuntimeError(f"expected no dropped records, not"
+                           f" {logger.dropped}")
+    print(f"PASS: {logger.records} records, {logger.blocks_written} blocks,"
+          f" {logger.dropped} dropped")
+
+    filename = os.path.join(path, "can_0000.bin")
+    if os.path.getsize(filename) % 1024:
+        raise RuntimeError("log file is not a whole number of blocks")
+    print("PASS: log file is a whole number of blocks")
+
+    with CANLogReader(filename) as reader:
+        records = list(reader)
+    if len(records) != num_frames:
+        raise RuntimeError(f"expected {num_frames} records, not"
+                           f" {len(records)}")
+    for i, record in enumerate(records):
+        expected_ts = 1000 + (i + 1) * 1_000_000
+        if record.timestamp != expected_ts:
+            raise RuntimeError(f"record {i} timestamp {record.timestamp},"
+                               f" expected {expected_ts}")
+        if i % 50 == 49:
+            if not (record.rtr and record.tx and not record.extended and
+                    record.id == 0x123 and record.dlc == 8):
+                raise RuntimeError(f"record {i} is not the TX RTR: {record}")
+        elif (record.id != 0x01011840 + i or
+                record.data != bytes([i & 0xff] * (i % 9))):
+            raise RuntimeError(f"record {i} mismatch: {record}")
+    print(f"PASS: read back {len(records)} records, last {records[-1]}")
+
+    # Without flush_step() calls both buffers fill and records are dropped
+    logger = CANLogger(path=path, prefix="drop", block_size=512,
+                       chunk_size=512,
+                       clock_us=clock.clock_us, clock_ms=clock.clock_ms)
+    logger.open()
+    for i in range(100):
+        logger.log(_Frame(0x10, bytes(8)))
+    logger.close()
+    if logger.dropped != 100 - (2 * 512 // 16 - 2):
+        raise RuntimeError(f"unexpected dropped count {logger.dropped}")
+    print(f"PASS: {logger.dropped} records dropped with a stalled writer")
+
+    # A new logger (e.g. after a reset) continues the numbering instead of
+    # truncating the previous run's log
+    size = os.path.getsize(filename)
+    logger = CANLogger(path=path, clock_us=clock.clock_us,
+                       clock_ms=clock.clock_ms)
+    logger.open()
+    logger.close()
+    if os.path.getsize(filename) != size:
+        raise RuntimeError("can_0000.bin was overwritten")
+    if not os.path.exists(os.path.join(path, "can_0001.bin")):
+        raise RuntimeError("second run did not write can_0001.bin")
+    print("PASS: a second run continues at can_0001.bin")
+
+    # Rotation is written one chunk per flush_step(), like any other block,
+    # and switching files takes a step of its own
+    path = tempfile.mkdtemp()
+    logger = CANLogger(path=path, block_size=1024, chunk_size=512,
+                       flush_budget_ms=0, max_file_blocks=2,
+                       clock_us=clock.clock_us, clock_ms=clock.clock_ms)
+    logger.open()
+    num_frames = 300
+    written = 0
+    for i in range(num_frames):
+        clock.us += 1000
+        logger.log(_Frame(0x200 + i, bytes([i & 0xff] * 8)))
+        logger.flush_step()
+        # Closed files are on disk, the open one may still be buffered
+        current = logger._file
+        total = current.tell() + sum(
+            os.path.getsize(os.path.join(path, name))
+            for name in os.listdir(path)
+            if os.path.join(path, name) != current.name)
+        if total - written > 512:
+            raise RuntimeError(f"flush_step wrote {total - written} bytes")
+        written = total
+    logger.close()
+    names = sorted(os.listdir(path))
+    if len(names) < 3:
+        raise RuntimeError(f"expected several log files, not {names}")
+    records = []
+    for name in names:
+        with CANLogReader(os.path.join(path, name)) as reader:
+            records.extend(reader)
+    if [record.id for record in records] != \
+            [0x200 + i for i in range(num_frames)]:
+        raise RuntimeError("records lost or reordered across rotation")
+    print(f"PASS: rotated over {len(names)} files within the flush budget")
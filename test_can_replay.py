@@ -0,0 +1,111 @@
+import io
+import os
+import tempfile
+from can_handler import CANHandler
+from tools.can_log_formats import read_candump
+from tools.can_replay import CANReplay, MODE_FAST, MODE_ORIGINAL, \
+    MODE_SCALED
+
+
+LOG = """\
+(100.000000) can0 01011840#0000000000000001
+(100.020000) can0 01011840#0000000000000002
+(100.040000) can0 0A080041#R
+(100.040500) can0 0A080041#0102 T
+(100.060000) can0 01011840#0000000000000003
+"""
+
+# What the application sends, with a step every 10 ms between frames
+OUTPUTS = """\
+(100.000000) replay 0A080042#01A0860100
+(100.000000) replay 0A080043#01
+(100.020000) replay 0A080042#02B4860100
+(100.020000) replay 0A080043#03
+(100.040000) replay 0A080041#0102
+(100.040000) replay 0A080043#05
+(100.060000) replay 0A080042#03DC860100
+(100.060000) replay 0A080043#07
+"""
+
+
+class _Application:
+    """Answers each heartbeat with its last byte and the virtual time it
+    saw it, answers the version RTR, and sends a status frame with its
+    iteration count from its iteration handler every 20 ms."""
+
+    HEARTBEAT_ID = 0x01011840
+    VERSION_ID = 0x0a080041
+    REPLY_ID = 0x0a080042
+    STATUS_ID = 0x0a080043
+
+    def __init__(self, carrier_board, clock):
+        self.clock = clock
+        self.iterations = 0
+        self._status_ms = None
+        self.handler = CANHandler(carrier_board)
+        self.handler.register_msg_handler(self.HEARTBEAT_ID, self.heartbeat)
+        self.handler.register_rtr_handler(self.VERSION_ID, self.version)
+        self.handler.register_iteration_handler(self.iterate)
+
+    def heartbeat(self, message):
+        return self.handler.Message(
+            self.REPLY_ID, bytes([message.data[7]]) +
+            self.clock.clock_ms().to_bytes(4, "little"), extended=True)
+
+    def version(self, message):
+        return self.handler.Message(self.VERSION_ID, b"\x01\x02",
+                                    extended=True)
+
+    def iterate(self):
+        self.iterations += 1
+        _now = self.clock.clock_ms()
+        if self._status_ms is not None and _now - self._status_ms < 20:
+            return None
+        self._status_ms = _now
+        return self.handler.Message(self.STATUS_ID,
+                                    bytes([self.iterations]), extended=True)
+
+
+def _build_handler(carrier_board, clock):
+    _build_handler.application = _Application(carrier_board, clock)
+    return _build_handler.application.handler
+
+
+def _outputs(replay):
+    with tempfile.TemporaryDirectory() as _directory:
+        _filename = os.path.join(_directory, "outputs.log")
+        replay.write_outputs(_filename)
+        with open(_filename) as _fd:
+            return _fd.read()
+
+
+"""This is a test wrapper to make sure a CANHandler replays the same in
+every timing mode, deterministically.."""
+if __name__ == "__main__":
+    runs = []
+    for _ in range(2):
+        replay = CANReplay(_build_handler, MODE_FAST, step_period_us=10000)
+        replay.run(read_candump(io.StringIO(LOG)))
+        runs.append(_outputs(replay))
+    if runs[0] != OUTPUTS or runs[1] != runs[0]:
+        raise RuntimeError(f"unexpected outputs:\n{runs[0]}")
+    if replay.frames != 4 or replay.steps != 7 or \
+            _build_handler.application.iterations != 7:
+        raise RuntimeError(f"expected the TX frame skipped and 7 steps:"
+                           f" {replay.stats()}")
+    fast_s = replay.wall_s
+    print(f"PASS: deterministic outputs, stats {replay.stats()}")
+
+    for mode, speed, log_s in ((MODE_SCALED, 4, 0.015),
+                               (MODE_ORIGINAL, 1, 0.06)):
+        replay = CANReplay(_build_handler, mode, speed=speed,
+                           step_period_us=10000)
+        replay.run(read_candump(io.StringIO(LOG)))
+        if _outputs(replay) != OUTPUTS:
+            raise RuntimeError(f"{mode} outputs differ:\n"
+                               f"{_outputs(replay)}")
+        if not log_s <= replay.wall_s < log_s + 0.1 or \
+                replay.wall_s <= fast_s:
+            raise RuntimeError(f"{mode} replay of 60 ms took"
+                               f" {replay.wall_s} s")
+        print(f"PASS: {mode} replay took {replay.wall_s:.3f} s")
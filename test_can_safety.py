@@ -0,0 +1,121 @@
+from backends.virtual_can import CAN, Message, VirtualBus
+from can_handler import CANHandler
+
+
+class _Clock:
+    def __init__(self):
+        self.us = 0
+
+    def clock_us(self):
+        return self.us
+
+
+class _Board:
+    def __init__(self, bus, clock, events):
+        self.can = CAN(bus)
+        self.listener = self.can.listen(timeout=0)
+        self.clock = clock
+        self.events = events
+
+    def disable_pwm(self):
+        self.clock.us += 40
+        self.events.append("pwm off")
+
+    def disable_motor(self):
+        self.clock.us += 40
+        self.events.append("motor off")
+
+
+class _Logger:
+    def __init__(self, events):
+        self.events = events
+
+    def log(self, message, tx=False):
+        self.events.append(f"log {message.id:x}")
+
+    def flush_step(self):
+        pass
+
+
+"""This is a test wrapper to make sure broadcast DISABLE turns the outputs
+off before anything else looks at the frame.."""
+if __name__ == "__main__":
+    clock = _Clock()
+    events = []
+    bus = VirtualBus()
+    roborio = CAN(bus)
+    board = _Board(bus, clock, events)
+    handler = CANHandler(board, drain_queue=True)
+    handler.clock_us = clock.clock_us
+    handler.safety_budget_us = 100
+    handler.register_logger(_Logger(events))
+    handler.register_output_disable()
+    handler.register_msg_handler(
+        CANHandler.BROADCAST_DISABLE_ID,
+        lambda _message: events.append("disable handler"))
+    resumed = []
+    handler.register_safety_handler(CANHandler.BROADCAST_SYSTEM_RESUME_ID,
+                                    resumed.append)
+
+    roborio.send(Message(0x0a080041, b"\x01", extended=True))
+    roborio.send(Message(CANHandler.BROADCAST_DISABLE_ID, b"",
+                         extended=True))
+    # A standard frame with the same ID is not a broadcast
+    roborio.send(Message(CANHandler.BROADCAST_SYSTEM_HALT_ID, b"",
+                         extended=False))
+    handler.step()
+
+    expected = ["log a080041", "pwm off", "motor off", "log 0",
+                "disable handler", "log 40"]
+    if events != expected:
+        raise RuntimeError(f"unexpected order {events}")
+    stats = handler.safety_stats()
+    if stats["count"] != 1 or stats["last_us"] != 80 or stats["late"] != 0:
+        raise RuntimeError(f"unexpected stats {stats}")
+    print(f"PASS: outputs off before logging and handlers, {stats}")
+
+    handler.safety_budget_us = 50
+    roborio.send(Message(CANHandler.BROADCAST_SYSTEM_HALT_ID, b"",
+                         extended=True))
+    roborio.send(Message(CANHandler.BROADCAST_SYSTEM_RESUME_ID, b"",
+                         extended=True))
+    handler.step()
+    stats = handler.safety_stats()
+    if stats["count"] != 3 or stats["max_us"] != 80 or \
+            stats["late"] != 1 or len(resumed) != 1:
+        raise RuntimeError(f"unexpected stats {stats}")
+    print(f"PASS: halt over budget counted, resume handled, {stats}")
+
+    # Boards without PWM/motor outputs register nothing
+    plain = CANHandler(roborio)
+    plain.register_output_disable()
+    if plain.safety_table:
+        raise RuntimeError("registered handlers for missing outputs")
+    print("PASS: no outputs, no safety handlers")
+
+    # The broadcast IDs are the FRC ones: device type, manufacturer and
+    # device number 0, the API class in the API field
+    if (CANHandler.BROADCAST_DISABLE_ID, CANHandler.BROADCAST_SYSTEM_HALT_ID,
+            CANHandler.BROADCAST_SYSTEM_RESET_ID,
+            CANHandler.BROADCAST_SYSTEM_RESUME_ID) != \
+            (0x00000000, 0x00000040, 0x00000080, 0x00000280):
+        raise RuntimeError("unexpected broadcast IDs")
+    print("PASS: broadcast IDs")
+
+    # Without drain_queue one frame is pulled per step: a DISABLE behind
+    # two queued frames is acted on in the third step
+    events.clear()
+    board = _Board(bus, clock, events)
+    handler = CANHandler(board)
+    handler.register_output_disable()
+    roborio.send(Message(0x0a080041, b"\x01", extended=True))
+    roborio.send(Message(0x0a080041, b"\x02", extended=True))
+    roborio.send(Message(CANHandler.BROADCAST_DISABLE_ID, b"",
+                         extended=True))
+    steps = 0
+    while not events:
+        handler.step()
+        steps += 1
+    if steps != 3 or board.listener.in_waiting():
+        raise RuntimeError(f"DISABLE acted on after {steps} steps")
+    print("PASS: DISABLE waits behind queued frames without drain_queue")
@@ -0,0 +1,77 @@
+import io
+from backends.virtual_can import CAN, Message, RemoteTransmissionRequest
+from backends.virtual_can import VirtualBus
+from can_handler import CANHandler
+from can_trace import CANTrace
+from tools.can_latency import analyze, over_limit, parse
+
+
+class _Clock:
+    """Advances 10 us every time it is read, close to the 32-bit wrap."""
+
+    def __init__(self):
+        self.us = CANTrace.TIME_MASK - 50
+
+    def clock_us(self):
+        self.us += 10
+        return self.us
+
+
+class _Board:
+    def __init__(self, bus):
+        self.can = CAN(bus)
+        self.listener = self.can.listen(timeout=0)
+
+
+"""This is a test wrapper to make sure handler latencies are traced and
+exported for the host tools.."""
+if __name__ == "__main__":
+    bus = VirtualBus()
+    roborio = CAN(bus)
+    replies = roborio.listen(timeout=0)
+    board = _Board(bus)
+    handler = CANHandler(board, drain_queue=True)
+    tracer = CANTrace(size=4, clock_us=_Clock().clock_us)
+    handler.register_tracer(tracer)
+    handler.register_rtr_handler(
+        0x0a080041, lambda _rtr: Message(0x0a080041, b"\x01\x02",
+                                         extended=True))
+    handler.register_msg_handler(0x01011840, lambda _message: None)
+
+    for _ in range(3):
+        roborio.send(Message(0x01011840, bytes(8), extended=True))
+        roborio.send(RemoteTransmissionRequest(0x0a080041, 2,
+                                               extended=True))
+    handler.step()
+
+    if replies.in_waiting() != 3:
+        raise RuntimeError(f"expected 3 replies, got {replies.in_waiting()}")
+    if tracer.records != 6 or len(tracer) != 4 or tracer.overwritten != 2:
+        raise RuntimeError(f"ring holds {len(tracer)} of {tracer.records}"
+                           f" records, {tracer.overwritten} overwritten")
+    print(f"PASS: {tracer.records} records traced, {tracer.overwritten}"
+          f" overwritten")
+
+    # Export a piece at a time, as an iteration handler would
+    stream = io.StringIO()
+    stream.write("some other console output\n")
+    if tracer.export(stream, 3) != 3 or tracer.export(stream) != 1:
+        raise RuntimeError("export did not write the requested records")
+    if len(tracer) != 0:
+        raise RuntimeError("exported records were not removed")
+    records = parse(stream.getvalue().splitlines())
+    if [r[0] for r in records] != [0x01011840, 0x0a080041] * 2:
+        raise RuntimeError(f"unexpected records {records}")
+    print(f"PASS: exported {len(records)} records, oldest first")
+
+    # Every clock read is 10 us, including across the wrap
+    result = analyze(records)
+    rtr = result[0x0a080041]
+    if not rtr["rtr"] or rtr["reply"]["count"] != 2 or \
+            rtr["reply"]["max"] != 30 or rtr["handler"]["p50"] != 10:
+        raise RuntimeError(f"unexpected RTR latencies {rtr}")
+    if result[0x01011840]["reply"]["count"] != 0:
+        raise RuntimeError("a frame without a reply has reply latency")
+    if over_limit(result, 20) != [0x0a080041] or over_limit(result, 30):
+        raise RuntimeError("reply limit check failed")
+    print(f"PASS: RTR reply latency {rtr['reply']}")
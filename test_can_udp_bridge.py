@@ -0,0 +1,110 @@
+import socket
+import struct
+import time
+from backends.virtual_can import (
+    CAN, VirtualBus, Message, RemoteTransmissionRequest
+)
+from can_udp_bridge import CANUDPBridge
+
+
+def _free_port():
+    _s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    _s.bind(("127.0.0.1", 0))
+    _port = _s.getsockname()[1]
+    _s.close()
+    return _port
+
+
+def _parse(datagram):
+    _, _, _, _count = struct.unpack_from(">BBBH", datagram, 0)
+    _offset = 5
+    _frames = []
+    for _ in range(_count):
+        _can_id, _length = struct.unpack_from(">IB", datagram, _offset)
+        _offset += 5
+        if _can_id & CANUDPBridge.CAN_RTR_FLAG:
+            _frames.append((_can_id, _length, None))
+        else:
+            _frames.append((_can_id, _length,
+                            datagram[_offset:_offset + _length]))
+            _offset += _length
+    return _frames
+
+
+"""End to end test of the bridge, with the CPython socket module standing in
+for the WIZNET5K socket pool and a virtual CAN bus for the robot."""
+if __name__ == "__main__":
+    bus = VirtualBus()
+    robot = CAN(bus)
+    robot_listener = robot.listen()
+    bridge_can = CAN(bus)
+
+    host = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    host.bind(("127.0.0.1", 0))
+    host.settimeout(1.0)
+
+    bridge_port = _free_port()
+    bridge = CANUDPBridge(socket, can=bridge_can,
+                          listener=bridge_can.listen(),
+                          local_port=bridge_port,
+                          remote=host.getsockname(),
+                          max_frames=16, max_latency_ms=5)
+
+    # Robot to host, batched by count: 40 frames -> 16 + 16 + (8 by time)
+    for i in range(40):
+        robot.send(Message(id=0x0a080040 + i, data=bytes([i] * (i % 9)),
+                           extended=True))
+    bridge.step()
+    bridge.step()
+    bridge.step()
+    time.sleep(0.01)
+    bridge.step()
+
+    received = []
+    datagrams = 0
+    while len(received) < 40:
+        received += _parse(host.recv(2048))
+        datagrams += 1
+    if datagrams != 3:
+        raise RuntimeError(f"expected 3 datagrams, not {datagrams}")
+    for i, (can_id, length, data) in enumerate(received):
+        if can_id != (0x0a080040 + i) | CANUDPBridge.CAN_EFF_FLAG or \
+                data != bytes([i] * (i % 9)):
+            raise RuntimeError(f"frame {i} mismatch: {can_id:x} {data}")
+    print(f"PASS: 40 frames reached the host in {datagrams} datagrams")
+
+    # Host to robot: a datagram with a standard frame and an RTR
+    datagram = struct.pack(">BBBH", 2, 0, 0, 2) + \
+        struct.pack(">IB", 0x123, 2) + b"\x01\x02" + \
+        struct.pack(">IB", 0x01011840 | CANUDPBridge.CAN_EFF_FLAG |
+                    CANUDPBridge.CAN_RTR_FLAG, 8)
+    host.sendto(datagram, ("127.0.0.1", bridge_port))
+    time.sleep(0.01)
+    bridge.step()
+    injected = list(robot_listener)
+    expected = [
+        Message(id=0x123, data=b"\x01\x02", extended=False),
+        RemoteTransmissionRequest(id=0x01011840, length=8, extended=True)
+    ]
+    if injected != expected:
+        raise RuntimeError(f"expected {expected}, not {injected}")
+    print(f"PASS: host frames injected onto the bus: {injected}")
+
+    # A frame longer than 8 bytes is counted as bad instead of raising
+    # out of step(); frames before it still go out
+    datagram = struct.pack(">BBBH", 2, 0, 1, 2) + \
+        struct.pack(">IB", 0x124, 1) + b"\x03" + \
+        struct.pack(">IB", 0x125, 9) + bytes(9)
+    host.sendto(datagram, ("127.0.0.1", bridge_port))
+    time.sleep(0.01)
+    bridge.step()
+    injected = list(robot_listener)
+    if injected != [Message(id=0x124, data=b"\x03", extended=False)]:
+        raise RuntimeError(f"unexpected frames {injected}")
+    if bridge.bad_datagrams != 1:
+        raise RuntimeError(f"expected 1 bad datagram, not"
+                           f" {bridge.bad_datagrams}")
+    print("PASS: an over-long frame is counted in bad_datagrams")
+
+    bridge.close()
+    host.close()
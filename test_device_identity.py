@@ -0,0 +1,92 @@
+from backends.virtual_can import CAN, VirtualBus
+from can_handler import CANHandler
+from device_identity import DeviceIdentity, SLOTS, response_slot
+from ids.msg_format import FRCCANDevice
+from tools.can_discover import Discovery
+
+
+class _Clock:
+    def __init__(self):
+        self.ms = 1000
+
+    def clock_ms(self):
+        return self.ms
+
+
+class _Board:
+    def __init__(self, bus):
+        self.can = CAN(bus)
+        self.listener = self.can.listen(timeout=0)
+
+
+def _inventory(discovery, handlers, clock, round_number=0):
+    discovery.start(round_number)
+    while True:
+        clock.ms += 1
+        for _handler in handlers:
+            _handler.step()
+        if not discovery.poll():
+            return
+
+
+"""This is a test wrapper to make sure one broadcast finds every device.."""
+if __name__ == "__main__":
+    clock = _Clock()
+    bus = VirtualBus()
+    handlers = []
+    identities = []
+    # 40 team devices of two types, plus one misconfigured duplicate ID
+    devices = [(FRCCANDevice.DEVICE_TYPE_MISCELLANEOUS, _n)
+               for _n in range(1, 31)]
+    devices += [(FRCCANDevice.DEVICE_TYPE_IO_BREAKOUT, _n)
+                for _n in range(1, 11)]
+    devices += [(FRCCANDevice.DEVICE_TYPE_IO_BREAKOUT, 5)]
+    for _serial, (_type, _number) in enumerate(devices):
+        _handler = CANHandler(_Board(bus), drain_queue=True)
+        _identity = DeviceIdentity(_type, FRCCANDevice.MANUF_TEAM_USE,
+                                   _number, (1, 2, 3), 0x1000 + _serial,
+                                   clock_ms=clock.clock_ms)
+        _identity.register(_handler)
+        handlers.append(_handler)
+        identities.append(_identity)
+
+    host = CAN(bus)
+    discovery = Discovery(host, host.listen(timeout=0),
+                          clock_ms=clock.clock_ms)
+    _inventory(discovery, handlers, clock)
+    found = sum(len(_r) for _r in discovery.devices.values())
+    if found != len(devices):
+        raise RuntimeError(f"found {found} of {len(devices)} devices")
+    if clock.ms - 1000 >= 1000:
+        raise RuntimeError(f"inventory took {clock.ms - 1000} ms")
+    if len(discovery.conflicts()) != 1:
+        raise RuntimeError(f"expected one conflict, {discovery.conflicts()}")
+    _reply = discovery.devices[identities[0].reply_id][0]
+    if _reply["firmware_version"] != (1, 2, 3) or \
+            _reply["serial"] != 0x1000 or _reply["device_number"] != 1:
+        raise RuntimeError(f"unexpected reply {_reply}")
+    print(f"PASS: {found} devices in {clock.ms - 1000} ms,"
+          f" conflict on 0x{discovery.conflicts()[0]:08x}")
+
+    # Replies are spread over the slots, and reshuffled by the round
+    slots = [response_slot(_i.device_type, _i.manufacturer,
+                           _i.device_number) for _i in identities]
+    busiest = max(slots.count(_s) for _s in range(SLOTS))
+    if len(set(slots)) < SLOTS // 2 or busiest > 5:
+        raise RuntimeError(f"replies bunched up: {sorted(slots)}")
+    reshuffled = [response_slot(_i.device_type, _i.manufacturer,
+                                _i.device_number, 1) for _i in identities]
+    if reshuffled == slots:
+        raise RuntimeError("round 1 did not reshuffle the slots")
+    print(f"PASS: {len(set(slots))} slots used, at most {busiest} replies"
+          f" per slot")
+
+    # DEVICE_QUERY only wakes up the matching device type
+    discovery = Discovery(host, host.listen(timeout=0),
+                          device_type=FRCCANDevice.DEVICE_TYPE_IO_BREAKOUT,
+                          clock_ms=clock.clock_ms)
+    _inventory(discovery, handlers, clock, 1)
+    found = sum(len(_r) for _r in discovery.devices.values())
+    if found != 11 or identities[0].requests != 1:
+        raise RuntimeError(f"query found {found} devices")
+    print(f"PASS: query for IO breakouts found {found} devices")
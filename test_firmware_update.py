@@ -0,0 +1,171 @@
+import os
+import tempfile
+from backends.virtual_can import CAN, Message, VirtualBus
+from can_handler import CANHandler
+from firmware_update import API_BLOCK_END, API_FINISH, API_PATH, \
+    API_START, ERROR_NO_PATH, ERROR_NONE, MAX_PATH, STATE_ERROR, STATE_IDLE, \
+    STATE_RECEIVING, FirmwareUpdateReceiver, update_id
+from tools.can_update import PHASE_DONE, UpdateSender
+
+
+class _Clock:
+    def __init__(self):
+        self.ms = 0
+
+    def clock_ms(self):
+        return self.ms
+
+
+class _LossyListener:
+    """Drops every drop_every'th frame it receives."""
+
+    def __init__(self, listener, drop_every):
+        self.listener = listener
+        self.drop_every = drop_every
+        self.received = 0
+        self.dropped = 0
+
+    def receive(self):
+        message = self.listener.receive()
+        if message is not None and self.drop_every:
+            self.received += 1
+            if self.received % self.drop_every == 0:
+                self.dropped += 1
+                message = self.listener.receive()
+        return message
+
+    def in_waiting(self):
+        return self.listener.in_waiting()
+
+
+class _Board:
+    def __init__(self, bus, drop_every=0):
+        self.can = CAN(bus)
+        self.listener = _LossyListener(self.can.listen(timeout=0),
+                                       drop_every)
+
+
+def _device(bus, number, root, drop_every=0):
+    handler = CANHandler(_Board(bus, drop_every), drain_queue=True)
+    receiver = FirmwareUpdateReceiver(number, root=root)
+    receiver.register(handler)
+    return handler, receiver
+
+
+def _run(sender, handlers, clock, max_polls=None):
+    sender.start()
+    polls = 0
+    while sender.poll():
+        clock.ms += 1
+        for handler in handlers:
+            handler.step()
+        polls += 1
+        if max_polls and polls == max_polls:
+            return
+
+
+"""This is a test wrapper to make sure files arrive whole, resume and
+multicast.."""
+if __name__ == "__main__":
+    clock = _Clock()
+    data = bytes((i * 7 + i // 256) & 0xff for i in range(20000))
+    bus = VirtualBus()
+    host = CAN(bus)
+    root = tempfile.mkdtemp()
+
+    # Unicast, interrupted after a few polls then resumed
+    handler, receiver = _device(bus, 3, root)
+    sender = UpdateSender(host, host.listen(timeout=0), "lib/code.py", data,
+                          [3], window=4, clock_ms=clock.clock_ms)
+    os.mkdir(os.path.join(root, "lib"))
+    _run(sender, [handler], clock, max_polls=10)
+    partial = receiver.blocks_received
+    if not 0 < partial < sender.blocks:
+        raise RuntimeError(f"expected a partial transfer, {partial} blocks")
+    sender = UpdateSender(host, host.listen(timeout=0), "lib/code.py", data,
+                          [3], window=4, clock_ms=clock.clock_ms)
+    _run(sender, [handler], clock)
+    if sender.phase != PHASE_DONE or sender.resumed_from != partial:
+        raise RuntimeError(f"resume failed: {sender.stats()}")
+    with open(os.path.join(root, "lib", "code.py"), "rb") as fd:
+        if fd.read() != data:
+            raise RuntimeError("resumed file differs")
+    if os.path.exists(os.path.join(root, "lib", "code.py.part")):
+        raise RuntimeError("partial file left behind")
+    stats = sender.stats()
+    if stats["efficiency"] < 0.45:
+        raise RuntimeError(f"low efficiency {stats}")
+    print(f"PASS: resumed at block {partial}, {stats}")
+
+    # Multicast to three devices, one of them losing frames
+    bus = VirtualBus()
+    host = CAN(bus)
+    devices = [_device(bus, 10 + i, tempfile.mkdtemp(),
+                       drop_every=500 if i == 1 else 0) for i in range(3)]
+    sender = UpdateSender(host, host.listen(timeout=0), "code.py", data,
+                          [10, 11, 12], group=63, clock_ms=clock.clock_ms)
+    _run(sender, [handler for handler, _ in devices], clock)
+    if sender.phase != PHASE_DONE:
+        raise RuntimeError(f"multicast failed: {sender.error}")
+    for _, receiver in devices:
+        with open(os.path.join(receiver.root, "code.py"), "rb") as fd:
+            if fd.read() != data:
+                raise RuntimeError(f"device {receiver.device_number} file"
+                                   f" differs")
+    lossy = devices[1][0].cb.listener
+    if lossy.dropped == 0 or sender.rewinds == 0:
+        raise RuntimeError("the lossy device did not lose frames")
+    if sender.blocks_sent > 2 * sender.blocks:
+        raise RuntimeError(f"too many blocks resent {sender.stats()}")
+    print(f"PASS: multicast to 3 devices, {lossy.dropped} frames lost,"
+          f" {sender.stats()}")
+
+    # Truncated control frames are dropped and counted, not raised out of
+    # step()
+    bus = VirtualBus()
+    host = CAN(bus)
+    handler, receiver = _device(bus, 5, tempfile.mkdtemp())
+    for api, payload in ((API_START, b"\x01\x02"), (API_BLOCK_END, b""),
+                         (API_FINISH, bytes(9))):
+        host.send(Message(update_id(api, 5), payload, extended=True))
+        handler.step()
+    if receiver.frames_malformed != 3 or receiver.state != STATE_IDLE:
+        raise RuntimeError(f"{receiver.frames_malformed} malformed frames")
+    print("PASS: malformed control frames dropped")
+
+    def _start_after(receiver, chunks):
+        for chunk in chunks:
+            receiver.path(Message(update_id(API_PATH, 5), chunk,
+                                  extended=True))
+        receiver.start(Message(update_id(API_START, 5), bytes(8),
+                               extended=True))
+        return receiver.state, receiver.error
+
+    # A lost middle chunk, a path over MAX_PATH and bad UTF-8 all refuse
+    # the START instead of writing to the wrong file
+    root = tempfile.mkdtemp()
+    receiver = FirmwareUpdateReceiver(5, root=root)
+    receiver.Message = Message
+    path = b"lib/sensor_driver.py"
+    chunks = [bytes([i // 7]) + path[i:i + 7] for i in range(0, len(path), 7)]
+    long_path = bytes(87)
+    for case in (chunks[:1] + chunks[2:],
+                 [bytes([i // 7]) + long_path[i:i + 7]
+                  for i in range(0, len(long_path), 7)],
+                 [b"\x00\xff\xfe.py"]):
+        if _start_after(receiver, case) != (STATE_ERROR, ERROR_NO_PATH):
+            raise RuntimeError(f"START accepted after {case}")
+    if os.listdir(root):
+        raise RuntimeError(f"files written {os.listdir(root)}")
+    os.mkdir(os.path.join(root, "lib"))
+    if _start_after(receiver, chunks) != (STATE_RECEIVING, ERROR_NONE) or \
+            receiver._target != root.rstrip("/") + "/lib/sensor_driver.py":
+        raise RuntimeError("the whole path was refused")
+    try:
+        UpdateSender(host, host.listen(timeout=0), "x" * (MAX_PATH + 1),
+                     data, [5])
+    except ValueError:
+        pass
+    else:
+        raise RuntimeError("the sender took a path over MAX_PATH")
+    print("PASS: lost, overlong and undecodable paths refused")
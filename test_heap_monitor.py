@@ -0,0 +1,163 @@
+from backends.virtual_can import CAN, Message, VirtualBus
+from can_handler import CANHandler
+from heap_monitor import HEARTBEAT_ID, HeapMonitor
+
+
+class _Clock:
+    def __init__(self):
+        self.us = 0
+
+    def clock_us(self):
+        return self.us
+
+
+class _GC:
+    """Stands in for CircuitPython's gc: allocations lower the free heap,
+    a collection gives back all but leak bytes and takes 1 us per 100
+    bytes recovered."""
+
+    def __init__(self, clock, heap=100000, leak=0):
+        self.clock = clock
+        self.heap = heap
+        self.free = heap
+        self.leak = leak
+        self.leaked = 0
+        self.enabled = True
+        self.auto_threshold = 20000
+
+    def mem_free(self):
+        return self.free
+
+    def alloc(self, size):
+        if self.enabled and self.free - size < self.auto_threshold:
+            self.collect()
+        self.free -= size
+
+    def block(self, size):
+        """An allocation that stays garbage until collected."""
+        if size > self.free and self.enabled:
+            self.collect()
+        if size > self.free:
+            raise MemoryError(size)
+        self.free -= size
+        return size
+
+    def collect(self):
+        self.leaked += self.leak
+        self.clock.us += (self.heap - self.leaked - self.free) // 100
+        self.free = self.heap - self.leaked
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+
+class _Board:
+    def __init__(self, bus):
+        self.can = CAN(bus)
+        self.listener = self.can.listen(timeout=0)
+
+
+def _run(monitor, fake_gc, clock, steps):
+    bus = VirtualBus()
+    roborio = CAN(bus)
+    handler = CANHandler(_Board(bus), drain_queue=True)
+    handler.register_heap_monitor(monitor)
+    handler.register_msg_handler(HEARTBEAT_ID,
+                                 lambda _message: fake_gc.alloc(64))
+    handler.register_msg_handler(0x0a080041,
+                                 lambda _message: fake_gc.alloc(1000))
+    handler.register_iteration_handler(lambda: fake_gc.alloc(16))
+    for step in range(steps):
+        clock.us += 1000
+        if step % 20 == 0:
+            roborio.send(Message(HEARTBEAT_ID, bytes(8), extended=True))
+        roborio.send(Message(0x0a080041, bytes(2), extended=True))
+        handler.step()
+    return handler
+
+
+"""This is a test wrapper to make sure allocations are accounted and
+collections only run in the idle windows.."""
+if __name__ == "__main__":
+    clock = _Clock()
+    fake_gc = _GC(clock, leak=100)
+    monitor = HeapMonitor(auto_gc=False, collect_below=30000,
+                          collect_interval_ms=0, emergency_below=2000,
+                          fragmentation_every=0, gc_module=fake_gc,
+                          clock_us=clock.clock_us)
+    if fake_gc.enabled:
+        raise RuntimeError("the automatic GC was not disabled")
+    _run(monitor, fake_gc, clock, 2000)
+    stats = monitor.stats()
+
+    calls, allocated, most = monitor.handlers[0x0a080041]
+    if calls != 2000 or allocated != 2000 * 1000 or most != 1000:
+        raise RuntimeError(f"handler not accounted: {calls} {allocated}")
+    if monitor.handlers[-1][1] != 2000 * 16:
+        raise RuntimeError("iteration handler not accounted")
+    if stats["auto_collections"] != 0:
+        raise RuntimeError("an automatic collection was seen")
+    if stats["collections_by_reason"][HeapMonitor.REASON_EMERGENCY] or \
+            not stats["collections_by_reason"][HeapMonitor.REASON_IDLE]:
+        raise RuntimeError(f"collections outside idle windows {stats}")
+    if stats["step_alloc_max"] != 1000 + 64 + 16:
+        raise RuntimeError(f"step allocation {stats['step_alloc_max']}")
+    if not stats["leak_bytes_per_min"] or \
+            stats["leak_bytes_per_min"] > -100:
+        raise RuntimeError(f"leak not detected {stats}")
+    if stats["pause_max_us"] < 700:
+        raise RuntimeError(f"pause not measured {stats}")
+    print(f"PASS: scheduled collections {stats}")
+
+    # With the automatic GC on, its pauses inside handlers are counted
+    clock = _Clock()
+    fake_gc = _GC(clock)
+    monitor = HeapMonitor(gc_module=fake_gc, clock_us=clock.clock_us,
+                          collect_interval_ms=0, collect_below=0,
+                          emergency_below=0)
+    _run(monitor, fake_gc, clock, 500)
+    if monitor.auto_collections == 0 or monitor.collections != 0:
+        raise RuntimeError(f"automatic collections missed {monitor.stats()}")
+    if monitor.leak_rate() is not None:
+        raise RuntimeError("leak rate without samples")
+    print(f"PASS: {monitor.auto_collections} automatic collections seen")
+
+    # Fragmentation: on the host the whole free heap is one block
+    if monitor.measure_fragmentation(50000) > 0.01 or \
+            monitor.largest_block < 49900:
+        raise RuntimeError(f"fragmentation {monitor.fragmentation}")
+    print(f"PASS: largest block {monitor.largest_block}")
+
+    # With the automatic GC off, a failed probe does not collect the
+    # earlier ones
+    clock = _Clock()
+    fake_gc = _GC(clock)
+    monitor = HeapMonitor(auto_gc=False, gc_module=fake_gc,
+                          clock_us=clock.clock_us)
+    fragmentation = monitor.measure_fragmentation(allocate=fake_gc.block)
+    if fragmentation > 0.01 or fake_gc.free != fake_gc.heap:
+        raise RuntimeError(f"fragmentation {fragmentation}, largest block"
+                           f" {monitor.largest_block}, {fake_gc.free}"
+                           f" bytes left free")
+    print(f"PASS: largest block {monitor.largest_block} with the GC off")
+
+    # The fragmentation probe collects repeatedly: it is part of the pause
+    clock = _Clock()
+    fake_gc = _GC(clock)
+    collect = fake_gc.collect
+
+    def _slow_collect():
+        collect()
+        clock.us += 10
+
+    fake_gc.collect = _slow_collect
+    monitor = HeapMonitor(auto_gc=False, fragmentation_every=1,
+                          gc_module=fake_gc, clock_us=clock.clock_us)
+    pause = monitor.collect()
+    if pause < 100 or monitor.pause_max_us != pause:
+        raise RuntimeError(f"probe not in the pause: {pause},"
+                           f" {monitor.stats()}")
+    print(f"PASS: {pause} us pause including the fragmentation probe")
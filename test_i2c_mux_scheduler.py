@@ -0,0 +1,145 @@
+from carrier_board.i2c_mux_scheduler import I2CMuxScheduler
+
+
+class _Clock:
+    def __init__(self):
+        self.ms = 0
+
+    def clock_ms(self):
+        return self.ms
+
+
+class _I2C:
+    """A busio.I2C with a mux at 0x70. Records every mux channel select
+    and which channel each sensor read went to; fail_reads makes that
+    many reads raise OSError."""
+
+    def __init__(self, mux_address=0x70):
+        self.mux_address = mux_address
+        self.selected = None
+        self.selects = []
+        self.reads = []
+        self.fail_reads = 0
+        self.locked = False
+
+    def try_lock(self):
+        if self.locked:
+            return False
+        self.locked = True
+        return True
+
+    def unlock(self):
+        self.locked = False
+
+    def writeto(self, address, buffer, **kwargs):
+        if not self.locked:
+            raise RuntimeError("bus not locked")
+        if address == self.mux_address:
+            self.selected = buffer[0]
+            self.selects.append(buffer[0])
+
+    def readfrom_into(self, address, buffer, **kwargs):
+        if not self.locked:
+            raise RuntimeError("bus not locked")
+        if self.fail_reads:
+            self.fail_reads -= 1
+            raise OSError(5)
+        self.reads.append((address, self.selected))
+
+
+def _sensor(channel, address, log, name):
+    """A poll reading one byte from the sensor at address, the way
+    adafruit_bus_device does."""
+    _buffer = bytearray(1)
+
+    def _poll():
+        log.append(name)
+        while not channel.try_lock():
+            pass
+        try:
+            channel.readfrom_into(address, _buffer)
+        finally:
+            channel.unlock()
+    return _poll
+
+
+"""This is a test wrapper to make sure the mux scheduler skips redundant
+selects, polls round-robin within its budget and resets a stuck mux.."""
+if __name__ == "__main__":
+    i2c = _I2C()
+    clock = _Clock()
+    resets = []
+    scheduler = I2CMuxScheduler(i2c, num_channels=4,
+                                reset=lambda: resets.append(clock.ms),
+                                clock_ms=clock.clock_ms)
+    log = []
+    scheduler.add(2, _sensor(scheduler[2], 0x29, log, "c"), 50, "c")
+    scheduler.add(0, _sensor(scheduler[0], 0x29, log, "a"), 50, "a")
+    scheduler.add(0, _sensor(scheduler[0], 0x30, log, "b"), 100, "b")
+
+    # Everything is due at first, grouped by channel: channel 0 is
+    # selected once for both its sensors
+    if scheduler.step() != 3 or log != ["a", "b", "c"] or \
+            i2c.selects != [1 << 0, 1 << 2] or \
+            i2c.reads != [(0x29, 1), (0x30, 1), (0x29, 4)]:
+        raise RuntimeError(f"first step ran {log}, selected {i2c.selects}")
+    if scheduler.selects != 2 or scheduler.selects_skipped != 1:
+        raise RuntimeError(f"{scheduler.selects} selects,"
+                           f" {scheduler.selects_skipped} skipped")
+    # Nothing is due, nothing touches the bus
+    clock.ms = 49
+    if scheduler.step() != 0 or len(i2c.selects) != 2:
+        raise RuntimeError("polls ran before they were due")
+    log.clear()
+    clock.ms = 50
+    if scheduler.step() != 2 or log != ["a", "c"] or \
+            i2c.selects != [1, 4, 1, 4]:
+        raise RuntimeError(f"ran {log}, selected {i2c.selects}")
+    # The mux is still on channel 2, accessing it selects nothing
+    scheduler[2].try_lock()
+    scheduler[2].unlock()
+    clock.ms = 100
+    log.clear()
+    i2c.selects.clear()
+    scheduler.step()
+    if log != ["a", "b", "c"] or i2c.selects != [1, 4] or \
+            scheduler.selects_skipped != 3:
+        raise RuntimeError(f"ran {log}, selected {i2c.selects}")
+    print("PASS: selected channel cached, no redundant selects")
+
+    # With no time budget every step runs one poll and the next step
+    # carries on with the next sensor
+    scheduler.step_budget_us = 0
+    log.clear()
+    for _ in range(6):
+        clock.ms += 1000
+        if scheduler.step() != 1:
+            raise RuntimeError("a step ran more than its budget")
+    if log != ["a", "b", "c", "a", "b", "c"]:
+        raise RuntimeError(f"round-robin ran {log}")
+    print(f"PASS: round-robin under the step budget {log}")
+
+    # Errors below max_errors, or not consecutive, do not reset the mux
+    scheduler.step_budget_us = 1000000
+    clock.ms += 1000
+    i2c.fail_reads = 2
+    scheduler.step()
+    if resets or scheduler.current_channel != 2:
+        raise RuntimeError(f"reset after 2 errors {resets}")
+    clock.ms += 1000
+    i2c.fail_reads = 3
+    i2c.selects.clear()
+    scheduler.step()
+    if resets != [clock.ms] or scheduler.resets != 1 or \
+            scheduler.current_channel is not None:
+        raise RuntimeError(f"resets {resets} after 3 errors")
+    # After the reset the channel is selected again, even if unchanged
+    clock.ms += 1000
+    i2c.selects.clear()
+    scheduler.step()
+    if i2c.selects[0] != 1 or resets != [clock.ms - 1000]:
+        raise RuntimeError(f"selected {i2c.selects} after the reset")
+    if [_s[3] for _s in scheduler.stats()] != [2, 2, 1]:
+        raise RuntimeError(f"errors {scheduler.stats()}")
+    print(f"PASS: mux reset after {scheduler.max_errors} consecutive"
+          f" errors")
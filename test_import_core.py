@@ -0,0 +1,65 @@
+import subprocess
+import sys
+from import_benchmark import CORE_MODULES, HARDWARE_MODULES, report, run
+
+
+# Imports the core in a fresh interpreter without a micropython module
+# (Blinka installs one on hosts), refusing and recording every attempt to
+# import a hardware module, as a board would have them. Prints the
+# attempts, then the top level modules loaded
+_CHILD = """
+import sys
+
+
+class _Refuse:
+    attempts = []
+
+    def find_spec(self, name, path=None, target=None):
+        if name == "micropython":
+            raise ImportError(name)
+        if name.split(".")[0] in {hardware!r}:
+            _Refuse.attempts.append(name)
+            raise ImportError(name)
+        return None
+
+
+sys.meta_path.insert(0, _Refuse())
+for _name in {modules!r}:
+    __import__(_name)
+print(" ".join(_Refuse.attempts))
+print(" ".join(sorted(set(_n.split(".")[0] for _n in sys.modules))))
+"""
+
+
+"""This is a test wrapper to make sure the protocol core imports on a host
+without hardware modules and the import benchmark runs."""
+if __name__ == "__main__":
+    result = subprocess.run(
+        [sys.executable, "-c", _CHILD.format(modules=CORE_MODULES,
+                                             hardware=HARDWARE_MODULES)],
+        capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"core import failed:\n{result.stderr}")
+    attempts, loaded = result.stdout.split("\n")[:2]
+    if attempts:
+        raise RuntimeError(f"core tried to import {attempts}")
+    loaded = loaded.split()
+    unwanted = [_name for _name in loaded
+                if _name in HARDWARE_MODULES or _name == "micropython"]
+    if unwanted:
+        raise RuntimeError(f"core imported {unwanted}")
+    print(f"PASS: {len(CORE_MODULES)} core modules import without hardware"
+          f" modules")
+
+    results = run(("ids.msg_format", "can_handler"))
+    if len(results) != 3:
+        raise RuntimeError(f"expected 3 results, got {len(results)}")
+    everything = results[-1]
+    if "can_handler" not in everything["loaded"] or everything["hardware"]:
+        raise RuntimeError(f"unexpected modules {everything['loaded']}")
+    if "can_handler" in sys.modules:
+        raise RuntimeError("measured modules were not unloaded")
+    if everything["us"] <= 0 or everything["bytes"] <= 0:
+        raise RuntimeError(f"nothing measured {everything}")
+    print(report(results))
+    print("PASS: import benchmark")
@@ -0,0 +1,82 @@
+import sys
+import types
+from io_breakout import IOBreakout
+
+
+class _Pin:
+    """A digitalio/analogio input; an AIN given several values returns
+    them in turn."""
+
+    def __init__(self, *values):
+        self.values = values
+        self.reads = 0
+
+    @property
+    def value(self):
+        _value = self.values[self.reads % len(self.values)]
+        self.reads += 1
+        return _value
+
+
+class _Module(types.ModuleType):
+    """A hardware module whose every attribute is a stand-in."""
+
+    def __getattr__(self, name):
+        return name
+
+
+def _import_carrier_boards():
+    for _name in ("board", "busio", "analogio", "digitalio", "canio",
+                  "neopixel", "sdcardio", "storage", "adafruit_wiznet5k",
+                  "adafruit_wiznet5k.adafruit_wiznet5k", "adafruit_mcp2515",
+                  "adafruit_mcp2515.canio", "adafruit_tca9548a",
+                  "adafruit_pca9685", "adafruit_servokit"):
+        sys.modules.setdefault(_name, _Module(_name))
+    from carrier_board import m4_feather_can, raspberry_pi_pico_w
+    return m4_feather_can.CarrierBoard, raspberry_pi_pico_w.CarrierBoard
+
+
+def _board(cls, **pins):
+    """A carrier board holding only pins, without running its
+    __init__."""
+    _board = cls.__new__(cls)
+    for _name, _pin in pins.items():
+        setattr(_board, _name, _pin)
+    _board.init_sample()
+    return _board
+
+
+"""This is a test wrapper to make sure both carrier boards sample their
+DIOs and AINs alike and a snapshot packs into the documented 8 bytes.."""
+if __name__ == "__main__":
+    M4CarrierBoard, PicoCarrierBoard = _import_carrier_boards()
+    m4 = _board(M4CarrierBoard, dio0=_Pin(True), dio1=None,
+                dio2=_Pin(True), dio3=_Pin(False), ain0=_Pin(0xabcd),
+                ain1=None, ain2=_Pin(0x1000, 0x1020), ain3=_Pin(0xfff0))
+    if m4.sample(oversample=2) != 0b0101 or m4.sample_dio != 0b0101 or \
+            list(m4.sample_ain) != [0xabcd, 0, 0x1010, 0xfff0]:
+        raise RuntimeError(f"m4 sampled {m4.sample_dio:#x}"
+                           f" {list(m4.sample_ain)}")
+    pico = _board(PicoCarrierBoard, dio0=None, dio1=None, dio2=None,
+                  dio3=None, dio4=None, dio5=None, dio6=None,
+                  dio7=_Pin(True), adc0=None, adc1=_Pin(0x8000))
+    if pico.sample() != 0x80 or list(pico.sample_ain) != [0, 0x8000]:
+        raise RuntimeError(f"pico sampled {pico.sample_dio:#x}"
+                           f" {list(pico.sample_ain)}")
+    print("PASS: both carrier boards sample with the shared helper")
+
+    breakout = IOBreakout(m4, device_number=3, oversample=2)
+    message = breakout.snapshot()
+    # DIO 0b0101, AINs 0xabc 0x000 0x101 0xfff, counter 0
+    expected = bytes([0x05, 0xab, 0xc0, 0x00, 0x10, 0x1f, 0xff, 0x00])
+    if bytes(message.data) != expected or not message.extended or \
+            message.id != breakout.snapshot_message.message_id:
+        raise RuntimeError(f"snapshot packed as {bytes(message.data)}")
+    if IOBreakout.unpack_snapshot(message.data) != \
+            (0b0101, [0xabc, 0x000, 0x101, 0xfff], 0):
+        raise RuntimeError("snapshot did not decode")
+    for _ in range(255):
+        message = breakout.snapshot()
+    if message.data[7] != 255 or breakout.snapshot().data[7] != 0:
+        raise RuntimeError("counter does not roll over")
+    print(f"PASS: snapshot {expected.hex()} decoded, counter rolls over")
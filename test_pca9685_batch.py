@@ -0,0 +1,144 @@
+import time
+from carrier_board.pca9685_batch import PCA9685Batch
+
+
+class _I2C:
+    """A busio.I2C with a PCA9685 on it, holding its power-up registers:
+    every channel full off (bit 4 of LEDn_OFF_H set). Records every
+    writeto()."""
+
+    def __init__(self, address=0x40):
+        self.address = address
+        self.registers = bytearray(256)
+        self.registers[0x00] = 0x11
+        for _channel in range(16):
+            self.registers[0x06 + 4 * _channel + 3] = 0x10
+        self.registers[0xfe] = 0x1e
+        self.writes = []
+
+    def try_lock(self):
+        return True
+
+    def unlock(self):
+        pass
+
+    def _check(self, address):
+        if address != self.address:
+            raise OSError(f"no device at {address:#x}")
+
+    def _next(self, reg):
+        # Register auto-increment, MODE1 bit 5
+        return reg + 1 if self.registers[0x00] & 0x20 else reg
+
+    def writeto(self, address, buffer, *, start=0, end=None):
+        self._check(address)
+        _data = bytes(buffer[start:end])
+        self.writes.append(_data)
+        if _data:
+            # Let the transaction take measurable time
+            time.sleep(0.0005)
+            _reg = _data[0]
+            for _value in _data[1:]:
+                self.registers[_reg] = _value
+                _reg = self._next(_reg)
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None):
+        self._check(address)
+
+    def writeto_then_readfrom(self, address, out_buffer, in_buffer, *,
+                              out_start=0, out_end=None, in_start=0,
+                              in_end=None):
+        self._check(address)
+        _reg = out_buffer[out_start]
+        if in_end is None:
+            in_end = len(in_buffer)
+        for _i in range(in_start, in_end):
+            in_buffer[_i] = self.registers[_reg]
+            _reg = self._next(_reg)
+
+    def channels(self):
+        return bytes(self.registers[0x06:0x06 + 64])
+
+
+def _run(channel, count, data):
+    """One auto-increment write of count channels from channel."""
+    return bytes([0x06 + 4 * channel]) + bytes(data) * count
+
+
+# Registers of a channel at half duty cycle (OFF = 0x800) and full off
+_HALF = (0x00, 0x00, 0x00, 0x08)
+_OFF = (0x00, 0x00, 0x00, 0x10)
+
+
+"""This is a test wrapper to make sure PCA9685Batch writes exactly the
+changed channels, merging close runs, and starts from what the chip
+holds.."""
+if __name__ == "__main__":
+    i2c = _I2C()
+    pwm = PCA9685Batch(i2c)
+    i2c.writes.clear()
+    if pwm._shadow != i2c.channels() or pwm._pending != pwm._shadow or \
+            pwm.dirty:
+        raise RuntimeError("shadow does not match the power-up registers")
+    pwm.set_duty_cycle(3, 0)
+    if pwm.dirty or pwm.commit() != 0 or i2c.writes or pwm.last_i2c_us:
+        raise RuntimeError("unchanged full off channel written")
+    pwm.set_duty_cycle(3, 0x8000)
+    if pwm.dirty != 1 << 3:
+        raise RuntimeError(f"dirty {pwm.dirty:#x}")
+    if pwm.commit() != 1 or i2c.writes != [_run(3, 1, _HALF)]:
+        raise RuntimeError(f"first commit wrote {i2c.writes}")
+    print("PASS: shadow starts at the power-up registers, first commit"
+          " written")
+
+    # Scattered: two transactions, adjacent: one
+    i2c.writes.clear()
+    for _channel in (0, 1, 2, 9):
+        pwm.set_duty_cycle(_channel, 0x8000)
+    if pwm.dirty != 0b1000000111:
+        raise RuntimeError(f"dirty {pwm.dirty:#x}")
+    if pwm.commit() != 2 or i2c.writes != [_run(0, 3, _HALF),
+                                           _run(9, 1, _HALF)]:
+        raise RuntimeError(f"scattered commit wrote {i2c.writes}")
+    if pwm.dirty or pwm._shadow != pwm._pending or \
+            i2c.channels() != pwm._shadow:
+        raise RuntimeError("shadow and pending differ from the chip")
+    if not 0 < pwm.last_i2c_us <= pwm.max_i2c_us or pwm.transactions != 3:
+        raise RuntimeError(f"timing {pwm.last_i2c_us} {pwm.max_i2c_us}")
+    print("PASS: scattered and adjacent channels")
+
+    # One unchanged channel between two changed ones joins the runs, two
+    # do not
+    i2c.writes.clear()
+    for _channel in (5, 7, 10):
+        pwm.set_duty_cycle(_channel, 0x8000)
+    if pwm.commit() != 2 or \
+            i2c.writes != [bytes([0x06 + 4 * 5]) + bytes(_HALF + _OFF +
+                                                         _HALF),
+                           _run(10, 1, _HALF)]:
+        raise RuntimeError(f"merged commit wrote {i2c.writes}")
+    print("PASS: runs merged across merge_gap unchanged channels")
+
+    # Set back to what the shadow holds before commit: nothing to write
+    i2c.writes.clear()
+    max_i2c_us = pwm.max_i2c_us
+    pwm.set_duty_cycle(4, 0xffff)
+    pwm.set_duty_cycle(4, 0)
+    if pwm.dirty or pwm.commit() or i2c.writes or pwm.last_i2c_us or \
+            pwm.max_i2c_us != max_i2c_us:
+        raise RuntimeError(f"unchanged channels wrote {i2c.writes}")
+    pwm.refresh()
+    if pwm.commit() != 1 or i2c.writes != [bytes([0x06]) + pwm._shadow]:
+        raise RuntimeError("refresh did not rewrite every channel")
+    print("PASS: nothing written when unchanged, refresh rewrites all")
+
+    # A restarted program finds what the last one left on the chip
+    restarted = PCA9685Batch(i2c, merge_gap=0)
+    i2c.writes.clear()
+    restarted.set_duty_cycle(0, 0x8000)
+    restarted.set_duty_cycle(1, 0x8000)
+    restarted.set_duty_cycle(2, 0)
+    if restarted.dirty != 1 << 2 or restarted.commit() != 1 or \
+            i2c.writes != [_run(2, 1, _OFF)]:
+        raise RuntimeError(f"restart wrote {i2c.writes}")
+    print("PASS: shadow read back from a configured chip")
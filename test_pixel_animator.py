@@ -0,0 +1,101 @@
+import sys
+import types
+from pixel_animator import PixelAnimator
+
+
+class _Strip:
+    """Enforces what a pixelbuf (neopixel.NeoPixel) slice assignment
+    takes: one color, a (r, g, b[, w]) tuple or an int, per pixel."""
+
+    def __init__(self, n, bpp=3):
+        self.bpp = bpp
+        self.colors = [(0,) * bpp] * n
+        self.shows = 0
+
+    def __len__(self):
+        return len(self.colors)
+
+    def __setitem__(self, index, value):
+        if not isinstance(index, slice):
+            value = [value]
+            index = slice(index, index + 1)
+        _pixels = range(*index.indices(len(self.colors)))
+        if len(value) != len(_pixels):
+            raise ValueError(f"{len(value)} colors for {len(_pixels)}"
+                             f" pixels")
+        for _pixel, _color in zip(_pixels, value):
+            if isinstance(_color, int):
+                _color = tuple((_color >> _shift) & 0xff
+                               for _shift in (16, 8, 0))[:self.bpp]
+            if len(_color) != self.bpp or \
+                    any(not 0 <= _c <= 255 for _c in _color):
+                raise ValueError(f"bad color {_color}")
+            self.colors[_pixel] = tuple(_color)
+
+    def fill(self, color):
+        self[:] = [color] * len(self.colors)
+
+    def show(self):
+        self.shows += 1
+
+
+class _Module(types.ModuleType):
+    """A hardware module whose every attribute is a stand-in."""
+
+    def __getattr__(self, name):
+        return name
+
+
+def _import_m4_carrier_board():
+    for _name in ("board", "busio", "analogio", "digitalio", "canio",
+                  "adafruit_wiznet5k", "adafruit_wiznet5k.adafruit_wiznet5k",
+                  "sdcardio", "storage"):
+        sys.modules.setdefault(_name, _Module(_name))
+    _neopixel = types.ModuleType("neopixel")
+    _neopixel.NeoPixel = lambda pin, n, **kwargs: _Strip(n)
+    sys.modules.setdefault("neopixel", _neopixel)
+    from carrier_board.m4_feather_can import CarrierBoard
+    return CarrierBoard
+
+
+"""This is a test wrapper to make sure frames reach the strip one color per
+pixel and unchanged frames are not shown again.."""
+if __name__ == "__main__":
+    strip = _Strip(5)
+    animator = PixelAnimator(strip, min_show_interval=0)
+    animator.set_color(PixelAnimator.RED)
+    if not animator.step() or strip.colors != [(255, 0, 0)] * 5:
+        raise RuntimeError(f"solid frame shown as {strip.colors}")
+    animator.set_frame(animator.span(1, 3, PixelAnimator.GREEN))
+    animator.step()
+    if strip.colors != [(0, 0, 0), (0, 255, 0), (0, 255, 0), (0, 0, 0),
+                        (0, 0, 0)]:
+        raise RuntimeError(f"span shown as {strip.colors}")
+    print(f"PASS: frames written one color per pixel, {strip.shows} shows")
+
+    animator.set_frame(animator.span(1, 3, PixelAnimator.GREEN))
+    if animator.dirty or animator.step() or strip.shows != 2:
+        raise RuntimeError("an unchanged frame was shown again")
+    print("PASS: unchanged frame not shown")
+
+    rgbw = _Strip(2, bpp=4)
+    animator = PixelAnimator(rgbw)
+    animator.play(animator.progress_pattern(PixelAnimator.BLUE))
+    animator.show()
+    if rgbw.colors != [(0, 0, 0, 0)] * 2 or \
+            animator.progress_frames(PixelAnimator.BLUE)[1][0] != \
+            (0, 0, 255, 0):
+        raise RuntimeError(f"RGBW frames shown as {rgbw.colors}")
+    print("PASS: RGBW frames padded to 4 bytes per pixel")
+
+    status = _import_m4_carrier_board().StatusLED()
+    status.on()
+    status.on()
+    status.set_color(status.GREEN)
+    status.off()
+    status.off()
+    if status.neopixel_status.shows != 2 or \
+            status.neopixel_status.colors != [status.OFF]:
+        raise RuntimeError(f"status LED shown"
+                           f" {status.neopixel_status.shows} times")
+    print("PASS: StatusLED.set_color skips repeated colors")
@@ -0,0 +1,34 @@
+from publish_policy import PublishPolicy, frame_bits
+
+
+"""This is a test wrapper to make sure the publish policy sends on the first
+update, edges, deadband moves and keep-alives, and nothing else.."""
+if __name__ == "__main__":
+    now = [0]
+    policy = PublishPolicy(deadband=1.0, max_interval_ms=100, dlc=2,
+                           clock_ms=lambda: now[0])
+    updates = [(10, False), (10.5, False), (12, False), (12, True),
+               (12.2, False), (12.2, False)]
+    sent = []
+    for i, (value, edge) in enumerate(updates):
+        now[0] = i * 10
+        sent.append(policy.update(value, edge=edge))
+    if sent != [True, False, True, True, False, False]:
+        raise RuntimeError(f"unexpected sends {sent}")
+    print(f"PASS: first/deadband/edge sends {sent}")
+
+    now[0] = 200
+    if not policy.update(12.2) or \
+            policy.reason != PublishPolicy.REASON_KEEP_ALIVE:
+        raise RuntimeError("expected a keep-alive after max_interval_ms")
+    print("PASS: keep-alive sent after max_interval_ms")
+
+    if policy.bits_saved != 3 * frame_bits(2):
+        raise RuntimeError(f"unexpected bits saved {policy.bits_saved}")
+    print(f"PASS: stats {policy.stats()}")
+
+    per_value = PublishPolicy(deadband=[5, 100], clock_ms=lambda: now[0])
+    per_value.update([0, 0])
+    if per_value.update([4, 99]) or not per_value.update([6, 0]):
+        raise RuntimeError("per value deadbands not applied")
+    print("PASS: per value deadbands")
@@ -0,0 +1,99 @@
+import random
+import sys
+from signal_filters import (
+    MedianFilter, KalmanFilter1D, HysteresisDetector, Debouncer,
+    RateLimiter, Pipeline, benchmark, KALMAN_MAX_VALUE, KALMAN_MAX_VARIANCE
+)
+
+
+def _largest_kalman_int(kalman, samples):
+    """Runs samples through kalman, returns the largest magnitude of any
+    int local (every intermediate is named) or state of update()."""
+    _largest = [0]
+
+    def _trace(frame, event, arg):
+        if frame.f_code is not KalmanFilter1D.update.__code__:
+            return None
+        _values = list(frame.f_locals.values()) + \
+            list(vars(frame.f_locals["self"]).values())
+        for _value in _values:
+            if isinstance(_value, int) and abs(_value) > _largest[0]:
+                _largest[0] = abs(_value)
+        return _trace
+
+    sys.settrace(_trace)
+    try:
+        for _sample in samples:
+            kalman.update(_sample)
+    finally:
+        sys.settrace(None)
+    return _largest[0]
+
+
+"""This is a test wrapper to make sure the filters behave and to report
+their per-sample cost.."""
+if __name__ == "__main__":
+    median = MedianFilter(5)
+    out = [median.update(v) for v in (100, 102, 900, 101, 99, 103, 0, 100)]
+    if 900 in out or 0 in out:
+        raise RuntimeError(f"median let an outlier through: {out}")
+    print(f"PASS: median filter output {out}")
+
+    kalman = KalmanFilter1D(process_noise=1, measurement_noise=100)
+    for v in [300, 310, 290, 305, 295] * 20:
+        kalman.update(v)
+    if abs(kalman.value - 300) > 5:
+        raise RuntimeError(f"kalman estimate {kalman.value}, expected ~300")
+    print(f"PASS: kalman filter settled at {kalman.value}")
+
+    # Full scale swings with the largest noise allowed stay small ints
+    random.seed(34)
+    full_scale = [0, KALMAN_MAX_VALUE - 1] * 10 + \
+        [random.randrange(KALMAN_MAX_VALUE) for _ in range(200)]
+    largest = 0
+    for q, r in ((1, 100), (KALMAN_MAX_VARIANCE - 2, 1),
+                 (1, KALMAN_MAX_VARIANCE - 2)):
+        largest = max(largest, _largest_kalman_int(KalmanFilter1D(q, r),
+                                                   full_scale))
+    if largest >= 1 << 30:
+        raise RuntimeError(f"kalman intermediate {largest} is past 2**30")
+    try:
+        KalmanFilter1D(1, KALMAN_MAX_VARIANCE)
+        raise RuntimeError("noise past KALMAN_MAX_VARIANCE accepted")
+    except ValueError:
+        pass
+    print(f"PASS: kalman intermediates up to {largest}, below 2**30")
+
+    detector = HysteresisDetector(on_threshold=250, off_threshold=270,
+                                  on_count=2)
+    edges = []
+    for v in (400, 240, 400, 240, 240, 260, 280, 280, 300):
+        detector.update(v)
+        if detector.changed:
+            edges.append((v, detector.state))
+    if edges != [(240, True), (280, False)]:
+        raise RuntimeError(f"unexpected detector edges {edges}")
+    print(f"PASS: hysteresis edges {edges}")
+
+    debouncer = Debouncer(3)
+    states = [debouncer.update(v) for v in (1, 0, 1, 1, 1, 0, 1)]
+    if states != [False, False, False, False, True, True, True]:
+        raise RuntimeError(f"unexpected debounced states {states}")
+    print(f"PASS: debounced states {states}")
+
+    limiter = RateLimiter(10, 0)
+    out = [limiter.update(v) for v in (100, 100, 5, -50)]
+    if out != [10, 20, 10, 0]:
+        raise RuntimeError(f"unexpected rate limited output {out}")
+    print(f"PASS: rate limited output {out}")
+
+    samples = [250 + (i * 37) % 61 - 30 for i in range(2000)]
+    for name, filter_object in (
+            ("median5", MedianFilter(5)),
+            ("kalman", KalmanFilter1D(1, 100)),
+            ("hysteresis", HysteresisDetector(250)),
+            ("rate_limit", RateLimiter(10)),
+            ("pipeline", Pipeline(MedianFilter(5), KalmanFilter1D(1, 100),
+                                  HysteresisDetector(250)))):
+        print(f"BENCH: {name}: {benchmark(filter_object, samples):.2f}"
+              " us/sample")
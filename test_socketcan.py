@@ -0,0 +1,94 @@
+import socket
+import struct
+from backends.socketcan import (
+    CAN, SocketPairHub, Match, Message, RemoteTransmissionRequest,
+    kernel_filters, pack_frame, unpack_frame, CAN_EFF_FLAG, SO_TIMESTAMPING,
+    TIMESPEC_FORMAT
+)
+
+
+def _timestamping_factory(hub):
+    """Hub sockets that accept SO_TIMESTAMPING, like a CAN interface
+    without hardware stamping does."""
+    def _factory(channel):
+        _socket = hub.socket_factory(channel)
+        _setsockopt = _socket.setsockopt
+
+        def _accept_timestamping(level, option, value):
+            if level == socket.SOL_SOCKET and option == SO_TIMESTAMPING:
+                return
+            _setsockopt(level, option, value)
+
+        _socket.setsockopt = _accept_timestamping
+        return _socket
+    return _factory
+
+
+"""This is a test wrapper to make sure the SocketCAN backend behaves like
+canio. It runs on the in-process socketpair stand-in, and on vcan0 too if
+that interface exists (sudo ip link add dev vcan0 type vcan)."""
+if __name__ == "__main__":
+    frames = [Message(0x01011840, b"\x01\x02\x03", extended=True),
+              RemoteTransmissionRequest(0x123, 4),
+              Message(0x7ff, b"", extended=False)]
+    for frame in frames:
+        if unpack_frame(pack_frame(frame)) != frame:
+            raise RuntimeError(f"{frame} did not survive pack/unpack")
+    print("PASS: can_frame pack/unpack")
+
+    filters = kernel_filters([Match(0x01011840, extended=True),
+                              Match(0x100, mask=0x700)])
+    expected = struct.pack("=IIII", 0x01011840 | CAN_EFF_FLAG,
+                           0x1fffffff | CAN_EFF_FLAG, 0x100,
+                           0x700 | CAN_EFF_FLAG)
+    if filters != expected:
+        raise RuntimeError(f"unexpected kernel filters {filters.hex()}")
+    print("PASS: CAN_RAW_FILTER from matches")
+
+    channels = [("socketpair hub", SocketPairHub().socket_factory)]
+    if hasattr(socket, "AF_CAN") and \
+            "vcan0" in [name for _, name in socket.if_nameindex()]:
+        channels.append(("vcan0", None))
+
+    for name, factory in channels:
+        node = CAN("vcan0", loopback=True, socket_factory=factory)
+        robot = CAN("vcan0", socket_factory=factory)
+        listener = node.listen([Match(0x01011840, extended=True),
+                                Match(0x120, mask=0x7f0)], timeout=0.1)
+        for frame in frames * 3:
+            robot.send(frame)
+        received = []
+        while listener.in_waiting():
+            received.append(listener.receive())
+        if received != [frames[0], frames[1]] * 3:
+            raise RuntimeError(f"{name}: unexpected frames {received}")
+        if not all(isinstance(m.timestamp_ns, int) for m in received):
+            raise RuntimeError(f"{name}: frames without a timestamp")
+        if listener.receive() is not None:
+            raise RuntimeError(f"{name}: expected a timeout")
+        print(f"PASS: {name}: {len(received)} frames in"
+              f" {listener.batches} batch(es), filter"
+              f" {'kernel' if listener.kernel_filter else 'user space'},"
+              f" {listener.timestamps} timestamps")
+        node.deinit()
+        robot.deinit()
+
+    # SO_TIMESTAMPING alone does not mean hardware stamps: only a frame
+    # with a non-zero hardware timestamp does
+    node = CAN("vcan0", socket_factory=_timestamping_factory(SocketPairHub()))
+    listener = node.listen()
+    if listener.timestamps != "software":
+        raise RuntimeError(f"{listener.timestamps} timestamps before any"
+                           f" frame")
+    software = struct.pack(TIMESPEC_FORMAT, 5, 6) + bytes(32)
+    if listener._timestamp([(socket.SOL_SOCKET, SO_TIMESTAMPING,
+                             software)]) != 5000000006 or \
+            listener.timestamps != "software":
+        raise RuntimeError("software stamp taken for a hardware one")
+    hardware = software[:32] + struct.pack(TIMESPEC_FORMAT, 7, 8)
+    if listener._timestamp([(socket.SOL_SOCKET, SO_TIMESTAMPING,
+                             hardware)]) != 7000000008 or \
+            listener.timestamps != "hardware":
+        raise RuntimeError("hardware stamp not reported")
+    print("PASS: hardware timestamps reported once a frame has one")
+    node.deinit()
@@ -0,0 +1,161 @@
+"""Boot to first CAN frame and free heap of the source and .mpy builds.
+
+Stages two builds of the library in a new temporary directory, the .py
+sources and the tools/mpy_build.py output, each with boot_benchmark.py as
+the main script. Every build is run --runs times on the micropython unix
+port, a stand-in for a board, with a fixed heap size. The report gives the
+median import time, time to the first frame and free heap after the
+imports (see boot_benchmark.py), and the process time with the interpreter
+start. Staging afresh on every invocation, with a fixed heap and the
+median of several runs, keeps the numbers reproducible.
+
+Without micropython nothing is run and the report says so; without
+mpy-cross only the source build is measured.
+
+Run from the repository root:
+
+    python -m tools.boot_time [--runs 11] [--heapsize 256K]
+        [--micropython micropython] [--mpy-cross mpy-cross]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from tools.mpy_build import build, find_mpy_cross, sources
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+BUILDS = ("source", "mpy")
+SCRIPT = "boot_benchmark.py"
+FIELDS = ("import_us", "first_frame_us", "mem_free", "process_us")
+
+
+def stage(directory: str, kind: str, root: str = ".",
+          mpy_cross: str = "mpy-cross") -> None:
+    """Writes the kind ("source" or "mpy") build and the boot script into
+    directory."""
+    if kind == "mpy":
+        build(directory, root, mpy_cross)
+    else:
+        for _source in sources(root):
+            _path = os.path.join(directory, _source)
+            os.makedirs(os.path.dirname(_path), exist_ok=True)
+            shutil.copyfile(os.path.join(root, _source), _path)
+    # The main script is always compiled from source, as code.py is
+    shutil.copyfile(os.path.join(root, SCRIPT),
+                    os.path.join(directory, SCRIPT))
+
+
+def parse(output: str) -> dict:
+    """The fields of the BOOT line of boot_benchmark.py, None if there is
+    none."""
+    for _line in output.splitlines():
+        if _line.startswith("BOOT "):
+            return {_key: int(_value) for _key, _value in
+                    (_field.split("=") for _field in _line.split()[1:])}
+    return None
+
+
+def run(interpreter: str, directory: str, heapsize: str = None) -> dict:
+    """Runs the boot script of a staged build once.
+
+    Raises:
+        RuntimeError: if it fails or prints no BOOT line.
+    """
+    _command = [interpreter]
+    if heapsize:
+        _command += ["-X", f"heapsize={heapsize}"]
+    _command.append(os.path.join(directory, SCRIPT))
+    _env = dict(os.environ, MICROPYPATH=directory, PYTHONPATH=directory,
+                PYTHONDONTWRITEBYTECODE="1")
+    _start = time.perf_counter_ns()
+    _result = subprocess.run(_command, cwd=directory, env=_env,
+                             capture_output=True, text=True)
+    _process_us = (time.perf_counter_ns() - _start) // 1000
+    _sample = parse(_result.stdout)
+    if _result.returncode != 0 or _sample is None:
+        _error = (_result.stderr.strip().splitlines() or ["no BOOT line"])
+        raise RuntimeError(_error[-1])
+    _sample["process_us"] = _process_us
+    return _sample
+
+
+def _median(values: list) -> int:
+    _values = sorted(values)
+    return _values[len(_values) // 2]
+
+
+def measure(interpreter: str = "micropython", mpy_cross: str = "mpy-cross",
+            runs: int = 11, heapsize: str = "256K", root: str = ".",
+            builds: tuple = BUILDS) -> dict:
+    """Stages and runs each build.
+
+    Returns:
+        dict: by build, the median of every field over the runs, or
+            "skipped" with the reason the build was not measured.
+    """
+    _results = {}
+    _interpreter = shutil.which(interpreter)
+    with tempfile.TemporaryDirectory() as _directory:
+        for _kind in builds:
+            if _interpreter is None:
+                _results[_kind] = {"skipped": f"{interpreter} not found"}
+                continue
+            if _kind == "mpy" and find_mpy_cross(mpy_cross) is None:
+                _results[_kind] = {"skipped": f"{mpy_cross} not found"}
+                continue
+            _build = os.path.join(_directory, _kind)
+            stage(_build, _kind, root, mpy_cross)
+            try:
+                _samples = [run(_interpreter, _build, heapsize)
+                            for _ in range(runs)]
+            except RuntimeError as _error:
+                _results[_kind] = {"skipped": f"failed: {_error}"}
+                continue
+            _results[_kind] = {_field: _median([_s[_field]
+                                                for _s in _samples])
+                               for _field in FIELDS}
+    return _results
+
+
+def report(results: dict) -> str:
+    _lines = [f"{'build':<8} {'import ms':>9} {'frame ms':>9}"
+              f" {'process ms':>10} {'mem_free':>9}"]
+    for _kind, _result in results.items():
+        if "skipped" in _result:
+            _lines.append(f"{_kind:<8} skipped, {_result['skipped']}")
+            continue
+        _lines.append(f"{_kind:<8} {_result['import_us'] / 1000:>9.2f}"
+                      f" {_result['first_frame_us'] / 1000:>9.2f}"
+                      f" {_result['process_us'] / 1000:>10.2f}"
+                      f" {_result['mem_free']:>9}")
+    _source = results.get("source", {})
+    _mpy = results.get("mpy", {})
+    if "skipped" not in _source and "skipped" not in _mpy and \
+            _source and _mpy:
+        _sooner = _source["first_frame_us"] - _mpy["first_frame_us"]
+        _lines.append(f"mpy: first frame {_sooner / 1000:.2f} ms sooner,"
+                      f" {_mpy['mem_free'] - _source['mem_free']} bytes"
+                      f" more free")
+    return "\n".join(_lines)
+
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    _parser.add_argument("--runs", type=int, default=11,
+                         help="runs per build, the median is reported")
+    _parser.add_argument("--heapsize", default="256K",
+                         help="micropython heap, about a board's")
+    _parser.add_argument("--micropython", default="micropython",
+                         help="micropython unix port executable")
+    _parser.add_argument("--mpy-cross", default="mpy-cross",
+                         help="mpy-cross matching the micropython")
+    _args = _parser.parse_args()
+
+    print(report(measure(_args.micropython, _args.mpy_cross, _args.runs,
+                         _args.heapsize)))
@@ -0,0 +1,281 @@
+"""Batch decoding of an event's worth of CAN logs.
+
+Every log is summarized in a worker process of a multiprocessing pool: bus
+load, per-ID frame rates (with decoded FRCCANDevice fields), heartbeat gaps
+and the disabled/auto/teleop timeline of each match seen in the heartbeats.
+Frames are decoded a NumPy chunk at a time (see can_log_formats.chunks()),
+never in a per-frame Python loop. Summaries are cached per file, keyed by
+path, size and modification time, so an interrupted run resumes where it
+stopped and new logs can be added later. The per-log summaries are merged
+into one event report.
+
+Run from the repository root:
+
+    python -m tools.can_batch logs/*.bin [--jobs 8] [--cache .can_batch]
+        [--report event.json]
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+
+from ids.heartbeat import HeartBeatMsg
+from publish_policy import frame_bits
+from tools.can_log_formats import chunks, decode_ids
+from tools.can_log_store import decode_heartbeats, heartbeat_phases
+from tools.can_log_store import PHASE_NAMES
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+# Bumped when the summary contents change, invalidates the cache
+SUMMARY_VERSION = 1
+
+BITRATE = 1000000
+# Window for the peak bus load
+LOAD_WINDOW_US = 100000
+# Heartbeats further apart than this are reported as gaps
+HEARTBEAT_GAP_US = 100000
+
+
+def summarize(filename: str, chunk_size: int = 1 << 20,
+              bitrate: int = BITRATE) -> dict:
+    """Summary of one log (see the module docstring), JSON serializable."""
+    if numpy is None:
+        raise RuntimeError("batch decoding needs numpy")
+    _frames = 0
+    _first = None
+    _last = None
+    _bits = 0
+    _window_bits = numpy.zeros(0, numpy.int64)
+    _id_counts = {}
+    _hb_times = []
+    _hb_data = []
+    for _chunk in chunks(filename, chunk_size):
+        _time = _chunk["timestamp"].astype(numpy.int64)
+        if _first is None:
+            _first = int(_time[0])
+        _last = int(_time[-1])
+        _frames += len(_time)
+
+        # Nominal bits of every frame, RTRs carry no data
+        _dlc = numpy.where(_chunk["rtr"], 0, _chunk["dlc"]).astype(
+            numpy.int64)
+        _frame_bits = numpy.where(_chunk["extended"], frame_bits(0, True),
+                                  frame_bits(0, False)) + 8 * _dlc
+        _bits += int(_frame_bits.sum())
+        _windows = (_time - _first) // LOAD_WINDOW_US
+        _counts = numpy.bincount(_windows, weights=_frame_bits)
+        if len(_counts) > len(_window_bits):
+            _window_bits = numpy.concatenate((
+                _window_bits,
+                numpy.zeros(len(_counts) - len(_window_bits), numpy.int64)))
+        _window_bits[:len(_counts)] += _counts.astype(numpy.int64)
+
+        _ids, _id_count = numpy.unique(_chunk["id"], return_counts=True)
+        for _id, _n in zip(_ids.tolist(), _id_count.tolist()):
+            _id_counts[_id] = _id_counts.get(_id, 0) + _n
+
+        _hb = (_chunk["id"] == HeartBeatMsg.HEARTBEAT_ID) & \
+            _chunk["extended"] & ~_chunk["rtr"] & (_chunk["dlc"] == 8)
+        _hb_times.append(_time[_hb])
+        _hb_data.append(_chunk["data"][_hb])
+
+    _duration_s = (_last - _first) / 1e6 if _frames > 1 else 0
+    _summary = {
+        "file": os.path.basename(filename),
+        "frames": _frames,
+        "start_us": _first,
+        "duration_s": _duration_s,
+        "bus_load": _bits / (bitrate * _duration_s) if _duration_s else 0,
+        "peak_bus_load": float(_window_bits.max()) * 1e6 /
+        (bitrate * LOAD_WINDOW_US) if len(_window_bits) else 0,
+        "ids": [],
+        "heartbeats": 0,
+        "heartbeat_gaps": [],
+        "max_heartbeat_gap_ms": None,
+        "matches": [],
+    }
+
+    _ids = sorted(_id_counts)
+    if _ids:
+        _fields = decode_ids(_ids)
+        for _i, _id in enumerate(_ids):
+            _summary["ids"].append({
+                "id": _id,
+                "device_type": int(_fields["device_type"][_i]),
+                "manufacturer": int(_fields["manufacturer"][_i]),
+                "api": int(_fields["api"][_i]),
+                "device_number": int(_fields["device_number"][_i]),
+                "frames": _id_counts[_id],
+                "rate_hz": _id_counts[_id] / _duration_s
+                if _duration_s else 0,
+            })
+
+    _hb_times = numpy.concatenate(_hb_times) if _hb_times else []
+    if len(_hb_times):
+        _summary["heartbeats"] = len(_hb_times)
+        _gaps = numpy.diff(_hb_times)
+        if len(_gaps):
+            _summary["max_heartbeat_gap_ms"] = int(_gaps.max()) / 1000
+            _late = numpy.flatnonzero(_gaps > HEARTBEAT_GAP_US)
+            _summary["heartbeat_gaps"] = [
+                [int(_hb_times[_i]), int(_gaps[_i]) / 1000]
+                for _i in _late.tolist()]
+        _summary["matches"] = _timelines(_hb_times,
+                                         numpy.concatenate(_hb_data))
+    return _summary
+
+
+def _timelines(times, data) -> list:
+    """Per match (and replay) number, the heartbeat time range and every
+    phase change (enable/disable, auto/teleop)."""
+    _fields = decode_heartbeats(data)
+    _phase = heartbeat_phases(_fields)
+    _key = _fields["match_number"].astype(numpy.int64) << 8 | \
+        _fields["replay_number"]
+    _matches = []
+    _edges = numpy.flatnonzero(_key[1:] != _key[:-1]) + 1
+    _starts = [0] + _edges.tolist()
+    _ends = _edges.tolist() + [len(_key)]
+    for _start, _end in zip(_starts, _ends):
+        _p = _phase[_start:_end]
+        _changes = numpy.concatenate(
+            ([0], numpy.flatnonzero(_p[1:] != _p[:-1]) + 1))
+        _matches.append({
+            "match_number": int(_fields["match_number"][_start]),
+            "replay_number": int(_fields["replay_number"][_start]),
+            "start_us": int(times[_start]),
+            "end_us": int(times[_end - 1]),
+            "timeline": [[int(times[_start + _c]), PHASE_NAMES[_p[_c]]]
+                         for _c in _changes.tolist()],
+        })
+    return _matches
+
+
+def _cache_name(cache: str, filename: str) -> str:
+    _stat = os.stat(filename)
+    _key = (f"{os.path.abspath(filename)}:{_stat.st_size}:"
+            f"{_stat.st_mtime_ns}:{SUMMARY_VERSION}")
+    return os.path.join(cache,
+                        hashlib.sha1(_key.encode()).hexdigest() + ".json")
+
+
+def _job(args) -> tuple:
+    """Pool worker: (filename, summary or None, error or None, cached)."""
+    _filename, _cache = args
+    _cached = _cache_name(_cache, _filename) if _cache else None
+    if _cached and os.path.exists(_cached):
+        with open(_cached) as _fd:
+            return _filename, json.load(_fd), None, True
+    try:
+        _summary = summarize(_filename)
+    except Exception as _e:
+        return _filename, None, f"{type(_e).__name__}: {_e}", False
+    if _cached:
+        # Written under a temporary name so an interrupted run never
+        # leaves a partial entry behind
+        with open(_cached + ".tmp", "w") as _fd:
+            json.dump(_summary, _fd)
+        os.replace(_cached + ".tmp", _cached)
+    return _filename, _summary, None, False
+
+
+def merge(summaries: list) -> dict:
+    """Merges per-log summaries into the event report."""
+    _report = {
+        "logs": len(summaries),
+        "frames": sum(_s["frames"] for _s in summaries),
+        "duration_s": sum(_s["duration_s"] for _s in summaries),
+        "max_bus_load": max([_s["bus_load"] for _s in summaries],
+                            default=0),
+        "max_peak_bus_load": max([_s["peak_bus_load"] for _s in summaries],
+                                 default=0),
+        "max_heartbeat_gap_ms": max(
+            [_s["max_heartbeat_gap_ms"] for _s in summaries
+             if _s["max_heartbeat_gap_ms"] is not None], default=None),
+        "matches": [],
+        "ids": {},
+    }
+    for _s in sorted(summaries, key=lambda _s: _s["start_us"] or 0):
+        for _match in _s["matches"]:
+            _report["matches"].append(dict(_match, file=_s["file"],
+                                           bus_load=_s["bus_load"]))
+        for _entry in _s["ids"]:
+            _key = f"0x{_entry['id']:08x}"
+            if _key not in _report["ids"]:
+                _report["ids"][_key] = dict(_entry, logs=0, max_rate_hz=0)
+                _report["ids"][_key]["frames"] = 0
+                del _report["ids"][_key]["rate_hz"]
+            _merged = _report["ids"][_key]
+            _merged["frames"] += _entry["frames"]
+            _merged["logs"] += 1
+            _merged["max_rate_hz"] = max(_merged["max_rate_hz"],
+                                         _entry["rate_hz"])
+    return _report
+
+
+def run(filenames: list, jobs: int = None, cache: str = None,
+        progress=None) -> dict:
+    """Summarizes filenames on a pool of jobs processes (cached in cache)
+    and returns the merged report. progress(done, total, filename, cached,
+    error) is called as each log finishes."""
+    if cache:
+        os.makedirs(cache, exist_ok=True)
+    _summaries = []
+    _errors = {}
+    _args = [(_filename, cache) for _filename in filenames]
+    with multiprocessing.Pool(jobs) as _pool:
+        for _done, (_filename, _summary, _error, _cached) in enumerate(
+                _pool.imap_unordered(_job, _args), 1):
+            if _summary is not None:
+                _summaries.append(_summary)
+            else:
+                _errors[_filename] = _error
+            if progress:
+                progress(_done, len(filenames), _filename, _cached, _error)
+    _report = merge(_summaries)
+    _report["errors"] = _errors
+    return _report
+
+
+def _print_progress(done, total, filename, cached, error) -> None:
+    _state = f"ERROR {error}" if error else \
+        "cached" if cached else "decoded"
+    print(f"[{done}/{total}] {filename}: {_state}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    _parser.add_argument("logs", nargs="+")
+    _parser.add_argument("--jobs", type=int, default=None,
+                         help="worker processes, defaults to the CPU count")
+    _parser.add_argument("--cache", default=".can_batch",
+                         help="summary cache directory")
+    _parser.add_argument("--report", help="write the report to this file")
+    _args = _parser.parse_args()
+
+    _report = run(_args.logs, _args.jobs, _args.cache, _print_progress)
+    if _args.report:
+        with open(_args.report, "w") as _fd:
+            json.dump(_report, _fd, indent=1)
+    print(f"{_report['logs']} logs, {_report['frames']} frames,"
+          f" max bus load {_report['max_bus_load'] * 100:.1f}%"
+          f" (peak {_report['max_peak_bus_load'] * 100:.1f}%),"
+          f" worst heartbeat gap {_report['max_heartbeat_gap_ms']} ms")
+    for _match in _report["matches"]:
+        _timeline = ", ".join(f"{(_t - _match['start_us']) / 1e6:.1f}s"
+                              f" {_phase}"
+                              for _t, _phase in _match["timeline"])
+        print(f" match {_match['match_number']}"
+              f" ({_match['file']}): {_timeline}")
+    for _filename, _error in _report["errors"].items():
+        print(f" ERROR {_filename}: {_error}")
@@ -0,0 +1,172 @@
+"""Inventories the devices on a CAN bus with one broadcast.
+
+Sends an ENUMERATE (or a DEVICE_QUERY limited to a device type and/or
+manufacturer) and collects the identity replies of every device running a
+DeviceIdentity responder (see device_identity.py) for one response window,
+SLOTS * SLOT_MS ms plus a margin. Two replies on the same ID with different
+serial numbers mean two devices are configured with the same ID.
+
+Run from the repository root on a SocketCAN host:
+
+    python -m tools.can_discover [--channel can0] [--rounds 2]
+        [--device-type 10] [--manufacturer 8]
+"""
+
+import argparse
+import time
+
+from device_identity import ANY, DEVICE_QUERY_ID, ENUMERATE_ID
+from device_identity import IDENTITY_API, IDENTITY_PAYLOAD, SLOTS, SLOT_MS
+from ids.msg_format import FRCCANDevice
+
+from backends.virtual_can import Message
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+# Time allowed past the last slot for the replies to arrive
+MARGIN_MS = 20
+
+
+def _clock_ms() -> int:
+    return time.monotonic_ns() // 1000000
+
+
+class Discovery:
+    def __init__(self, can, listener, device_type: int = None,
+                 manufacturer: int = None,
+                 window_ms: int = SLOTS * SLOT_MS + MARGIN_MS,
+                 clock_ms=None) -> None:
+        """One inventory of the bus.
+
+        Args:
+            can: canio-like CAN to send the request on.
+            listener: listener receiving the replies, non-blocking or with
+                a short timeout.
+            device_type (int): only this device type answers (a
+                DEVICE_QUERY), None for every device (an ENUMERATE).
+            manufacturer (int): only this manufacturer answers.
+            window_ms (int): how long replies are collected per round.
+            clock_ms (function): time source, defaults to
+                time.monotonic_ns() in ms.
+        """
+        self.can = can
+        self.listener = listener
+        self.device_type = device_type
+        self.manufacturer = manufacturer
+        self.window_ms = window_ms
+        self._clock_ms = clock_ms if clock_ms else _clock_ms
+        self._end = None
+        self._start = 0
+        # Replies by message ID, a list as IDs may be shared by mistake
+        self.devices = {}
+        self.rounds = 0
+
+    def start(self, round_number: int = 0) -> None:
+        """Sends the request and opens the response window."""
+        if self.device_type is None and self.manufacturer is None:
+            _message = Message(ENUMERATE_ID, bytes([round_number & 0xff]),
+                               extended=True)
+        else:
+            _message = Message(DEVICE_QUERY_ID, bytes([
+                round_number & 0xff,
+                ANY if self.device_type is None else self.device_type,
+                ANY if self.manufacturer is None else self.manufacturer]),
+                extended=True)
+        self._start = self._clock_ms()
+        self._end = self._start + self.window_ms
+        self.rounds += 1
+        self.can.send(_message)
+
+    def poll(self) -> bool:
+        """Collects the replies waiting in the listener. Returns False
+        once the response window has closed."""
+        _message = self.listener.receive()
+        while _message is not None:
+            self._add(_message)
+            _message = self.listener.receive()
+        return self._clock_ms() - self._end < 0
+
+    def _add(self, message) -> None:
+        if not isinstance(message, Message) or not message.extended:
+            return
+        _device = FRCCANDevice(message_id=message.id)
+        if _device.api != IDENTITY_API or len(message.data) != 8:
+            return
+        _major, _minor, _patch, _round, _serial = \
+            IDENTITY_PAYLOAD.decode_raw(message.data)
+        _replies = self.devices.setdefault(message.id, [])
+        for _reply in _replies:
+            if _reply["serial"] == _serial:
+                return
+        _replies.append({
+            "device_type": _device.device_type,
+            "manufacturer": _device.manufacturer,
+            "device_number": _device.device_number,
+            "firmware_version": (_major, _minor, _patch),
+            "serial": _serial,
+            "round": _round,
+            "ms": self._clock_ms() - self._start,
+        })
+
+    def conflicts(self) -> list:
+        """Message IDs answered by more than one serial number."""
+        return sorted(_id for _id, _replies in self.devices.items()
+                      if len(_replies) > 1)
+
+
+def discover(can, listener, rounds: int = 1, **kwargs) -> Discovery:
+    """Runs rounds inventories (each reshuffles the response slots) and
+    returns the Discovery holding every device seen."""
+    _discovery = Discovery(can, listener, **kwargs)
+    for _round in range(rounds):
+        _discovery.start(_round)
+        while _discovery.poll():
+            pass
+    return _discovery
+
+
+def report(discovery: Discovery) -> str:
+    _lines = []
+    for _id in sorted(discovery.devices):
+        for _reply in discovery.devices[_id]:
+            _type = FRCCANDevice.DEVICE_TYPE_DECODE.get(
+                _reply["device_type"], "?")
+            _manufacturer = FRCCANDevice.MANUF_DECODE.get(
+                _reply["manufacturer"], "?")
+            _lines.append(
+                f"0x{_id:08x} {_type} ({_reply['device_type']})"
+                f" {_manufacturer} ({_reply['manufacturer']})"
+                f" device {_reply['device_number']}"
+                f" firmware {'.'.join(map(str, _reply['firmware_version']))}"
+                f" serial 0x{_reply['serial']:08x}"
+                f" at {_reply['ms']} ms")
+    _conflicts = discovery.conflicts()
+    _lines.append(f"{sum(len(_r) for _r in discovery.devices.values())}"
+                  f" device(s) in {discovery.rounds} round(s)")
+    for _id in _conflicts:
+        _lines.append(f"CONFLICT: 0x{_id:08x} is used by"
+                      f" {len(discovery.devices[_id])} devices")
+    return "\n".join(_lines)
+
+
+if __name__ == "__main__":
+    from backends.socketcan import CAN
+
+    _parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    _parser.add_argument("--channel", default="can0")
+    _parser.add_argument("--rounds", type=int, default=1,
+                         help="broadcasts, each reshuffles the slots")
+    _parser.add_argument("--device-type", type=int, default=None)
+    _parser.add_argument("--manufacturer", type=int, default=None)
+    _parser.add_argument("--window-ms", type=int,
+                         default=SLOTS * SLOT_MS + MARGIN_MS)
+    _args = _parser.parse_args()
+
+    with CAN(_args.channel) as _can:
+        _listener = _can.listen(timeout=0.005)
+        _discovery = discover(_can, _listener, _args.rounds,
+                              device_type=_args.device_type,
+                              manufacturer=_args.manufacturer,
+                              window_ms=_args.window_ms)
+    print(report(_discovery))
@@ -0,0 +1,160 @@
+"""Latency histograms from CANTrace exports (see can_trace.py).
+
+Reads the "T,..." lines written by CANTrace.export() (other lines, e.g. the
+rest of a serial console capture, are ignored) and reports per message ID
+the distribution of three latencies:
+
+    queue   - frame received to handler start
+    handler - handler start to end
+    reply   - frame received to reply handed to can.send (only for frames
+              that were answered, e.g. RTRs)
+
+Histogram buckets are powers of two microseconds. IDs whose worst reply
+latency exceeds --limit-us are flagged, which is how RTR responders are
+checked against the time the roboRIO waits for an answer.
+
+Run from the repository root:
+
+    python -m tools.can_latency trace.txt [--limit-us 1000] [--histogram]
+"""
+
+import argparse
+
+from can_trace import CANTrace
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+# Reply budget used when none is given, in microseconds
+DEFAULT_LIMIT_US = 1000
+# Timestamps are 32-bit microsecond counters that wrap
+_WRAP = CANTrace.TIME_MASK + 1
+
+LATENCIES = ("queue", "handler", "reply")
+
+
+def _elapsed(start: int, end: int) -> int:
+    return (end - start) % _WRAP
+
+
+def parse(lines) -> list:
+    """Trace records as (id, flags, received, start, end, sent) tuples."""
+    _records = []
+    _prefix = CANTrace.LINE_PREFIX + ","
+    for _line in lines:
+        _line = _line.strip()
+        if not _line.startswith(_prefix):
+            continue
+        _fields = _line.split(",")
+        if len(_fields) != CANTrace.NUM_FIELDS + 1:
+            continue
+        try:
+            _records.append((int(_fields[1], 16),)
+                            + tuple(int(_f) for _f in _fields[2:]))
+        except ValueError:
+            continue
+    return _records
+
+
+def bucket(latency_us: int) -> int:
+    """Histogram bucket: the smallest power of two >= latency_us."""
+    _bucket = 1
+    while _bucket < latency_us:
+        _bucket <<= 1
+    return _bucket
+
+
+def _percentile(values: list, fraction: float) -> int:
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def analyze(records: list) -> dict:
+    """Per message ID, for each latency: count, min, p50, p99, max and the
+    histogram (bucket upper bound in us -> count)."""
+    _samples = {}
+    for _id, _flags, _received, _start, _end, _sent in records:
+        _entry = _samples.setdefault(
+            _id, {"rtr": False, "frames": 0,
+                  "queue": [], "handler": [], "reply": []})
+        _entry["frames"] += 1
+        if _flags & CANTrace.FLAG_RTR:
+            _entry["rtr"] = True
+        _entry["queue"].append(_elapsed(_received, _start))
+        _entry["handler"].append(_elapsed(_start, _end))
+        if _flags & CANTrace.FLAG_REPLIED:
+            _entry["reply"].append(_elapsed(_received, _sent))
+
+    _result = {}
+    for _id, _entry in _samples.items():
+        _result[_id] = {"rtr": _entry["rtr"], "frames": _entry["frames"]}
+        for _name in LATENCIES:
+            _values = sorted(_entry[_name])
+            _histogram = {}
+            for _value in _values:
+                _b = bucket(_value)
+                _histogram[_b] = _histogram.get(_b, 0) + 1
+            _result[_id][_name] = {
+                "count": len(_values),
+                "min": _values[0] if _values else None,
+                "p50": _percentile(_values, 0.5) if _values else None,
+                "p99": _percentile(_values, 0.99) if _values else None,
+                "max": _values[-1] if _values else None,
+                "histogram": _histogram,
+            }
+    return _result
+
+
+def over_limit(result: dict, limit_us: int = DEFAULT_LIMIT_US) -> list:
+    """IDs whose worst reply latency is above limit_us."""
+    return sorted(_id for _id, _entry in result.items()
+                  if _entry["reply"]["count"]
+                  and _entry["reply"]["max"] > limit_us)
+
+
+def report(result: dict, limit_us: int = DEFAULT_LIMIT_US,
+           histogram: bool = False) -> str:
+    _lines = [f"{'ID':>10} {'kind':>4} {'frames':>7} {'latency':>8}"
+              f" {'min':>7} {'p50':>7} {'p99':>7} {'max':>7}"]
+    _late = over_limit(result, limit_us)
+    for _id in sorted(result):
+        _entry = result[_id]
+        for _name in LATENCIES:
+            _stats = _entry[_name]
+            if not _stats["count"]:
+                continue
+            _flag = " LATE" if _name == "reply" and _id in _late else ""
+            _lines.append(
+                f"0x{_id:08x} {'rtr' if _entry['rtr'] else 'msg':>4}"
+                f" {_entry['frames']:>7} {_name:>8} {_stats['min']:>7}"
+                f" {_stats['p50']:>7} {_stats['p99']:>7}"
+                f" {_stats['max']:>7}{_flag}")
+            if histogram:
+                _largest = max(_stats["histogram"].values())
+                for _b in sorted(_stats["histogram"]):
+                    _n = _stats["histogram"][_b]
+                    _bar = "#" * max(1, 40 * _n // _largest)
+                    _lines.append(f"{'':>21}<= {_b:>7} us {_n:>7} {_bar}")
+    _lines.append(f"{len(_late)} ID(s) with replies over {limit_us} us"
+                  + (": " + ", ".join(f"0x{_id:08x}" for _id in _late)
+                     if _late else ""))
+    return "\n".join(_lines)
+
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    _parser.add_argument("traces", nargs="+",
+                         help="serial captures or files with CANTrace lines")
+    _parser.add_argument("--limit-us", type=int, default=DEFAULT_LIMIT_US,
+                         help="reply latency budget in microseconds")
+    _parser.add_argument("--histogram", action="store_true",
+                         help="print the histogram of every latency")
+    _args = _parser.parse_args()
+
+    _records = []
+    for _filename in _args.traces:
+        with open(_filename, errors="replace") as _fd:
+            _records.extend(parse(_fd))
+    _result = analyze(_records)
+    print(report(_result, _args.limit_us, _args.histogram))
+    if over_limit(_result, _args.limit_us):
+        raise SystemExit(1)
@@ -0,0 +1,248 @@
+"""Streaming readers for CAN log files: candump text, Vector ASC and the
+CANLogger binary format.
+
+Every reader is a generator yielding one LogRecord per frame while holding
+only the current line (or record) in memory, so multi-GB event logs can be
+walked without building lists. FRCCANDevice fields are only decoded when a
+record's device/device_type/manufacturer/api/device_number is used.
+
+chunks() groups any reader's frames into NumPy arrays for vectorized work
+(the binary format is converted straight from the memory map). NumPy is
+only needed for chunks() and decode_ids(). Run from the repository root:
+
+    python -m tools.can_log_formats candump-2024-03-01.log [--chunks]
+"""
+
+import sys
+
+from tools.can_log_reader import CANLogReader, LogRecord
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+FORMAT_CANDUMP = "candump"
+FORMAT_ASC = "asc"
+FORMAT_BINARY = "binary"
+
+# File extension to format, for open_log()
+FORMAT_EXTENSIONS = {
+    ".log": FORMAT_CANDUMP,
+    ".candump": FORMAT_CANDUMP,
+    ".txt": FORMAT_CANDUMP,
+    ".asc": FORMAT_ASC,
+    ".bin": FORMAT_BINARY,
+}
+
+
+def _lines(source):
+    """Lines of a filename or an open text file, one at a time."""
+    if isinstance(source, str):
+        with open(source, "r", errors="replace") as _fd:
+            yield from _fd
+    else:
+        yield from source
+
+
+def _parse_candump(line: str):
+    _tokens = line.split()
+    if not _tokens:
+        return None
+    _timestamp = 0
+    if _tokens[0].startswith("("):
+        _timestamp = int(round(float(_tokens[0].strip("()")) * 1e6))
+        _tokens = _tokens[1:]
+    if len(_tokens) < 2:
+        return None
+    # _tokens[0] is the interface
+    _tx = False
+    if _tokens[1] in ("TX", "RX"):
+        # candump -x: direction and two flag columns
+        _tx = _tokens[1] == "TX"
+        _tokens = _tokens[:1] + _tokens[4:]
+
+    if "#" in _tokens[1]:
+        # Log file format (candump -l): 12345678#DEADBEEF, 123#R
+        _id, _, _payload = _tokens[1].partition("#")
+        if _payload.startswith("#"):
+            # CAN FD frame
+            return None
+        if len(_tokens) > 2 and _tokens[2] in ("T", "R"):
+            # Direction flag of candump -x -l
+            _tx = _tokens[2] == "T"
+        _rtr = _payload.startswith("R")
+        if _rtr:
+            _dlc = int(_payload[1:], 16) if len(_payload) > 1 else 0
+            _data = b""
+        else:
+            _data = bytes.fromhex(_payload)
+            _dlc = len(_data)
+    else:
+        # Console format: can0  12345678   [4]  01 02 03 04
+        if len(_tokens) < 3 or not _tokens[2].startswith("["):
+            return None
+        _id = _tokens[1]
+        _dlc = int(_tokens[2].strip("[]"))
+        _rtr = len(_tokens) > 3 and _tokens[3] == "remote"
+        _data = b"" if _rtr else bytes.fromhex("".join(_tokens[3:3 + _dlc]))
+    return LogRecord(_timestamp, int(_id, 16), len(_id) > 3, _rtr, _tx,
+                     _dlc, _data)
+
+
+def read_candump(source):
+    """Yields the frames of a candump text log, either the log file format
+    (candump -l) or the console format, with or without timestamps (-ta)
+    and direction (-x). Timestamps are in microseconds."""
+    for _line in _lines(source):
+        try:
+            _record = _parse_candump(_line)
+        except ValueError:
+            continue
+        if _record is not None:
+            yield _record
+
+
+def read_asc(source):
+    """Yields the CAN frames of a Vector ASC log. Error frames, CAN FD
+    frames and other events are skipped. Timestamps are in
+    microseconds."""
+    _base = 16
+    for _line in _lines(source):
+        _tokens = _line.split()
+        if len(_tokens) >= 2 and _tokens[0] == "base":
+            _base = 16 if _tokens[1] == "hex" else 10
+            continue
+        if len(_tokens) < 5:
+            continue
+        try:
+            _time = float(_tokens[0])
+        except ValueError:
+            continue
+        # <time> <channel> <id>[x] <Rx|Tx> <d|r> [<dlc> <data>...]
+        if _tokens[3] not in ("Rx", "Tx"):
+            continue
+        try:
+            int(_tokens[1])
+            _id = _tokens[2]
+            _extended = _id.endswith("x")
+            _id = int(_id.rstrip("x"), _base)
+            _rtr = _tokens[4] == "r"
+            if _rtr:
+                _dlc = int(_tokens[5], 16) if len(_tokens) > 5 else 0
+                _data = b""
+            elif _tokens[4] == "d":
+                _dlc = int(_tokens[5], 16)
+                _data = bytes(int(_b, _base) for _b in
+                              _tokens[6:6 + min(_dlc, 8)])
+            else:
+                continue
+        except (ValueError, IndexError):
+            continue
+        yield LogRecord(int(round(_time * 1e6)), _id, _extended, _rtr,
+                        _tokens[3] == "Tx", _dlc, _data)
+
+
+def read_binary(filename: str):
+    """Yields the frames of a CANLogger binary log (memory-mapped)."""
+    with CANLogReader(filename) as _reader:
+        yield from _reader
+
+
+def open_log(filename: str, log_format: str = None):
+    """Returns the reader generator for filename, the format is picked
+    from the extension unless log_format is given."""
+    if log_format is None:
+        _dot = filename.rfind(".")
+        _extension = filename[_dot:].lower() if _dot >= 0 else ""
+        if _extension not in FORMAT_EXTENSIONS:
+            raise ValueError(f"unknown log format for {filename}")
+        log_format = FORMAT_EXTENSIONS[_extension]
+    if log_format == FORMAT_CANDUMP:
+        return read_candump(filename)
+    if log_format == FORMAT_ASC:
+        return read_asc(filename)
+    if log_format == FORMAT_BINARY:
+        return read_binary(filename)
+    raise ValueError(f"unknown log format {log_format}")
+
+
+def _new_chunk(size: int) -> dict:
+    return {
+        "timestamp": numpy.zeros(size, numpy.uint64),
+        "id": numpy.zeros(size, numpy.uint32),
+        "extended": numpy.zeros(size, bool),
+        "rtr": numpy.zeros(size, bool),
+        "tx": numpy.zeros(size, bool),
+        "dlc": numpy.zeros(size, numpy.uint8),
+        "data": numpy.zeros((size, 8), numpy.uint8),
+    }
+
+
+def chunks(filename: str, chunk_size: int = 65536,
+           log_format: str = None):
+    """Yields dicts of NumPy arrays with up to chunk_size frames each (see
+    CANLogReader.chunks() for the keys). Binary logs are converted
+    directly from the memory map; text logs are read line by line into
+    the arrays."""
+    if numpy is None:
+        raise RuntimeError("chunks() needs numpy")
+    if log_format == FORMAT_BINARY or (
+            log_format is None and filename.lower().endswith(".bin")):
+        with CANLogReader(filename) as _reader:
+            yield from _reader.chunks(chunk_size)
+        return
+
+    _chunk = _new_chunk(chunk_size)
+    _n = 0
+    for _record in open_log(filename, log_format):
+        _chunk["timestamp"][_n] = _record.timestamp
+        _chunk["id"][_n] = _record.id
+        _chunk["extended"][_n] = _record.extended
+        _chunk["rtr"][_n] = _record.rtr
+        _chunk["tx"][_n] = _record.tx
+        _chunk["dlc"][_n] = _record.dlc
+        _chunk["data"][_n, :len(_record.data)] = \
+            numpy.frombuffer(_record.data, numpy.uint8)
+        _n += 1
+        if _n == chunk_size:
+            yield _chunk
+            # The caller may keep the chunk, start a new one
+            _chunk = _new_chunk(chunk_size)
+            _n = 0
+    if _n:
+        yield {_key: _value[:_n] for _key, _value in _chunk.items()}
+
+
+def decode_ids(ids) -> dict:
+    """Splits an array of message IDs into FRCCANDevice field arrays
+    ("device_type", "manufacturer", "api", "device_number")."""
+    from ids.msg_format import FRCCANDevice
+    _ids = numpy.asarray(ids, numpy.uint32)
+    return {
+        "device_type": (_ids >> FRCCANDevice.DEVICE_TYPE_LSB) &
+        FRCCANDevice.DEVICE_TYPE_MASK,
+        "manufacturer": (_ids >> FRCCANDevice.MANUF_LSB) &
+        FRCCANDevice.MANUF_MASK,
+        "api": (_ids >> FRCCANDevice.API_LSB) & FRCCANDevice.API_MASK,
+        "device_number": (_ids >> FRCCANDevice.DEVICE_NUMBER_LSB) &
+        FRCCANDevice.DEVICE_NUMBER_MASK,
+    }
+
+
+if __name__ == "__main__":
+    _use_chunks = "--chunks" in sys.argv[1:]
+    for _filename in sys.argv[1:]:
+        if _filename.startswith("--"):
+            continue
+        if _use_chunks:
+            for _chunk in chunks(_filename):
+                print(f"{len(_chunk['id'])} frames,"
+                      f" {_chunk['timestamp'][0] / 1e6:.6f} s to"
+                      f" {_chunk['timestamp'][-1] / 1e6:.6f} s")
+        else:
+            for _record in open_log(_filename):
+                print(_record)
@@ -0,0 +1,200 @@
+"""Host-side reader for CANLogger binary log files.
+
+The file is memory-mapped and walked record by record, so multi-GB logs
+are never loaded into memory. Run from the repository root:
+
+    python -m tools.can_log_reader /path/to/can_0000.bin
+"""
+
+import mmap
+import struct
+import sys
+
+from can_logger import CANLogger
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+
+class LogRecord:
+    __slots__ = ("timestamp", "id", "extended", "rtr", "tx", "dlc", "data",
+                 "_device")
+
+    def __init__(self, timestamp, id, extended, rtr, tx, dlc, data) -> None:
+        """One logged frame. timestamp is in microseconds (unwrapped,
+        on the logger's monotonic clock)."""
+        self.timestamp = timestamp
+        self.id = id
+        self.extended = extended
+        self.rtr = rtr
+        self.tx = tx
+        self.dlc = dlc
+        self.data = data
+        self._device = None
+
+    @property
+    def device(self):
+        """The FRCCANDevice view of the ID, only built when asked for."""
+        if self._device is None:
+            from ids.msg_format import FRCCANDevice
+            self._device = FRCCANDevice(message_id=self.id)
+        return self._device
+
+    @property
+    def device_type(self) -> int:
+        return self.device.device_type
+
+    @property
+    def manufacturer(self) -> int:
+        return self.device.manufacturer
+
+    @property
+    def api(self) -> int:
+        return self.device.api
+
+    @property
+    def device_number(self) -> int:
+        return self.device.device_number
+
+    def __str__(self) -> str:
+        _id = f"{self.id:08x}" if self.extended else f"{self.id:03x}"
+        _dir = "TX" if self.tx else "RX"
+        _data = "RTR" if self.rtr else self.data.hex()
+        return (f"{self.timestamp / 1e6:12.6f} {_dir} {_id}"
+                f" [{self.dlc}] {_data}")
+
+
+class CANLogReader:
+    def __init__(self, filename: str) -> None:
+        """Memory-maps a CANLogger file and checks its header."""
+        self.filename = filename
+        self._fd = open(filename, "rb")
+        self._mm = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+        _magic, self.version, self.record_size, self.block_size = \
+            struct.unpack_from(CANLogger.HEADER_FORMAT, self._mm, 0)
+        if _magic != CANLogger.MAGIC:
+            self.close()
+            raise ValueError(f"{filename} is not a CANLogger file")
+        if self.record_size != CANLogger.RECORD_SIZE:
+            self.close()
+            raise ValueError(f"{filename} has unsupported record size"
+                             f" {self.record_size}")
+
+    def close(self) -> None:
+        self._mm.close()
+        self._fd.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        """Number of record slots, including markers and padding."""
+        return len(self._mm) // self.record_size - 1
+
+    def raw_records(self):
+        """Yields (word0, word1, data) tuples straight from the map."""
+        _unpack = struct.Struct(CANLogger.RECORD_FORMAT).unpack_from
+        _size = self.record_size
+        _end = len(self._mm) - len(self._mm) % _size
+        _mm = self._mm
+        for _offset in range(_size, _end, _size):
+            yield _unpack(_mm, _offset)
+
+    def __iter__(self):
+        """Yields a LogRecord per logged frame with unwrapped timestamps.
+        Markers and padding are consumed."""
+        _ts_mask = CANLogger.TIMESTAMP_MASK
+        _wrap = _ts_mask + 1
+        _base = 0
+        _last = 0
+        for _word0, _word1, _data in self.raw_records():
+            _dlc = _word0 >> CANLogger.DLC_LSB
+            _ts = _word0 & _ts_mask
+            if _dlc == CANLogger.PAD_DLC:
+                continue
+            if _dlc == CANLogger.MARKER_DLC:
+                _full = struct.unpack_from("<Q", _data)[0]
+                _base = _full - _ts
+                _last = _ts
+                continue
+            if _ts < _last:
+                _base += _wrap
+            _last = _ts
+            yield LogRecord(
+                _base + _ts,
+                _word1 & CANLogger.ID_MASK,
+                bool(_word1 & CANLogger.FLAG_EXTENDED),
+                bool(_word1 & CANLogger.FLAG_RTR),
+                bool(_word1 & CANLogger.FLAG_TX),
+                _dlc,
+                b"" if _word1 & CANLogger.FLAG_RTR else _data[:_dlc])
+
+    def chunks(self, chunk_size: int = 65536):
+        """Yields dicts of NumPy arrays ("timestamp" uint64 us, "id"
+        uint32, "extended"/"rtr"/"tx" bool, "dlc" uint8, "data" uint8
+        (n, 8)) holding the frames of chunk_size records at a time. Only one
+        chunk is in memory; the timestamps are unwrapped with array math
+        instead of per record."""
+        if numpy is None:
+            raise RuntimeError("chunks() needs numpy")
+        _dtype = numpy.dtype([("word0", "<u4"), ("word1", "<u4"),
+                              ("data", "u1", 8)])
+        _records = numpy.frombuffer(self._mm, dtype=_dtype,
+                                    count=len(self), offset=self.record_size)
+        _wrap = CANLogger.TIMESTAMP_MASK + 1
+        # Carried between chunks, as in __iter__()
+        _base = 0
+        _last = 0
+        for _start in range(0, len(_records), chunk_size):
+            _chunk = _records[_start:_start + chunk_size]
+            _dlc = (_chunk["word0"] >> CANLogger.DLC_LSB).astype(numpy.uint8)
+            _keep = _dlc != CANLogger.PAD_DLC
+            _chunk = _chunk[_keep]
+            _dlc = _dlc[_keep]
+            if not len(_chunk):
+                continue
+            _ts = (_chunk["word0"] & CANLogger.TIMESTAMP_MASK).astype(
+                numpy.int64)
+            _marker = _dlc == CANLogger.MARKER_DLC
+
+            # A timestamp going backwards is a wrap, except at a marker
+            # which sets a new base
+            _prev = numpy.concatenate(([_last], _ts[:-1]))
+            _wraps = numpy.cumsum((_ts < _prev) & ~_marker)
+            _segment = numpy.cumsum(_marker)
+            _full = _chunk["data"][_marker].copy().view("<u8").reshape(-1)
+            _segment_base = numpy.concatenate(
+                ([_base], _full.astype(numpy.int64) - _ts[_marker]))
+            _segment_wraps = numpy.concatenate(([0], _wraps[_marker]))
+            _time = (_segment_base[_segment] +
+                     (_wraps - _segment_wraps[_segment]) * _wrap + _ts)
+            _base = int(_segment_base[-1] +
+                        (_wraps[-1] - _segment_wraps[-1]) * _wrap)
+            _last = int(_ts[-1])
+
+            _frames = ~_marker
+            _word1 = _chunk["word1"][_frames]
+            yield {
+                "timestamp": _time[_frames].astype(numpy.uint64),
+                "id": _word1 & CANLogger.ID_MASK,
+                "extended": (_word1 & CANLogger.FLAG_EXTENDED) != 0,
+                "rtr": (_word1 & CANLogger.FLAG_RTR) != 0,
+                "tx": (_word1 & CANLogger.FLAG_TX) != 0,
+                "dlc": _dlc[_frames],
+                "data": _chunk["data"][_frames],
+            }
+
+
+if __name__ == "__main__":
+    for _filename in sys.argv[1:]:
+        with CANLogReader(_filename) as _reader:
+            for _record in _reader:
+                print(_record)
@@ -0,0 +1,359 @@
+"""Columnar, memory-mapped CAN log store with a sidecar index.
+
+A store is a directory holding one file per column, each a flat
+little-endian array with one entry per frame, in time order:
+
+    timestamp.u8    uint64  microseconds
+    id.u4           uint32  29/11-bit ID
+    dlc.u1          uint8
+    flags.u1        uint8   FLAG_EXTENDED | FLAG_RTR | FLAG_TX
+    data.u1         uint8   8 bytes per frame
+    postings.u4     uint32  frame numbers grouped by ID
+    index.json      sidecar index
+
+The index lists every ID with its decoded FRCCANDevice fields and where its
+frame numbers are in postings.u4, and the matches found in the roboRIO
+heartbeats (match/replay number, time range and the disabled/auto/teleop/
+test phases). A query picks the IDs from the index, narrows their frame
+numbers to the requested time ranges with a binary search, and reads only
+those rows from the mapped columns, e.g. all REV status frames of device 7
+during auto in match 42:
+
+    store = CANLogStore("qm42.canstore")
+    frames = store.query(manufacturer=FRCCANDevice.MANUF_REV_ROBOTICS,
+                         device_number=7, match_number=42, phase="auto")
+
+Needs NumPy. Build a store from any log open_log() reads, from the
+repository root:
+
+    python -m tools.can_log_store build match.bin qm42.canstore
+    python -m tools.can_log_store info qm42.canstore
+"""
+
+import json
+import os
+import sys
+
+from ids.heartbeat import HeartBeatMsg
+from tools.can_log_formats import chunks, decode_ids
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+VERSION = 1
+
+FLAG_EXTENDED = 1
+FLAG_RTR = 2
+FLAG_TX = 4
+
+# Column name: (file, dtype, values per frame)
+COLUMNS = {
+    "timestamp": ("timestamp.u8", "<u8", 1),
+    "id": ("id.u4", "<u4", 1),
+    "dlc": ("dlc.u1", "u1", 1),
+    "flags": ("flags.u1", "u1", 1),
+    "data": ("data.u1", "u1", 8),
+}
+POSTINGS_FILE = "postings.u4"
+INDEX_FILE = "index.json"
+
+PHASE_DISABLED = "disabled"
+PHASE_AUTO = "auto"
+PHASE_TELEOP = "teleop"
+PHASE_TEST = "test"
+PHASE_NAMES = (PHASE_DISABLED, PHASE_AUTO, PHASE_TELEOP, PHASE_TEST)
+
+
+def decode_heartbeats(data) -> dict:
+    """Decodes an (n, 8) array of heartbeat payloads into field arrays
+    ("match_number", "replay_number", "match_time", "enabled",
+    "autonomous", "test_mode")."""
+    _hb = HeartBeatMsg
+
+    def _field(byte, lsb, mask):
+        return (data[:, byte] >> lsb) & mask
+
+    return {
+        "match_number":
+            (_field(_hb.MATCH_NUMBER_BYTE_H, _hb.MATCH_NUMBER_LSB_H,
+                    _hb.MATCH_NUMBER_MASK_H).astype(numpy.uint16)
+             << _hb.MATCH_NUMBER_OVRL_H) +
+            _field(_hb.MATCH_NUMBER_BYTE_L, _hb.MATCH_NUMBER_LSB_L,
+                   _hb.MATCH_NUMBER_MASK_L),
+        "replay_number": _field(_hb.REPLAY_NUMBER_BYTE,
+                                _hb.REPLAY_NUMBER_LSB,
+                                _hb.REPLAY_NUMBER_MASK),
+        "match_time": _field(_hb.MATCH_TIME_BYTE, _hb.MATCH_TIME_LSB,
+                             _hb.MATCH_TIME_MASK),
+        "enabled": _field(_hb.ENABLE_BYTE, _hb.ENABLED_LSB,
+                          _hb.ENABLED_MASK),
+        "autonomous": _field(_hb.AUTONOMOUS_BYTE, _hb.AUTONOMOUS_LSB,
+                             _hb.AUTONOMOUS_MASK),
+        "test_mode": _field(_hb.TEST_MODE_BYTE, _hb.TEST_MODE_LSB,
+                            _hb.TEST_MODE_MASK),
+    }
+
+
+def heartbeat_phases(fields):
+    """Phase of each heartbeat decoded by decode_heartbeats(), as an index
+    into PHASE_NAMES."""
+    _phase = numpy.full(len(fields["enabled"]), 0, numpy.uint8)
+    _enabled = fields["enabled"] != 0
+    _phase[_enabled & (fields["autonomous"] != 0)] = 1
+    _phase[_enabled & (fields["autonomous"] == 0)] = 2
+    _phase[_enabled & (fields["test_mode"] != 0)] = 3
+    return _phase
+
+
+def _runs(keys) -> list:
+    """(start, end) index pairs of the runs of equal values in keys."""
+    if not len(keys):
+        return []
+    _edges = numpy.flatnonzero(keys[1:] != keys[:-1]) + 1
+    _starts = numpy.concatenate(([0], _edges))
+    _ends = numpy.concatenate((_edges, [len(keys)]))
+    return list(zip(_starts.tolist(), _ends.tolist()))
+
+
+def build(source: str, path: str, chunk_size: int = 1 << 20,
+          log_format: str = None) -> dict:
+    """Converts the log source into a store at path, a chunk at a time.
+    Returns the index."""
+    if numpy is None:
+        raise RuntimeError("the log store needs numpy")
+    os.makedirs(path, exist_ok=True)
+    _files = {_name: open(os.path.join(path, _file), "wb")
+              for _name, (_file, _, _) in COLUMNS.items()}
+    # Frame numbers per ID, one array per chunk
+    _postings = {}
+    # Heartbeat frame times and payloads, small compared to the log
+    _hb_times = []
+    _hb_data = []
+    _count = 0
+    _last_time = 0
+    try:
+        for _chunk in chunks(source, chunk_size, log_format):
+            _n = len(_chunk["id"])
+            _time = _chunk["timestamp"].astype("<u8")
+            if _time[0] < _last_time or numpy.any(_time[1:] < _time[:-1]):
+                raise ValueError(f"{source} is not in time order")
+            _last_time = int(_time[-1])
+            _flags = (
+                _chunk["extended"].astype(numpy.uint8) * FLAG_EXTENDED |
+                _chunk["rtr"].astype(numpy.uint8) * FLAG_RTR |
+                _chunk["tx"].astype(numpy.uint8) * FLAG_TX)
+            _columns = {"timestamp": _time, "id": _chunk["id"],
+                        "dlc": _chunk["dlc"], "flags": _flags,
+                        "data": _chunk["data"]}
+            for _name, (_, _dtype, _) in COLUMNS.items():
+                _files[_name].write(numpy.ascontiguousarray(
+                    _columns[_name], _dtype).tobytes())
+
+            _rows = numpy.arange(_count, _count + _n, dtype=numpy.uint32)
+            _order = numpy.argsort(_chunk["id"], kind="stable")
+            _sorted = _chunk["id"][_order]
+            for _start, _end in _runs(_sorted):
+                _postings.setdefault(int(_sorted[_start]), []).append(
+                    _rows[_order[_start:_end]])
+
+            _hb = (_chunk["id"] == HeartBeatMsg.HEARTBEAT_ID) & \
+                _chunk["extended"] & ~_chunk["rtr"] & (_chunk["dlc"] == 8)
+            _hb_times.append(_time[_hb])
+            _hb_data.append(_chunk["data"][_hb])
+            _count += _n
+    finally:
+        for _fd in _files.values():
+            _fd.close()
+
+    _ids = sorted(_postings)
+    _fields = decode_ids(_ids) if _ids else {}
+    _index_ids = []
+    _offset = 0
+    with open(os.path.join(path, POSTINGS_FILE), "wb") as _fd:
+        for _i, _id in enumerate(_ids):
+            _rows = numpy.concatenate(_postings[_id])
+            _fd.write(_rows.astype("<u4").tobytes())
+            _index_ids.append({
+                "id": _id,
+                "device_type": int(_fields["device_type"][_i]),
+                "manufacturer": int(_fields["manufacturer"][_i]),
+                "api": int(_fields["api"][_i]),
+                "device_number": int(_fields["device_number"][_i]),
+                "offset": _offset,
+                "count": len(_rows),
+            })
+            _offset += len(_rows)
+
+    _index = {
+        "version": VERSION,
+        "frames": _count,
+        "ids": _index_ids,
+        "matches": _index_matches(
+            numpy.concatenate(_hb_times) if _hb_times
+            else numpy.zeros(0, "<u8"),
+            numpy.concatenate(_hb_data) if _hb_data
+            else numpy.zeros((0, 8), "u1")),
+    }
+    with open(os.path.join(path, INDEX_FILE), "w") as _fd:
+        json.dump(_index, _fd, indent=1)
+    return _index
+
+
+def _index_matches(times, data) -> list:
+    """Groups the heartbeats into matches (runs of the same match and
+    replay number) and each match into phase intervals."""
+    if not len(times):
+        return []
+    _fields = decode_heartbeats(data)
+    _key = _fields["match_number"].astype(numpy.uint32) << 8 | \
+        _fields["replay_number"]
+    _phase = heartbeat_phases(_fields)
+    _matches = []
+    for _start, _end in _runs(_key):
+        _segments = []
+        for _p_start, _p_end in _runs(_phase[_start:_end]):
+            _p_end_time = times[_start + _p_end] if _start + _p_end < \
+                len(times) else times[_end - 1] + 1
+            _segments.append([PHASE_NAMES[_phase[_start + _p_start]],
+                              int(times[_start + _p_start]),
+                              int(_p_end_time)])
+        _end_time = times[_end] if _end < len(times) else times[_end - 1] + 1
+        _matches.append({
+            "match_number": int(_fields["match_number"][_start]),
+            "replay_number": int(_fields["replay_number"][_start]),
+            "start_us": int(times[_start]),
+            "end_us": int(_end_time),
+            "phases": _segments,
+        })
+    return _matches
+
+
+class CANLogStore:
+    def __init__(self, path: str) -> None:
+        """Opens a store built by build(). Columns are memory-mapped, only
+        the pages a query reads are loaded."""
+        if numpy is None:
+            raise RuntimeError("the log store needs numpy")
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as _fd:
+            self.index = json.load(_fd)
+        if self.index["version"] != VERSION:
+            raise ValueError(f"{path} has unsupported version"
+                             f" {self.index['version']}")
+        self.frames = self.index["frames"]
+        self.columns = {}
+        for _name, (_file, _dtype, _width) in COLUMNS.items():
+            _shape = (self.frames, _width) if _width > 1 else (self.frames,)
+            self.columns[_name] = self._map(_file, _dtype, _shape)
+        self._postings = self._map(POSTINGS_FILE, "<u4", (self.frames,))
+
+    def _map(self, filename: str, dtype: str, shape: tuple):
+        if not self.frames:
+            return numpy.zeros(shape, dtype)
+        return numpy.memmap(os.path.join(self.path, filename), dtype=dtype,
+                            mode="r", shape=shape)
+
+    def ids(self, device_type: int = None, manufacturer: int = None,
+            device_number: int = None, api: int = None) -> list:
+        """Index entries of the IDs matching the given fields."""
+        _wanted = (("device_type", device_type),
+                   ("manufacturer", manufacturer),
+                   ("device_number", device_number), ("api", api))
+        return [_entry for _entry in self.index["ids"]
+                if all(_value is None or _entry[_field] == _value
+                       for _field, _value in _wanted)]
+
+    def time_ranges(self, match_number: int = None,
+                    replay_number: int = None, phase: str = None) -> list:
+        """(start_us, end_us) ranges of the matching matches/phases."""
+        _ranges = []
+        for _match in self.index["matches"]:
+            if match_number is not None and \
+                    _match["match_number"] != match_number:
+                continue
+            if replay_number is not None and \
+                    _match["replay_number"] != replay_number:
+                continue
+            if phase is None:
+                _ranges.append((_match["start_us"], _match["end_us"]))
+            else:
+                _ranges.extend((_start, _end) for _name, _start, _end in
+                               _match["phases"] if _name == phase)
+        return _ranges
+
+    def rows(self, device_type: int = None, manufacturer: int = None,
+             device_number: int = None, api: int = None,
+             match_number: int = None, replay_number: int = None,
+             phase: str = None, start_us: int = None,
+             end_us: int = None):
+        """Sorted frame numbers matching every given condition."""
+        _ranges = None
+        if match_number is not None or replay_number is not None or \
+                phase is not None:
+            _ranges = self.time_ranges(match_number, replay_number, phase)
+        if start_us is not None or end_us is not None:
+            _window = (start_us if start_us is not None else 0,
+                       end_us if end_us is not None else 1 << 64)
+            if _ranges is None:
+                _ranges = [_window]
+            else:
+                _ranges = [(max(_s, _window[0]), min(_e, _window[1]))
+                           for _s, _e in _ranges if _s < _window[1] and
+                           _e > _window[0]]
+
+        # Frame number bounds of the time ranges, by binary search of the
+        # (sorted) timestamp column
+        _bounds = None
+        if _ranges is not None:
+            _timestamp = self.columns["timestamp"]
+            _bounds = [(int(numpy.searchsorted(_timestamp, _s, "left")),
+                        int(numpy.searchsorted(_timestamp, _e, "left")))
+                       for _s, _e in _ranges]
+
+        _selected = []
+        for _entry in self.ids(device_type, manufacturer, device_number,
+                               api):
+            _rows = self._postings[_entry["offset"]:
+                                   _entry["offset"] + _entry["count"]]
+            if _bounds is None:
+                _selected.append(numpy.asarray(_rows))
+                continue
+            for _lo, _hi in _bounds:
+                _selected.append(numpy.asarray(_rows[
+                    numpy.searchsorted(_rows, _lo, "left"):
+                    numpy.searchsorted(_rows, _hi, "left")]))
+        if not _selected:
+            return numpy.zeros(0, numpy.uint32)
+        return numpy.unique(numpy.concatenate(_selected))
+
+    def query(self, columns=None, **conditions) -> dict:
+        """Reads the columns (all by default) of the frames matching
+        conditions (see rows()). Returns a dict of arrays."""
+        _rows = self.rows(**conditions)
+        _names = columns if columns is not None else list(COLUMNS)
+        return {_name: self.columns[_name][_rows] for _name in _names}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "build":
+        _index = build(sys.argv[2], sys.argv[3])
+        print(f"{_index['frames']} frames, {len(_index['ids'])} IDs,"
+              f" {len(_index['matches'])} matches")
+    elif len(sys.argv) == 3 and sys.argv[1] == "info":
+        _store = CANLogStore(sys.argv[2])
+        print(f"{_store.frames} frames")
+        for _entry in _store.index["ids"]:
+            print(f" 0x{_entry['id']:08x} type {_entry['device_type']}"
+                  f" manuf {_entry['manufacturer']} api {_entry['api']}"
+                  f" dev {_entry['device_number']}: {_entry['count']}")
+        for _match in _store.index["matches"]:
+            print(f" match {_match['match_number']}"
+                  f" replay {_match['replay_number']}:"
+                  f" {[_p[0] for _p in _match['phases']]}")
+    else:
+        print(__doc__)
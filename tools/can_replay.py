@@ -0,0 +1,224 @@
+"""Deterministic replay of a recorded CAN log into a CANHandler.
+
+The log's received frames are injected, in order, into a VirtualBus that the
+CANHandler's carrier board is attached to, and CANHandler.step() is run
+after each one, so the registered handlers (e.g.
+RobotSignalLight.heartbeat_msg) see the match traffic again. A VirtualClock
+follows the log timestamps; hand its ticks_ms/monotonic_ns/clock_ms/clock_us
+to the code under test so its timing is reproduced too. Every frame the
+handler sends is recorded with its virtual time, so two runs (or two
+versions of a handler) can be diffed.
+
+Timing modes:
+    original  frames are injected at their recorded wall clock spacing
+    scaled    the recorded spacing divided by speed (speed=10 is 10x)
+    fast      as fast as possible, only the virtual clock advances
+
+Run from the repository root, with an application factory taking
+(carrier_board, clock) and returning a CANHandler:
+
+    python -m tools.can_replay match.bin --app my_robot:build_handler
+        [--mode fast] [--speed 10] [--outputs replay.log]
+"""
+
+import argparse
+import importlib
+import time
+
+from backends.virtual_can import CAN, Message, RemoteTransmissionRequest
+from backends.virtual_can import VirtualBus
+from tools.can_log_formats import open_log
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+MODE_ORIGINAL = "original"
+MODE_SCALED = "scaled"
+MODE_FAST = "fast"
+
+
+class VirtualClock:
+    def __init__(self, start_us: int = 0) -> None:
+        """Time source driven by the replay. The methods mirror the clocks
+        used in this library (adafruit_ticks.ticks_ms, time.monotonic_ns
+        and the clock_ms/clock_us arguments)."""
+        self.now_us = start_us
+
+    def advance_to(self, now_us: int) -> None:
+        # Never goes backwards, even if the log does
+        if now_us > self.now_us:
+            self.now_us = now_us
+
+    def clock_us(self) -> int:
+        return self.now_us
+
+    def clock_ms(self) -> int:
+        return self.now_us // 1000
+
+    def ticks_ms(self) -> int:
+        return (self.now_us // 1000) & 0x3fffffff
+
+    def monotonic_ns(self) -> int:
+        return self.now_us * 1000
+
+    def monotonic(self) -> float:
+        return self.now_us / 1e6
+
+
+class ReplayBoard:
+    def __init__(self, bus: VirtualBus, matches=None) -> None:
+        """The parts of a CarrierBoard that CANHandler uses: can and
+        listener, on the replay bus."""
+        self.can = CAN(bus)
+        self.listener = self.can.listen(matches)
+
+
+class CANReplay:
+    def __init__(self, app, mode: str = MODE_FAST, speed: float = 1.0,
+                 step_period_us: int = 0, matches=None,
+                 clock: VirtualClock = None) -> None:
+        """Replays logs into the CANHandler built by app.
+
+        Args:
+            app (function): app(carrier_board, clock) returns the
+                CANHandler (with its handlers registered) to drive.
+            mode (str): MODE_ORIGINAL, MODE_SCALED or MODE_FAST.
+            speed (float): speed up factor for MODE_SCALED.
+            step_period_us (int): if set, step() is also called every
+                step_period_us of virtual time between frames, so
+                iteration and timeout handlers run as on the robot.
+            matches (list): Match filters for the board listener, as the
+                application would pass to listen().
+            clock (VirtualClock): the virtual clock, created if not given.
+        """
+        if mode not in (MODE_ORIGINAL, MODE_SCALED, MODE_FAST):
+            raise ValueError(f"unknown replay mode {mode}")
+        self.mode = mode
+        self.speed = speed if mode == MODE_SCALED else 1.0
+        self.step_period_us = step_period_us
+        self.clock = clock if clock is not None else VirtualClock()
+
+        self.bus = VirtualBus()
+        self.board = ReplayBoard(self.bus, matches)
+        # The injecting node also hears everything the handler sends
+        self._injector = CAN(self.bus)
+        self._outputs_listener = self._injector.listen()
+        self.handler = app(self.board, self.clock)
+
+        # (virtual time us, message) of every frame the handler sent
+        self.outputs = []
+        self.frames = 0
+        self.steps = 0
+        self.step_ns = 0
+        self.max_step_ns = 0
+        self.wall_s = 0.0
+        self.log_us = 0
+
+    @staticmethod
+    def to_message(record):
+        if record.rtr:
+            return RemoteTransmissionRequest(record.id, record.dlc,
+                                             extended=record.extended)
+        return Message(record.id, bytes(record.data),
+                       extended=record.extended)
+
+    def _step(self) -> None:
+        _start = time.perf_counter_ns()
+        self.handler.step()
+        _elapsed = time.perf_counter_ns() - _start
+        self.steps += 1
+        self.step_ns += _elapsed
+        if _elapsed > self.max_step_ns:
+            self.max_step_ns = _elapsed
+        for _message in self._outputs_listener:
+            self.outputs.append((self.clock.now_us, _message))
+
+    def _wait(self, wall_start: float, log_elapsed_us: int) -> None:
+        if self.mode == MODE_FAST:
+            return
+        _due = wall_start + log_elapsed_us / 1e6 / self.speed
+        _delay = _due - time.perf_counter()
+        if _delay > 0:
+            time.sleep(_delay)
+
+    def run(self, records, include_tx: bool = False) -> list:
+        """Replays records (LogRecords, e.g. from open_log()) and returns
+        the recorded outputs. Frames logged as sent (tx) by the device are
+        what it produced, not inputs, and are skipped unless include_tx."""
+        _wall_start = time.perf_counter()
+        _first_us = None
+        for _record in records:
+            if _record.tx and not include_tx:
+                continue
+            if _first_us is None:
+                _first_us = _record.timestamp
+                self.clock.advance_to(_record.timestamp)
+            if self.step_period_us:
+                # Let the handler run its periodic work up to this frame
+                _next = self.clock.now_us + self.step_period_us
+                while _next < _record.timestamp:
+                    self._wait(_wall_start, _next - _first_us)
+                    self.clock.advance_to(_next)
+                    self._step()
+                    _next += self.step_period_us
+            self._wait(_wall_start, _record.timestamp - _first_us)
+            self.clock.advance_to(_record.timestamp)
+            self._injector.send(self.to_message(_record))
+            self.frames += 1
+            # One step per frame as on the robot, then drain anything
+            # still queued
+            self._step()
+            while self.board.listener.in_waiting():
+                self._step()
+        if _first_us is not None:
+            self.log_us = self.clock.now_us - _first_us
+        self.wall_s = time.perf_counter() - _wall_start
+        return self.outputs
+
+    def write_outputs(self, filename: str) -> None:
+        """Writes the outputs in candump log format (virtual timestamps)
+        for diffing."""
+        with open(filename, "w") as _fd:
+            for _time, _message in self.outputs:
+                _id = f"{_message.id:08X}" if _message.extended \
+                    else f"{_message.id:03X}"
+                if isinstance(_message, RemoteTransmissionRequest):
+                    _payload = f"R{_message.length}"
+                else:
+                    _payload = bytes(_message.data).hex().upper()
+                _fd.write(f"({_time / 1e6:.6f}) replay {_id}#{_payload}\n")
+
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "steps": self.steps,
+            "outputs": len(self.outputs),
+            "mean_step_us": self.step_ns / 1000 / self.steps
+            if self.steps else 0,
+            "max_step_us": self.max_step_ns / 1000,
+            "log_s": self.log_us / 1e6,
+            "wall_s": self.wall_s,
+            "speedup": self.log_us / 1e6 / self.wall_s
+            if self.wall_s else 0,
+        }
+
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    _parser.add_argument("log", help="candump, ASC or CANLogger log")
+    _parser.add_argument("--app", required=True,
+                         help="module:function returning a CANHandler")
+    _parser.add_argument("--mode", default=MODE_FAST,
+                         choices=(MODE_ORIGINAL, MODE_SCALED, MODE_FAST))
+    _parser.add_argument("--speed", type=float, default=1.0)
+    _parser.add_argument("--step-period-us", type=int, default=0)
+    _parser.add_argument("--outputs", help="write outputs to this file")
+    _args = _parser.parse_args()
+
+    _module, _, _function = _args.app.partition(":")
+    _app = getattr(importlib.import_module(_module), _function)
+    _replay = CANReplay(_app, _args.mode, _args.speed, _args.step_period_us)
+    _replay.run(open_log(_args.log))
+    if _args.outputs:
+        _replay.write_outputs(_args.outputs)
+    print(_replay.stats())
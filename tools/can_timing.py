@@ -0,0 +1,295 @@
+"""Host-side worst-case response-time and bus-load analyzer for a set of FRC
+CAN messages.
+
+Each message is described by its 29-bit ID (or the FRCCANDevice fields), its
+DLC, period, queuing jitter and deadline. The lower the ID the higher the
+arbitration priority, so device_type outranks manufacturer, then api, then
+device_number. Frame times assume worst-case bit stuffing and the response
+times follow the classical CAN schedulability analysis (Davis, Burns,
+Bril and Lukkien, "Controller Area Network (CAN) schedulability analysis:
+Refuted, revisited and revised", 2007).
+
+Message sets are JSON lists, run from the repository root:
+
+    python -m tools.can_timing messages.json [--bitrate 1000000]
+        [--add-sensor DLC,PERIOD_MS]
+
+    [
+      {"name": "intake", "device_type": 10, "manufacturer": 8, "api": 1,
+       "device_number": 1, "dlc": 7, "period_ms": 20, "jitter_ms": 1},
+      {"name": "spark status", "id": "0x02051800", "dlc": 8,
+       "period_ms": 10, "count": 8}
+    ]
+
+"deadline_ms" defaults to "period_ms", "count" adds that many copies with
+consecutive device numbers. The roboRIO heartbeat is always included.
+"""
+
+import argparse
+import json
+import math
+
+from ids.heartbeat import HeartBeatMsg
+from ids.msg_format import FRCCANDevice
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+# The roboRIO sends the heartbeat every 20 ms
+HEARTBEAT_PERIOD_MS = 20
+
+
+def frame_bits_worst_case(dlc: int, extended: bool = True) -> int:
+    """Worst-case bits on the bus for a data frame with dlc bytes,
+    including stuff bits, the end of frame and the interframe space."""
+    _g = 54 if extended else 34
+    return _g + 8 * dlc + 13 + (_g + 8 * dlc - 1) // 4
+
+
+class TimingMessage:
+    def __init__(self, name: str, message_id: int, dlc: int = 8,
+                 period_ms: float = 20, jitter_ms: float = 0,
+                 deadline_ms: float = None, extended: bool = True) -> None:
+        """A periodic (or sporadic, with period_ms as the minimum
+        inter-arrival time) CAN message."""
+        self.name = name
+        self.message_id = message_id
+        self.dlc = dlc
+        self.period_ms = period_ms
+        self.jitter_ms = jitter_ms
+        self.deadline_ms = deadline_ms if deadline_ms is not None \
+            else period_ms
+        self.extended = extended
+        # Filled in by analyze()
+        self.frame_us = 0.0
+        self.response_us = None
+
+    @property
+    def missed(self) -> bool:
+        return self.response_us is None or \
+            self.response_us > self.deadline_ms * 1000
+
+    @property
+    def team_use(self) -> bool:
+        return (self.message_id >> FRCCANDevice.MANUF_LSB) & \
+            FRCCANDevice.MANUF_MASK == FRCCANDevice.MANUF_TEAM_USE
+
+    def copy(self, message_id: int = None):
+        return TimingMessage(self.name,
+                             self.message_id if message_id is None
+                             else message_id,
+                             self.dlc, self.period_ms, self.jitter_ms,
+                             self.deadline_ms, self.extended)
+
+    def __str__(self) -> str:
+        _dev = FRCCANDevice(message_id=self.message_id)
+        return (f"{self.name} 0x{self.message_id:08x} (type"
+                f" {_dev.device_type} manuf {_dev.manufacturer} api"
+                f" {_dev.api} dev {_dev.device_number})")
+
+
+def heartbeat_message() -> TimingMessage:
+    return TimingMessage("roboRIO heartbeat", HeartBeatMsg.HEARTBEAT_ID, 8,
+                         HEARTBEAT_PERIOD_MS)
+
+
+def load_messages(filename: str) -> list:
+    """Reads a JSON message set (see the module docstring)."""
+    with open(filename) as _fd:
+        _entries = json.load(_fd)
+    _messages = []
+    for _entry in _entries:
+        if "id" in _entry:
+            _id = _entry["id"]
+            _id = int(_id, 0) if isinstance(_id, str) else _id
+            _dev = FRCCANDevice(message_id=_id)
+        else:
+            _dev = FRCCANDevice(
+                device_type=_entry["device_type"],
+                manufacturer=_entry["manufacturer"],
+                api=_entry["api"] if "api" in _entry else 0,
+                device_number=_entry["device_number"]
+                if "device_number" in _entry else 0)
+        _count = _entry["count"] if "count" in _entry else 1
+        _first = _dev.device_number
+        for _i in range(_count):
+            _dev.device_number = _first + _i
+            _name = _entry["name"] if "name" in _entry else "message"
+            if _count > 1:
+                _name = f"{_name} #{_first + _i}"
+            _messages.append(TimingMessage(
+                _name, _dev.message_id,
+                _entry["dlc"] if "dlc" in _entry else 8,
+                _entry["period_ms"],
+                _entry["jitter_ms"] if "jitter_ms" in _entry else 0,
+                _entry["deadline_ms"] if "deadline_ms" in _entry else None,
+                _entry["extended"] if "extended" in _entry else True))
+    return _messages
+
+
+def utilization(messages: list, bitrate: int = 1000000) -> float:
+    """Worst-case fraction of the bus used by the message set."""
+    _tbit_ms = 1000 / bitrate
+    return sum(frame_bits_worst_case(_m.dlc, _m.extended) * _tbit_ms /
+               _m.period_ms for _m in messages)
+
+
+def analyze(messages: list, bitrate: int = 1000000) -> float:
+    """Computes frame_us and the worst-case response_us of every message
+    (None if unbounded, the bus is overloaded). Returns the bus
+    utilization."""
+    _tbit = 1e6 / bitrate
+    for _m in messages:
+        _m.frame_us = frame_bits_worst_case(_m.dlc, _m.extended) * _tbit
+    _ordered = sorted(messages, key=lambda _m: _m.message_id)
+    _ids = [_m.message_id for _m in _ordered]
+    if len(set(_ids)) != len(_ids):
+        raise ValueError("two messages share an ID, arbitration would fail")
+    _u = utilization(messages, bitrate)
+
+    for _index, _m in enumerate(_ordered):
+        _higher = _ordered[:_index]
+        # A lower priority frame already on the bus can't be preempted
+        _blocking = max([_k.frame_us for _k in _ordered[_index + 1:]],
+                        default=0.0)
+        _m.response_us = None
+        if sum(_k.frame_us / (_k.period_ms * 1000)
+               for _k in _higher + [_m]) >= 1:
+            continue
+        # Level-m busy period
+        _t = _blocking + _m.frame_us
+        while True:
+            _next = _blocking + sum(
+                math.ceil((_t + _k.jitter_ms * 1000) /
+                          (_k.period_ms * 1000)) * _k.frame_us
+                for _k in _higher + [_m])
+            if _next <= _t:
+                break
+            _t = _next
+        _instances = math.ceil((_t + _m.jitter_ms * 1000) /
+                               (_m.period_ms * 1000))
+        _worst = 0.0
+        for _q in range(_instances):
+            _w = _blocking + _q * _m.frame_us
+            while True:
+                _next = _blocking + _q * _m.frame_us + sum(
+                    math.ceil((_w + _k.jitter_ms * 1000 + _tbit) /
+                              (_k.period_ms * 1000)) * _k.frame_us
+                    for _k in _higher)
+                if _next <= _w:
+                    break
+                _w = _next
+            _r = (_m.jitter_ms * 1000 + _w - _q * _m.period_ms * 1000 +
+                  _m.frame_us)
+            _worst = max(_worst, _r)
+        _m.response_us = _worst
+    return _u
+
+
+def suggest_ids(messages: list, bitrate: int = 1000000) -> list:
+    """Suggests new IDs for team-use messages so the ones with the
+    shortest deadlines get the best priority. The team-use IDs of each
+    device type are handed out again in deadline order (deadline
+    monotonic), which keeps the set of IDs on the bus the same. A team-use
+    message that still misses its deadline is moved to the lowest free api
+    of its device type and number. Returns a list of (message, suggested)
+    where suggested is a copy with the new ID, analyzed with the other
+    suggestions applied; messages is not changed."""
+    _trial = [_m.copy() for _m in messages]
+    _groups = {}
+    for _m in _trial:
+        if _m.team_use:
+            _key = _m.message_id >> FRCCANDevice.MANUF_LSB
+            _groups.setdefault(_key, []).append(_m)
+    for _group in _groups.values():
+        _slots = sorted(_m.message_id for _m in _group)
+        _group.sort(key=lambda _m: (_m.deadline_ms, _m.message_id))
+        for _m, _slot in zip(_group, _slots):
+            _m.message_id = _slot
+    analyze(_trial, bitrate)
+
+    _used = set(_m.message_id for _m in _trial)
+    for _m in _trial:
+        if not (_m.missed and _m.team_use):
+            continue
+        _dev = FRCCANDevice(message_id=_m.message_id)
+        for _api in range(_dev.api):
+            _dev.api = _api
+            if _dev.message_id not in _used:
+                _used.discard(_m.message_id)
+                _m.message_id = _dev.message_id
+                _used.add(_m.message_id)
+                break
+    analyze(_trial, bitrate)
+    return [(_m, _t) for _m, _t in zip(messages, _trial)
+            if _m.message_id != _t.message_id]
+
+
+def sensor_headroom(messages: list, dlc: int, period_ms: float,
+                    bitrate: int = 1000000, limit: int = 63) -> int:
+    """How many more team-use sensors sending dlc bytes every period_ms
+    fit before a message that meets its deadline now (or a new sensor)
+    misses it. New sensors use the miscellaneous device type, api 1 and
+    consecutive device numbers."""
+    _baseline = [_m.copy() for _m in messages]
+    analyze(_baseline, bitrate)
+    _already_missed = set(_m.message_id for _m in _baseline if _m.missed)
+    _added = []
+    for _n in range(limit):
+        _dev = FRCCANDevice(
+            device_type=FRCCANDevice.DEVICE_TYPE_MISCELLANEOUS,
+            manufacturer=FRCCANDevice.MANUF_TEAM_USE, api=1,
+            device_number=_n + 1)
+        while _dev.message_id in [_m.message_id for _m in messages]:
+            _dev.api = _dev.api + 1
+        _added.append(TimingMessage(f"sensor #{_n + 1}", _dev.message_id,
+                                    dlc, period_ms))
+        _trial = [_m.copy() for _m in messages] + _added
+        if utilization(_trial, bitrate) >= 1:
+            return _n
+        analyze(_trial, bitrate)
+        if any(_m.missed and _m.message_id not in _already_missed
+               for _m in _trial):
+            return _n
+    return limit
+
+
+def report(messages: list, bitrate: int = 1000000) -> str:
+    _u = analyze(messages, bitrate)
+    _lines = [f"bus utilization (worst-case stuffing): {_u * 100:.1f}%"
+              f" at {bitrate} bit/s",
+              f"{'message':32s} {'id':>10s} {'dlc':>3s} {'C us':>7s}"
+              f" {'T ms':>7s} {'J ms':>6s} {'D ms':>7s} {'R us':>9s}"]
+    for _m in sorted(messages, key=lambda _m: _m.message_id):
+        _r = "unbounded" if _m.response_us is None \
+            else f"{_m.response_us:9.1f}"
+        _flag = "  MISS" if _m.missed else ""
+        _lines.append(f"{_m.name[:32]:32s} {_m.message_id:#010x}"
+                      f" {_m.dlc:3d} {_m.frame_us:7.1f} {_m.period_ms:7.2f}"
+                      f" {_m.jitter_ms:6.2f} {_m.deadline_ms:7.2f}"
+                      f" {_r:>9s}{_flag}")
+    _missed = [_m for _m in messages if _m.missed]
+    _lines.append(f"{len(_missed)} of {len(messages)} messages can miss"
+                  " their deadline")
+    for _m, _suggested in suggest_ids(messages, bitrate):
+        _still = ", still misses" if _suggested.missed else ""
+        _lines.append(f"suggest: {_m} -> {_suggested} (R"
+                      f" {_suggested.response_us:.1f} us{_still})")
+    return "\n".join(_lines)
+
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    _parser.add_argument("messages", help="JSON message set")
+    _parser.add_argument("--bitrate", type=int, default=1000000)
+    _parser.add_argument("--add-sensor", metavar="DLC,PERIOD_MS",
+                         help="report how many more such sensors fit")
+    _args = _parser.parse_args()
+
+    _messages = [heartbeat_message()] + load_messages(_args.messages)
+    print(report(_messages, _args.bitrate))
+    if _args.add_sensor:
+        _dlc, _period = _args.add_sensor.split(",")
+        _n = sensor_headroom(_messages, int(_dlc), float(_period),
+                             _args.bitrate)
+        print(f"{_n} more {_dlc} byte sensors at {_period} ms fit")
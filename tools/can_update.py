@@ -0,0 +1,301 @@
+"""Sends a file to one device, or to a group of identical devices at once,
+over CAN (see firmware_update.py for the protocol and the device side).
+
+Run from the repository root on a SocketCAN host:
+
+    python -m tools.can_update code.py --device 3 [--path code.py]
+    python -m tools.can_update code.py --group 63 --device 3 4 5
+"""
+
+import argparse
+import struct
+import time
+from binascii import crc32
+
+from firmware_update import API_ABORT, API_BLOCK_END, API_DATA
+from firmware_update import API_FINISH, API_PATH, API_START, API_STATUS
+from firmware_update import BLOCK_END_FORMAT, BLOCK_SIZE, ERROR_SIZE
+from firmware_update import MAX_PATH, START_FORMAT, STATE_DONE, STATE_ERROR
+from firmware_update import STATE_RECEIVING, STATUS_FORMAT, update_id
+from publish_policy import frame_bits
+
+from backends.virtual_can import Message
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+PHASE_START = "start"
+PHASE_SEND = "send"
+PHASE_FINISH = "finish"
+PHASE_DONE = "done"
+PHASE_FAILED = "failed"
+
+
+def _clock_ms() -> int:
+    return time.monotonic_ns() // 1000000
+
+
+class UpdateSender:
+    def __init__(self, can, listener, path: str, data: bytes,
+                 devices: list, group: int = None, window: int = 8,
+                 block_size: int = BLOCK_SIZE, timeout_ms: int = 250,
+                 retries: int = 20, clock_ms=None) -> None:
+        """Sends data to path on the devices.
+
+        Args:
+            can: canio-like CAN to send on.
+            listener: listener receiving the STATUS frames, non-blocking or
+                with a short timeout.
+            path (str): file path on the devices.
+            data (bytes): file contents.
+            devices (list): device numbers of the receivers.
+            group (int): group device number the receivers share, to send
+                each block once for all of them. None sends to the single
+                device.
+            window (int): blocks in flight before an acknowledgment.
+            block_size (int): must match the receivers'.
+            timeout_ms (int): time without a STATUS before resending.
+            retries (int): timeouts in a row before giving up.
+            clock_ms (function): time source, defaults to
+                time.monotonic_ns() in ms.
+        """
+        if group is None and len(devices) != 1:
+            raise ValueError("several devices need a group number")
+        self.path = path.encode()
+        if len(self.path) > MAX_PATH:
+            raise ValueError(f"path longer than {MAX_PATH} bytes")
+        self.can = can
+        self.listener = listener
+        self.data = data
+        self.devices = list(devices)
+        self.window = window
+        self.block_size = block_size
+        self.timeout_ms = timeout_ms
+        self.retries = retries
+        self._clock_ms = clock_ms if clock_ms else _clock_ms
+        self._number = group if group is not None else devices[0]
+        self._ids = {}
+        for _api in (API_PATH, API_START, API_DATA, API_BLOCK_END,
+                     API_FINISH, API_ABORT):
+            self._ids[_api] = update_id(_api, self._number)
+        self._status_ids = {update_id(API_STATUS, _device): _device
+                            for _device in devices}
+        self._file_info = struct.pack(START_FORMAT, len(data), crc32(data))
+        self.blocks = (len(data) + block_size - 1) // block_size
+
+        self.phase = None
+        self.error = None
+        # Next block each device wants, once it answered START
+        self.acked = {}
+        self._done = set()
+        self._next = 0
+        self._frame = 0
+        self._rewind = None
+        self._epoch = 0
+        self._last_progress = 0
+        self._timeouts = 0
+        self.resumed_from = None
+
+        self.frames = 0
+        self.bits = 0
+        self.data_bits = 0
+        self.blocks_sent = 0
+        self.rewinds = 0
+        self._start_ms = 0
+        self.elapsed_ms = 0
+
+    def _send(self, api: int, data: bytes) -> bool:
+        try:
+            self.can.send(Message(self._ids[api], data, extended=True))
+        except OSError:
+            # The interface queue is full, try again on the next poll
+            return False
+        self.frames += 1
+        self.bits += frame_bits(len(data))
+        if api == API_DATA:
+            self.data_bits += 8 * len(data)
+        return True
+
+    def start(self) -> None:
+        """Sends the path and START, the devices answer with the block
+        they want first (non-zero when resuming)."""
+        self._start_ms = self._clock_ms()
+        self._last_progress = self._start_ms
+        self.phase = PHASE_START
+        self.acked = {}
+        self._send_start()
+
+    def _send_start(self) -> None:
+        for _i in range(0, max(1, len(self.path)), 7):
+            self._send(API_PATH, bytes([_i // 7]) + self.path[_i:_i + 7])
+        self._send(API_START, self._file_info)
+
+    def abort(self) -> None:
+        self._send(API_ABORT, b"")
+        self.phase = PHASE_FAILED
+        self.error = "aborted"
+
+    def _base(self) -> int:
+        return min(self.acked[_device] for _device in self.devices)
+
+    def _status(self, device: int, data) -> None:
+        _state, _error, _next, _seen, _epoch = struct.unpack(STATUS_FORMAT,
+                                                             data)
+        self._last_progress = self._clock_ms()
+        self._timeouts = 0
+        if _state == STATE_ERROR:
+            self.phase = PHASE_FAILED
+            self.error = f"device {device}: error {_error}"
+            return
+        if self.phase == PHASE_START:
+            if _state == STATE_RECEIVING:
+                self.acked[device] = _next
+                if len(self.acked) == len(self.devices):
+                    self._next = self._base()
+                    self.resumed_from = self._next
+                    self._frame = 0
+                    self.phase = PHASE_SEND
+            return
+        if self.phase == PHASE_SEND:
+            self.acked[device] = _next
+            if _seen >= _next and _epoch == self._epoch and \
+                    _next < self._next:
+                # Block _seen was rejected, go back (once per loss)
+                self._go_back(_next)
+            return
+        if self.phase == PHASE_FINISH:
+            if _state == STATE_DONE:
+                self._done.add(device)
+                if len(self._done) == len(self.devices):
+                    self.phase = PHASE_DONE
+                    self.elapsed_ms = self._clock_ms() - self._start_ms
+            elif _error == ERROR_SIZE:
+                self.acked[device] = _next
+                self.phase = PHASE_SEND
+                self._go_back(_next)
+
+    def _go_back(self, block: int) -> None:
+        self._epoch = (self._epoch + 1) & 0xff
+        self.rewinds += 1
+        if self._rewind is None or block < self._rewind:
+            self._rewind = block
+
+    def _send_blocks(self) -> None:
+        while True:
+            if self._frame == 0:
+                # Rewind only between blocks, a block is sent whole
+                if self._rewind is not None:
+                    self._next = min(self._next, self._rewind)
+                    self._rewind = None
+                if self._next >= self.blocks or \
+                        self._next >= self._base() + self.window:
+                    return
+            _offset = self._next * self.block_size
+            _block = self.data[_offset:_offset + self.block_size]
+            while self._frame * 8 < len(_block):
+                _i = self._frame * 8
+                if not self._send(API_DATA, _block[_i:_i + 8]):
+                    return
+                self._frame += 1
+            if not self._send(API_BLOCK_END, struct.pack(
+                    BLOCK_END_FORMAT, self._next, self._epoch,
+                    crc32(_block))):
+                return
+            self._frame = 0
+            self._next += 1
+            self.blocks_sent += 1
+
+    def _timeout(self) -> None:
+        self._timeouts += 1
+        self._last_progress = self._clock_ms()
+        if self._timeouts > self.retries:
+            self.error = f"timed out in {self.phase}"
+            self.phase = PHASE_FAILED
+            return
+        if self.phase == PHASE_START:
+            self._send_start()
+        elif self.phase == PHASE_SEND:
+            # The acknowledgments stopped, resend from the oldest block
+            # not acknowledged
+            self._go_back(self._base())
+        elif self.phase == PHASE_FINISH:
+            self._send(API_FINISH, self._file_info)
+
+    def poll(self) -> bool:
+        """Handles the STATUS frames waiting and sends what the window
+        allows. Returns False once the transfer is over (see phase)."""
+        _message = self.listener.receive()
+        while _message is not None:
+            if isinstance(_message, Message) and \
+                    _message.id in self._status_ids:
+                self._status(self._status_ids[_message.id], _message.data)
+            _message = self.listener.receive()
+        if self.phase in (PHASE_DONE, PHASE_FAILED):
+            return False
+        if self.phase == PHASE_SEND:
+            if self._base() >= self.blocks and self._frame == 0:
+                self.phase = PHASE_FINISH
+                self._send(API_FINISH, self._file_info)
+            else:
+                self._send_blocks()
+        if self._clock_ms() - self._last_progress > self.timeout_ms:
+            self._timeout()
+        return self.phase not in (PHASE_DONE, PHASE_FAILED)
+
+    def stats(self) -> dict:
+        """Transfer statistics; efficiency is the data bits over the bits
+        of every frame the host sent (8 byte extended frames top out at
+        64 / 131)."""
+        return {
+            "phase": self.phase,
+            "bytes": len(self.data),
+            "blocks": self.blocks,
+            "blocks_sent": self.blocks_sent,
+            "resumed_from": self.resumed_from,
+            "rewinds": self.rewinds,
+            "frames": self.frames,
+            "efficiency": self.data_bits / self.bits if self.bits else 0,
+            "elapsed_ms": self.elapsed_ms,
+        }
+
+
+def send_file(can, listener, path: str, data: bytes, devices: list,
+              **kwargs) -> UpdateSender:
+    """Runs a whole transfer, returns the UpdateSender (see phase)."""
+    _sender = UpdateSender(can, listener, path, data, devices, **kwargs)
+    _sender.start()
+    while _sender.poll():
+        pass
+    return _sender
+
+
+if __name__ == "__main__":
+    from backends.socketcan import CAN
+
+    _parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    _parser.add_argument("file")
+    _parser.add_argument("--path", help="path on the device, defaults to"
+                         " the file name")
+    _parser.add_argument("--device", type=int, nargs="+", required=True,
+                         help="update device number(s) of the receivers")
+    _parser.add_argument("--group", type=int, default=None,
+                         help="group device number for several devices")
+    _parser.add_argument("--channel", default="can0")
+    _parser.add_argument("--window", type=int, default=8)
+    _args = _parser.parse_args()
+
+    with open(_args.file, "rb") as _fd:
+        _data = _fd.read()
+    _path = _args.path if _args.path else _args.file.split("/")[-1]
+    with CAN(_args.channel) as _can:
+        _listener = _can.listen(timeout=0.001)
+        _sender = send_file(_can, _listener, _path, _data, _args.device,
+                            group=_args.group, window=_args.window)
+    _stats = _sender.stats()
+    print(f"{_stats['phase']}: {_stats['bytes']} bytes to"
+          f" {len(_args.device)} device(s) in {_stats['elapsed_ms']} ms,"
+          f" resumed from block {_stats['resumed_from']},"
+          f" {_stats['rewinds']} rewinds,"
+          f" {_stats['efficiency'] * 100:.0f}% of the bits sent were data")
+    if _sender.phase != PHASE_DONE:
+        raise SystemExit(f"ERROR: {_sender.error}")
@@ -0,0 +1,125 @@
+"""Precompiles the library into .mpy files for a CIRCUITPY drive.
+
+A board importing .py files compiles them at every boot, which costs time
+and heap; a .mpy is loaded as is. The library modules, listed in
+LIBRARY_MODULES, are compiled with mpy-cross into the same layout under
+the output directory. Host-only code (the benchmarks, the UDP bridge and
+the SocketCAN backend and carrier board) and the tests are not part of the
+library; a new module has to be added to the list to be shipped. The
+FRCCANDevice decode tables are constant tuples, stored in the .mpy as
+single objects.
+
+The build is reproducible: files are compiled in a fixed order with their
+repository relative paths, and MANIFEST.txt lists the mpy-cross version and
+the SHA-256 of every output so two builds can be compared. The .mpy format
+must match the firmware: use the mpy-cross of the CircuitPython release on
+the board (--mpy-cross), the MicroPython one only for the unix port.
+
+Run from the repository root:
+
+    python -m tools.mpy_build [--out build/mpy] [--mpy-cross mpy-cross]
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+
+__version__ = "0.0.0-auto.0"
+__repo__ = "https://github.com/2468shrm/frc_can.git"
+
+# The modules copied to a board, in build order
+LIBRARY_MODULES = (
+    "can_handler.py",
+    "can_isotp.py",
+    "can_logger.py",
+    "can_trace.py",
+    "device_identity.py",
+    "firmware_update.py",
+    "heap_monitor.py",
+    "io_breakout.py",
+    "pixel_animator.py",
+    "publish_policy.py",
+    "signal_filters.py",
+    "ids/heartbeat.py",
+    "ids/msg_format.py",
+    "ids/payload_format.py",
+    "backends/messages.py",
+    "backends/virtual_can.py",
+    "carrier_board/i2c_mux_scheduler.py",
+    "carrier_board/io_sample.py",
+    "carrier_board/m4_feather_can.py",
+    "carrier_board/pca9685_batch.py",
+    "carrier_board/raspberry_pi_pico_w.py",
+)
+
+MANIFEST = "MANIFEST.txt"
+
+
+def sources(root: str = ".") -> list:
+    """The library modules, paths relative to root, in build order.
+
+    Raises:
+        FileNotFoundError: if a listed module is missing.
+    """
+    for _source in LIBRARY_MODULES:
+        if not os.path.exists(os.path.join(root, _source)):
+            raise FileNotFoundError(f"library module {_source} not found")
+    return list(LIBRARY_MODULES)
+
+
+def find_mpy_cross(mpy_cross: str = "mpy-cross") -> str:
+    """Path of the mpy-cross executable, None if it is not installed."""
+    return shutil.which(mpy_cross)
+
+
+def build(out: str, root: str = ".", mpy_cross: str = "mpy-cross") -> list:
+    """Compiles the library into out.
+
+    Returns:
+        list: the .mpy paths written, relative to out.
+    Raises:
+        FileNotFoundError: if mpy-cross is not installed.
+        RuntimeError: if a module does not compile.
+    """
+    _mpy_cross = find_mpy_cross(mpy_cross)
+    if _mpy_cross is None:
+        raise FileNotFoundError(f"{mpy_cross} not found, pip install"
+                                f" mpy-cross or use CircuitPython's")
+    _out = os.path.abspath(out)
+    _version = subprocess.run([_mpy_cross, "--version"], capture_output=True,
+                              text=True).stdout.strip()
+    _manifest = [f"# {_version}"]
+    _written = []
+    for _source in sources(root):
+        _target = _source[:-len(".py")] + ".mpy"
+        _path = os.path.join(_out, _target)
+        os.makedirs(os.path.dirname(_path), exist_ok=True)
+        # Relative paths, so no build directory ends up in the output
+        _result = subprocess.run([_mpy_cross, "-o", _path, _source],
+                                 cwd=root, capture_output=True, text=True)
+        if _result.returncode != 0:
+            raise RuntimeError(f"{_source}: {_result.stderr.strip()}")
+        with open(_path, "rb") as _fd:
+            _manifest.append(
+                f"{hashlib.sha256(_fd.read()).hexdigest()} {_target}")
+        _written.append(_target)
+    with open(os.path.join(_out, MANIFEST), "w") as _fd:
+        _fd.write("\n".join(_manifest) + "\n")
+    return _written
+
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    _parser.add_argument("--out", default=os.path.join("build", "mpy"))
+    _parser.add_argument("--mpy-cross", default="mpy-cross",
+                         help="mpy-cross executable matching the firmware")
+    _args = _parser.parse_args()
+
+    try:
+        _written = build(_args.out, mpy_cross=_args.mpy_cross)
+    except (FileNotFoundError, RuntimeError) as _error:
+        print(f"ERROR: {_error}")
+        raise SystemExit(1)
+    print(f"{len(_written)} modules compiled into {_args.out}")